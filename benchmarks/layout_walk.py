@@ -0,0 +1,123 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+"""Micro-benchmark of the layout walk done for each page extracted from a PDF.
+
+A dense synthetic page is laid out once by pdfminer. Then, gathering its textboxes along with the
+count and summed height of their chars is timed with :func:`core.pdf.walk_textboxes` and with the
+recursive ``extract_from_elem()`` it replaced, which ran once to find textboxes and once more per
+textbox to find chars.
+
+Usage, from the root of the repository: python -m benchmarks.layout_walk [--boxes N] [--lines N]
+[--repeat N]. The script can also be run directly: python benchmarks/layout_walk.py
+"""
+
+import sys
+import os.path as op
+import random
+from io import BytesIO
+from argparse import ArgumentParser
+from timeit import repeat
+
+from pdfminer.layout import LTChar, LTTextBoxHorizontal
+
+if not __package__:
+    # We're run as a script, so our packages aren't in our path yet.
+    sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+from core.pdf import open_document, create_interpreter, walk_textboxes
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit']
+
+def dense_page_pdf(boxcount, linecount, seed=0):
+    """Returns the contents of a one-page PDF with ``boxcount`` paragraphs of ``linecount`` lines.
+    """
+    rng = random.Random(seed)
+    columns = 4
+    rows = (boxcount + columns - 1) // columns
+    row_height = 760 / rows
+    # Leave enough space between paragraphs for pdfminer not to merge them
+    fontsize = max(2, min(8, row_height / (linecount + 4)))
+    commands = []
+    for index in range(boxcount):
+        x = 20 + (index % columns) * 148
+        y = 780 - (index // columns) * row_height
+        commands.append("BT /F1 %.1f Tf %.1f TL %d %.1f Td" % (fontsize, fontsize, x, y))
+        for _ in range(linecount):
+            words = ' '.join(rng.choice(WORDS) for _ in range(4))
+            commands.append("(%s) Tj T*" % words)
+        commands.append("ET")
+    content = '\n'.join(commands).encode('ascii')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    result = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(result))
+        result += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref_offset = len(result)
+    result += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        result += b"%010d 00000 n \n" % offset
+    result += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref_offset)
+    return bytes(result)
+
+def layout_page(pdfdata):
+    doc = open_document(BytesIO(pdfdata))
+    interpreter, device = create_interpreter()
+    [page] = list(doc.get_pages())
+    interpreter.process_page(page)
+    return device.get_result()
+
+#--- The implementation walk_textboxes() replaced
+def extract_from_elem(elem, lookfor):
+    if isinstance(elem, lookfor):
+        return [elem]
+    else:
+        try:
+            return sum((extract_from_elem(subelem, lookfor) for subelem in elem), [])
+        except TypeError:
+            return []
+
+def recursive_textboxes(layout):
+    result = []
+    for box in extract_from_elem(layout, LTTextBoxHorizontal):
+        chars = extract_from_elem(box, LTChar)
+        result.append((box, len(chars), sum(c.height for c in chars)))
+    return result
+
+#--- Main
+def main(args=None):
+    parser = ArgumentParser(description="Times the layout walk of a dense synthetic page.")
+    parser.add_argument('--boxes', type=int, default=40, help="Paragraphs on the page")
+    parser.add_argument('--lines', type=int, default=30, help="Lines per paragraph")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing runs (the best is kept)")
+    options = parser.parse_args(args)
+    layout = layout_page(dense_page_pdf(options.boxes, options.lines))
+    expected = recursive_textboxes(layout)
+    if walk_textboxes(layout) != expected:
+        print("walk_textboxes() and the recursive walk disagree!")
+        return 1
+    charcount = sum(count for _, count, _ in expected)
+    print("{} textboxes, {} chars".format(len(expected), charcount))
+    timings = {}
+    for name, func in [('recursive', recursive_textboxes), ('walk_textboxes', walk_textboxes)]:
+        timings[name] = min(repeat(lambda: func(layout), number=1, repeat=options.repeat))
+        print("{:<16}{:8.2f} ms".format(name, timings[name] * 1000))
+    print("speed-up: {:.1f}x".format(timings['recursive'] / timings['walk_textboxes']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
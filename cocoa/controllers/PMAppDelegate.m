@@ -28,6 +28,9 @@ http://www.hardcoded.net/licenses/gplv3_license
     [self setUpdater:[[[SUUpdater alloc] init] autorelease]];
     [self setMainWindow:[[[PMMainWindow alloc] initWithAppDelegate:self] autorelease]];
     aboutBox = nil; // Lazily loaded
+    /* Pages read in the background are integrated in the model on each pulse. */
+    [NSTimer scheduledTimerWithTimeInterval:0.5 target:self selector:@selector(pulse) userInfo:nil
+        repeats:YES];
     
     return self;
 }
@@ -38,6 +41,11 @@ http://www.hardcoded.net/licenses/gplv3_license
     [super dealloc];
 }
 
+- (void)pulse
+{
+    [[self model] pulse];
+}
+
 - (void)openWebsite
 {
     [[NSWorkspace sharedWorkspace] openURL:[NSURL URLWithString:@"http://www.hardcoded.net/pdfmasher/"]];
@@ -59,6 +67,13 @@ http://www.hardcoded.net/licenses/gplv3_license
     [[aboutBox window] makeKeyAndOrderFront:nil];
 }
 
+/* Delegate */
+- (void)applicationWillTerminate:(NSNotification *)aNotification
+{
+    /* Journaled changes are saved and the project database is closed. */
+    [[self model] appWillTerminate];
+}
+
 /* Python --> Cocoa */
 - (void)showMessage:(NSString *)msg
 {
@@ -39,4 +39,6 @@ http://www.hardcoded.net/licenses/gplv3_license
 
 - (id)initWithAppDelegate:(PMAppDelegate *)aAppDelegate;
 - (void)loadPDF;
+- (void)undo:(id)sender;
+- (void)redo:(id)sender;
 @end
\ No newline at end of file
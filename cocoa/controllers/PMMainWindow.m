@@ -46,6 +46,12 @@ http://www.hardcoded.net/licenses/gplv3_license
     [topTabView addTabViewItem:item];
     [item release];
     
+    /* We insert ourselves in the responder chain between the content view and the window so that
+       undo: and redo: reach us before the window sends them to its own undo manager. */
+    NSView *contentView = [[self window] contentView];
+    [self setNextResponder:[contentView nextResponder]];
+    [contentView setNextResponder:self];
+    
     [[NSNotificationCenter defaultCenter] addObserver:self selector:@selector(jobStarted:) name:JobStarted object:nil];
     [[NSNotificationCenter defaultCenter] addObserver:self selector:@selector(jobInProgress:) name:JobInProgress object:nil];
     
@@ -67,6 +73,50 @@ http://www.hardcoded.net/licenses/gplv3_license
     [app loadPDF];
 }
 
+/* Element changes have their own undo history in the model. We only use it when no text view has
+   the focus, otherwise cmd+z undoes the typing, as usual. */
+- (BOOL)textViewHasFocus
+{
+    return [[[self window] firstResponder] isKindOfClass:[NSTextView class]];
+}
+
+- (void)undo:(id)sender
+{
+    if ([self textViewHasFocus]) {
+        [[[self window] undoManager] undo];
+    }
+    else {
+        [app undo];
+    }
+}
+
+- (void)redo:(id)sender
+{
+    if ([self textViewHasFocus]) {
+        [[[self window] undoManager] redo];
+    }
+    else {
+        [app redo];
+    }
+}
+
+- (BOOL)validateMenuItem:(NSMenuItem *)aItem
+{
+    if ([aItem action] == @selector(undo:)) {
+        if ([self textViewHasFocus]) {
+            return [[[self window] undoManager] canUndo];
+        }
+        return [app canUndo];
+    }
+    if ([aItem action] == @selector(redo:)) {
+        if ([self textViewHasFocus]) {
+            return [[[self window] undoManager] canRedo];
+        }
+        return [app canRedo];
+    }
+    return YES;
+}
+
 /* Notifications */
 - (void)jobInProgress:(NSNotification *)aNotification
 {
@@ -48,12 +48,36 @@ class PyPdfMasher(PyBaseApp):
     def editPane(self) -> pyref:
         return self.model.edit_pane
     
+    def applyRuleFile(self):
+        self.model.apply_rule_file()
+    
     def buildHtml(self):
         return self.model.build_html()
     
     def changeStateOfSelected_(self, newstate: str):
         self.model.change_state_of_selected(newstate)
     
+    def ignoreHeadersAndFooters(self):
+        self.model.ignore_headers_and_footers()
+    
+    def orderElementsAutomatically(self):
+        self.model.order_elements_automatically()
+    
+    def revertAutomaticOrder(self):
+        self.model.revert_automatic_order()
+    
+    def undo(self):
+        self.model.undo()
+    
+    def redo(self):
+        self.model.redo()
+    
+    def canUndo(self) -> bool:
+        return self.model.can_undo
+    
+    def canRedo(self) -> bool:
+        return self.model.can_redo
+    
     def loadPDF(self):
         self.model.load_pdf()
     
@@ -63,6 +87,18 @@ class PyPdfMasher(PyBaseApp):
     def saveProject(self):
         self.model.save_project()
     
+    def refreshPDF(self):
+        self.model.refresh_pdf()
+    
+    def toggleWatchPDF(self):
+        self.model.watch_pdf = not self.model.watch_pdf
+    
+    def pulse(self):
+        self.model.pulse()
+    
+    def appWillTerminate(self):
+        self.model.close()
+    
     def hideIgnored(self) -> bool:
         return self.model.hide_ignored
     
@@ -24,10 +24,22 @@ fileMenu.addItem("Load Project", Action(owner.model, 'loadProject'), 'cmd+shift+
 fileMenu.addItem("Save Project", Action(owner.model, 'saveProject'), 'cmd+s')
 fileMenu.addItem("Close", Action(None, 'performClose:'), 'cmd+w')
 
+editMenu.addItem("Undo", Action(None, 'undo:'), 'cmd+z')
+editMenu.addItem("Redo", Action(None, 'redo:'), 'cmd+shift+z')
+editMenu.addSeparator()
 editMenu.addItem("Cut", Action(None, 'cut:'), 'cmd+x')
 editMenu.addItem("Copy", Action(None, 'copy:'), 'cmd+c')
 editMenu.addItem("Paste", Action(None, 'paste:'), 'cmd+v')
 editMenu.addItem("Select All", Action(None, 'selectAll:'), 'cmd+a')
+editMenu.addSeparator()
+editMenu.addItem("Ignore Headers and Footers", Action(owner.model, 'ignoreHeadersAndFooters'),
+    'cmd+shift+i')
+editMenu.addItem("Refresh PDF", Action(owner.model, 'refreshPDF'), 'cmd+r')
+editMenu.addItem("Watch PDF for Changes", Action(owner.model, 'toggleWatchPDF'))
+editMenu.addItem("Apply Rule File...", Action(owner.model, 'applyRuleFile'))
+editMenu.addItem("Order Elements Automatically", Action(owner.model, 'orderElementsAutomatically'),
+    'cmd+shift+r')
+editMenu.addItem("Revert Automatic Order", Action(owner.model, 'revertAutomaticOrder'))
 
 windowMenu.addItem("Minimize", Action(None, 'performMinimize:'), 'cmd+m')
 windowMenu.addItem("Zoom", Action(None, 'performZoom:'))
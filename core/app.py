@@ -6,15 +6,40 @@
 # which should be included with this package. The terms are also available at
 # http://www.hardcoded.net/licenses/gplv3_license
 
+import os
+import os.path as op
+import time
+import logging
+from array import array
+from copy import copy
+from operator import attrgetter
+from sqlite3 import DatabaseError
 from xml.etree import ElementTree as ET
 from pdfminer.pdfparser import PDFSyntaxError
+from jobprogress.job import JobCancelled
 
 from hscommon.notify import Broadcaster
-from hscommon.geometry import Rect
 from hscommon.trans import tr
+from hscommon.desktop import special_folder_path, SpecialFolder
+from hscommon.util import first
 
-from .const import ElementState
-from .pdf import extract_text_elements_from_pdf, Page, TextElement
+from .const import ElementState, ExtractionProfile
+from .pdf import (iter_text_elements_from_pdf, iter_text_elements_from_pages, read_pages, Page,
+    open_document, content_fingerprint, page_size)
+from .cache import ExtractionCache, ExtractionCheckpoint
+from .report import ExtractionReport
+from .loader import BackgroundLoader, PageQueue
+from .store import ElementStore, STATES, STATE2CODE
+from .stats import DocumentStats
+from .classify import find_repeated_elements, min_repeated_pages
+from .order import compute_document_order
+from .rules import apply_rules, load_rules
+from .refresh import map_unchanged_pages, rebuild_document
+from .project import (ProjectFormat, InvalidProjectError, load_project, save_project,
+    detect_project_format)
+from .database import DatabaseProject
+from .journal import ChangeJournal
+from .undo import ElementDelta, UndoHistory
 from . import __appname__
 from .gui.element_table import ElementTable
 from .gui.opened_file_label import OpenedFileLabel
@@ -22,12 +47,21 @@ from .gui.page_controller import PageController
 from .gui.build_pane import BuildPane
 from .gui.edit_pane import EditPane
 
+# Seconds between saves of a project with unsaved changes in its journal
+AUTOSAVE_INTERVAL = 60
+
 class JobType:
     LoadPDF = 'job_load_pdf'
+    OrderElements = 'job_order_elements'
+    RefreshPDF = 'job_refresh_pdf'
+    LoadProject = 'job_load_project'
 
 
 JOBID2TITLE = {
     JobType.LoadPDF: tr("Reading PDF"),
+    JobType.OrderElements: tr("Ordering elements"),
+    JobType.RefreshPDF: tr("Refreshing PDF"),
+    JobType.LoadProject: tr("Loading project"),
 }
 
 class App(Broadcaster):
@@ -49,8 +83,72 @@ class App(Broadcaster):
         self._hide_ignored = False
         self.selected_elements = set()
         self.pages = []
+        # Our elements live in a compact columnar store and self.elements holds views on them.
+        self.element_store = ElementStore()
         self.elements = []
+        # Statistics on self.elements. Whatever changes elements has to update it.
+        self.stats = DocumentStats()
+        # Elements that were added by the last 'elements_added' notification
+        self.added_elements = []
         self.last_file_was_invalid = False
+        # (path, pages, loader, page_queue, report) of the PDF read by our loading job, waiting to
+        # replace our document on the main thread
+        self._loaded_pdf = None
+        self._loader = None
+        self._page_queue = None
+        # When loading lazily, we only read page sizes up front. Pages are then laid out in the
+        # order in which they're visited (along with the `lazy_prefetch` pages following them) and
+        # the remaining pages are laid out in the background.
+        # This and the extraction settings below aren't exposed in the UI yet.
+        self.lazy_loading = False
+        self.lazy_prefetch = 3
+        # Number of processes pages are laid out with when loading a PDF. 1 means no worker pool.
+        self.extraction_processes = 1
+        # An ExtractionProfile. The fast profile trades some accuracy for a much faster extraction.
+        self.extraction_profile = ExtractionProfile.Accurate
+        cachedir = special_folder_path(SpecialFolder.Cache)
+        self.extraction_cache = ExtractionCache(op.join(cachedir, 'extraction'))
+        # When true, pages are regularly saved to a checkpoint file in `checkpoint_dir` during a PDF
+        # load so that an interrupted load can be resumed.
+        self.checkpoint_loads = False
+        self.checkpoint_dir = op.join(cachedir, 'checkpoints')
+        # ExtractionReport of the last PDF load. Pages read later on (lazily or through
+        # extract_pages()) are added to it.
+        self.last_load_report = None
+        # {element: order} computed by our ordering job, waiting to be applied on the main thread
+        self._computed_orders = None
+        # (store, orders) as they were before the last automatic ordering
+        self._order_backup = None
+        # A ProjectFormat. Projects in any format can be loaded. XML projects can be opened by
+        # any version of PdfMasher. The UI doesn't expose this setting.
+        self.project_format = ProjectFormat.XML
+        # When true, the PDF is refreshed whenever it's rewritten (checked on each pulse())
+        self.watch_pdf = False
+        # Modification time of current_path when it was last loaded or refreshed
+        self._pdf_mtime = None
+        # (pages, page_map, page2elements) computed by our refresh job
+        self._refresh_result = None
+        # Message to show if our refresh job couldn't read the PDF
+        self._refresh_error = None
+        # Modification time of current_path when our last refresh job started. When watching, we
+        # don't refresh the same version twice.
+        self._refresh_mtime = None
+        # (pdfpath, pages, store, project_format, project_db, journal) read by our project loading
+        # job
+        self._loaded_project = None
+        # DatabaseProject of the SQLite project we loaded or saved last. Changes to our elements
+        # are written to it as they happen.
+        self.project_db = None
+        # ChangeJournal of the XML or binary project we loaded or saved last, and the format of
+        # that project. Changes to our elements are recorded in the journal as they happen and the
+        # project is saved, in the background, every `autosave_interval` seconds.
+        self._journal = None
+        self._journal_format = None
+        self._last_autosave = None
+        self.autosave_interval = AUTOSAVE_INTERVAL
+        # Changes to our elements that can be undone. Its memory budget can be changed through
+        # undo_history.budget.
+        self.undo_history = UndoHistory()
 
         self.element_table = ElementTable(self)
         self.opened_file_label = OpenedFileLabel(self)
@@ -58,16 +156,230 @@ class App(Broadcaster):
         self.build_pane = BuildPane(self)
         self.edit_pane = EditPane(self)
 
+    #--- Private
+    def _integrate_loaded_pages(self):
+        # Adds pages that our background loader has finished reading to our document and puts
+        # the added elements in self.added_elements. Returns whether any page was added.
+        results = self._loader.pop_results()
+        added = []
+        replaced_placeholders = False
+        for pageno, (page, elements) in results:
+            if pageno < len(self.pages):
+                self.pages[pageno] = page
+                replaced_placeholders = True
+            else:
+                self.pages.append(page)
+            added += self.element_store.extend(elements)
+        self.elements += added
+        self.stats.add(added)
+        if self.project_db is not None:
+            replaced_pages = {pageno: page for pageno, (page, _) in results}
+            self.project_db.add_elements(replaced_pages, added)
+        elif self._journal is not None and added:
+            # The journal can't hold new elements, only the next save can.
+            self._journal.dirty = True
+        if replaced_placeholders:
+            # Placeholder pages can be read in any order, but we want our elements to stay in
+            # document order. The sort is stable, so orders within a page are kept.
+            self.elements.sort(key=attrgetter('page'))
+        self.added_elements = added
+        return bool(results)
+
+    def _create_queued_loader(self, path, page_queue, report):
+        profile = self.extraction_profile
+        iter_pages = lambda j: iter_text_elements_from_pages(path, page_queue, j, report=report,
+            profile=profile)
+        return BackgroundLoader(iter_pages)
+
+    def _start_queued_loader(self, path, page_queue):
+        self._page_queue = page_queue
+        self._loader = self._create_queued_loader(path, page_queue, self.last_load_report)
+        self._loader.start()
+
+    def _apply_refresh_result(self):
+        pages, page_map, page2elements = self._refresh_result
+        self._refresh_result = None
+        store, elements = rebuild_document(self.pages, self.elements, pages, page_map,
+            page2elements)
+        self.pages = pages
+        self.element_store = store
+        self.elements = elements
+        self.stats = DocumentStats(elements)
+        self.undo_history.clear()
+        self.selected_elements = set()
+        if self.project_db is not None:
+            self.project_db.write(self.current_path, pages, store)
+        elif self._journal is not None:
+            # Our journal's records refer to elements by their index, which changed.
+            self._save_journaled_project()
+        if self.page_controller.page_repr.pageno >= len(pages):
+            self.notify('file_opened')
+        self.notify('elements_changed')
+
+    def _apply_loaded_project(self):
+        pdfpath, pages, store, project_format, project_db, journal = self._loaded_project
+        self._loaded_project = None
+        self._stop_background_loading()
+        self._set_project_db(project_db)
+        self._set_journal(journal, project_format)
+        self.last_load_report = None
+        self.pages = pages
+        self.element_store = store
+        self.elements = list(store)
+        # Projects are saved in store order, in which elements of pages that were extracted after
+        # the others come last.
+        self.elements.sort(key=attrgetter('page'))
+        self.stats = DocumentStats(self.elements)
+        self.undo_history.clear()
+        self.selected_elements = set()
+        self.current_path = pdfpath
+        self._pdf_mtime = self._current_pdf_mtime()
+        self.notify('file_opened')
+        self.notify('elements_changed')
+
+    def _apply_loaded_pdf(self):
+        path, pages, loader, page_queue, report = self._loaded_pdf
+        self._loaded_pdf = None
+        self._stop_background_loading()
+        # Our elements won't come from our project anymore. Our previous project and journal are
+        # let go of before our loader is published so that no new page can end up in them.
+        self._set_project_db(None)
+        self._set_journal(None)
+        self.pages = pages
+        self.element_store = ElementStore()
+        self.elements = []
+        self.stats = DocumentStats()
+        self.undo_history.clear()
+        self.selected_elements = set()
+        self.current_path = path
+        self._pdf_mtime = self._current_pdf_mtime()
+        self.last_load_report = report
+        self._page_queue = page_queue
+        self._loader = loader
+        self._integrate_loaded_pages()
+        self.notify('file_opened')
+        self.notify('elements_changed')
+
+    def _current_pdf_mtime(self):
+        try:
+            return os.stat(self.current_path).st_mtime
+        except OSError:
+            return None
+
+    def _set_project_db(self, project_db):
+        if self.project_db is not None and self.project_db is not project_db:
+            self.project_db.close()
+        self.project_db = project_db
+
+    def _set_journal(self, journal, project_format=None):
+        # The changes recorded in our previous journal are saved in its project before we let go
+        # of it.
+        if self._journal is not None and self._journal is not journal:
+            if self._journal.dirty:
+                self._save_journaled_project()
+            self._journal.close()
+        self._journal = journal
+        self._journal_format = project_format
+        self._last_autosave = time.time()
+        if journal is not None:
+            journal.start()
+
+    def _save_journaled_project(self):
+        # Saves a copy of our document in the project of our journal, from the journal's thread.
+        path = self._journal.project_path
+        project_format = self._journal_format
+        pdfpath = self.current_path
+        pages = [copy(page) for page in self.pages]
+        store = self.element_store.copy()
+
+        def save():
+            if project_format == ProjectFormat.Binary:
+                # Don't save texts that were replaced since the store was loaded.
+                store.compact()
+            save_project(path, pdfpath, pages, list(store), project_format)
+
+        self._journal.compact(save)
+        self._last_autosave = time.time()
+
+    def _save_element_changes(self, elements, text_changed=False):
+        # Writes changes to ``elements`` to our project database or records them in our journal,
+        # if we have one. When ``text_changed`` is true, only the text of elements changed.
+        # Otherwise, it's their state, title level or order.
+        if not elements:
+            return
+        if self.project_db is not None:
+            self.project_db.update_elements(elements)
+        elif self._journal is not None:
+            if text_changed:
+                for element in elements:
+                    self._journal.record_text(element)
+            else:
+                self._journal.record_elements(elements)
+
+    def _begin_change(self, indexes, columns):
+        # Returns a delta to pass to _end_change() once the change to ``columns`` of the elements
+        # at ``indexes`` is made.
+        return ElementDelta(self.element_store, indexes, columns)
+
+    def _end_change(self, delta):
+        delta.finish()
+        self.undo_history.add(delta)
+
+    def _delta_applied(self, delta, undone):
+        # Brings our stats, project and views up to date after ``delta`` was undone or redone.
+        store = self.element_store
+        elements = [store[index] for index in delta.indexes]
+        previous_values = delta.new_values if undone else delta.old_values
+        if 'state' in delta.columns:
+            for element, code in zip(elements, previous_values('state')):
+                self.stats.change_state(element, STATES[code])
+        if 'text' in delta.columns:
+            for element, text in zip(elements, previous_values('text')):
+                self.stats.change_text(element, text)
+            self._save_element_changes(elements, text_changed=True)
+        else:
+            self._save_element_changes(elements)
+        self.notify('elements_changed')
+
+    def _stop_background_loading(self):
+        if self._loader is not None:
+            self._loader.cancel()
+            self._loader = None
+            self._page_queue = None
+
     #--- Protected
     def _job_completed(self, jobid):
         # Must be called by subclasses when they detect that an async job is completed.
         if jobid == JobType.LoadPDF:
-            if not self.last_file_was_invalid:
-                self.notify('file_opened')
-                self.opened_file_label.refresh()
+            if self._loaded_pdf is not None:
+                self._apply_loaded_pdf()
+            elif self.last_file_was_invalid:
+                self.view.show_message("This file is not a PDF.")
+        elif jobid == JobType.OrderElements:
+            if self._computed_orders:
+                store = self.element_store
+                self._order_backup = (store, array('l', store.order))
+                elements = list(self._computed_orders)
+                delta = self._begin_change([e.index for e in elements], ['order'])
+                for element, order in self._computed_orders.items():
+                    element.order = order
+                self._end_change(delta)
+                self._save_element_changes(elements)
                 self.notify('elements_changed')
+            self._computed_orders = None
+        elif jobid == JobType.LoadProject:
+            if self._loaded_project is not None:
+                self._apply_loaded_project()
             else:
-                self.view.show_message("This file is not a PDF.")
+                self.view.show_message("This file is not a valid PdfMasher project.")
+        elif jobid == JobType.RefreshPDF:
+            if self._refresh_result is not None:
+                self._pdf_mtime = self._refresh_mtime
+                self._apply_refresh_result()
+            elif self._refresh_error is not None and not self.watch_pdf:
+                # When watching, the PDF might still be being written. We'll try again when it
+                # changes.
+                self.view.show_message(self._refresh_error)
 
     #--- Public (Internal)
     def select_elements(self, elements):
@@ -76,6 +388,15 @@ class App(Broadcaster):
         self.selected_elements = elements
         self.notify('elements_selected')
 
+    def reorder_elements(self, elements):
+        """Gives ``elements`` orders following their position in the list.
+        """
+        delta = self._begin_change([e.index for e in elements], ['order'])
+        for order, element in enumerate(elements):
+            element.order = order
+        self._end_change(delta)
+        self._save_element_changes(elements)
+
     #--- Public (API)
     def open_path(self, path):
         self.view.open_path(path)
@@ -84,7 +405,10 @@ class App(Broadcaster):
         self.view.reveal_path(path)
 
     def change_state_of_selected(self, newstate):
+        delta = self._begin_change([e.index for e in self.selected_elements],
+            ['state', 'title_level'])
         for element in self.selected_elements:
+            oldstate = element.state
             if newstate == ElementState.Title:
                 if element.state == ElementState.Title:
                     element.title_level += 1
@@ -93,85 +417,442 @@ class App(Broadcaster):
                 else:
                     element.title_level = 1
             element.state = newstate
+            self.stats.change_state(element, oldstate)
+        self._end_change(delta)
+        self._save_element_changes(list(self.selected_elements))
+        self.notify('elements_changed')
+
+    def change_text_of_selected(self, newtext):
+        """Changes the text of the selected element. Does nothing with more than one selected.
+        """
+        if len(self.selected_elements) != 1:
+            return
+        element = first(self.selected_elements)
+        delta = self._begin_change([element.index], ['text'])
+        oldtext = element.text
+        element.text = newtext
+        self.stats.change_text(element, oldtext)
+        self._end_change(delta)
+        self._save_element_changes([element], text_changed=True)
+        self.notify('elements_changed')
+
+    def ignore_repeated_elements(self, max_pages):
+        """Ignores all elements whose text appears on more than ``max_pages`` pages.
+
+        Returns the number of elements that were ignored.
+        """
+        indexes = self.element_store.indexes_of_repeated_texts(max_pages)
+        delta = self._begin_change(indexes, ['state'])
+        changed = []
+        for index in indexes:
+            element = self.element_store[index]
+            oldstate = element.state
+            element.state = ElementState.Ignored
+            self.stats.change_state(element, oldstate)
+            changed.append(element)
+        self._end_change(delta)
+        self._save_element_changes(changed)
+        if indexes:
+            self.notify('elements_changed')
+        return len(indexes)
+
+    def ignore_headers_and_footers(self):
+        """Ignores elements that repeat at the same place on many pages.
+
+        Those are running headers, footers and folios. See
+        :func:`core.classify.find_repeated_elements`. Returns the number of elements that were
+        ignored.
+        """
+        pagecount = sum(1 for page in self.pages if page.extracted)
+        indexes = find_repeated_elements(self.element_store, min_repeated_pages(pagecount))
+        delta = self._begin_change(indexes, ['state'])
+        changed = []
+        for index in indexes:
+            element = self.element_store[index]
+            oldstate = element.state
+            if oldstate != ElementState.Ignored:
+                element.state = ElementState.Ignored
+                self.stats.change_state(element, oldstate)
+                changed.append(element)
+        self._end_change(delta)
+        self._save_element_changes(changed)
+        if changed:
+            self.notify('elements_changed')
+        return len(changed)
+
+    def order_elements_automatically(self):
+        """Computes the reading order of every page in a background job and applies it.
+
+        Orders are computed by :func:`core.order.compute_document_order`. The previous orders can
+        be brought back with :meth:`revert_automatic_order`.
+        """
+        elements = list(self.elements)
+        if not elements:
+            return
+
+        def do(j):
+            # We only compute orders here. They're applied in _job_completed(), on the main thread.
+            self._computed_orders = compute_document_order(elements, j)
+
+        self._computed_orders = None
+        self.view.start_job(JobType.OrderElements, do)
+
+    def revert_automatic_order(self):
+        """Brings back the orders elements had before the last automatic ordering.
+        """
+        if not self.can_revert_automatic_order:
+            return
+        store, orders = self._order_backup
+        self._order_backup = None
+        delta = self._begin_change(range(len(orders)), ['order'])
+        store.order[:len(orders)] = orders
+        self._end_change(delta)
+        self._save_element_changes(list(store)[:len(orders)])
         self.notify('elements_changed')
 
-    def load_pdf(self):
+    def apply_rules(self, rules):
+        """Classifies elements with ``rules``, a list of :class:`core.rules.Rule`.
+
+        Returns the number of elements that were changed.
+        """
+        # Rules only apply to elements in the Normal state
+        store = self.element_store
+        normal_code = STATE2CODE[ElementState.Normal]
+        normal = [i for i, code in enumerate(store.state) if code == normal_code]
+        delta = self._begin_change(normal, ['state', 'title_level'])
+        indexes = apply_rules(rules, store, self.pages)
+        self._end_change(delta)
+        changed = [store[index] for index in indexes]
+        for element in changed:
+            self.stats.change_state(element, ElementState.Normal)
+        self._save_element_changes(changed)
+        if indexes:
+            self.notify('elements_changed')
+        return len(indexes)
+
+    def apply_rule_file(self):
+        path = self.view.query_load_path("Select a PdfMasher rule file to apply", ['masherrules'])
+        if not path:
+            return
+        try:
+            rules = load_rules(path)
+        except (OSError, ET.ParseError, ValueError):
+            self.view.show_message("This file is not a valid rule file.")
+            return
+        self.apply_rules(rules)
+
+    def undo(self):
+        """Undoes the last change made to elements, if any.
+        """
+        delta = self.undo_history.undo()
+        if delta is not None:
+            self._delta_applied(delta, undone=True)
+
+    def redo(self):
+        """Redoes the last undone change, if any.
+        """
+        delta = self.undo_history.redo()
+        if delta is not None:
+            self._delta_applied(delta, undone=False)
+
+    def load_pdf(self, pagenos=None):
+        """Loads a PDF chosen by the user.
+        
+        If ``pagenos`` is given, only those pages are read. The other pages are placeholders that
+        can be read later with :meth:`extract_pages`.
+        """
         path = self.view.query_load_path("Select a PDF to work with", ['pdf'])
         if not path:
             return
 
+        def iter_all_pages(j):
+            if self.checkpoint_loads:
+                checkpoint = ExtractionCheckpoint(self.checkpoint_dir)
+            else:
+                checkpoint = None
+            return enumerate(iter_text_elements_from_pdf(path, j,
+                processes=self.extraction_processes, cache=self.extraction_cache, report=report,
+                profile=self.extraction_profile, checkpoint=checkpoint))
+
         def do(j):
+            # Our job only lasts until the first page is read. The rest of the document is read by
+            # a background loader while the user can already work on the first pages. New pages
+            # are integrated in pulse().
+            # Our document is only replaced in _job_completed(), on the main thread, so that a
+            # cancelled or failed load doesn't affect it and so that pulse() never integrates new
+            # pages in it.
             self.last_file_was_invalid = False
+            if self.lazy_loading or pagenos is not None:
+                try:
+                    pages = read_pages(path)
+                except PDFSyntaxError:
+                    self.last_file_was_invalid = True
+                    return
+                if pagenos is None:
+                    queued = range(len(pages))
+                else:
+                    queued = [p for p in pagenos if 0 <= p < len(pages)]
+                page_queue = PageQueue(queued, prefetch=self.lazy_prefetch)
+                loader = self._create_queued_loader(path, page_queue, report)
+            else:
+                pages = []
+                page_queue = None
+                loader = BackgroundLoader(iter_all_pages)
+            loader.start()
             try:
-                self.pages, self.elements = extract_text_elements_from_pdf(path, j)
-                self.current_path = path
-            except PDFSyntaxError:
+                loader.wait(j)
+            except JobCancelled:
+                loader.cancel()
+                raise
+            if isinstance(loader.error, PDFSyntaxError):
                 self.last_file_was_invalid = True
+                return
+            self._loaded_pdf = (path, pages, loader, page_queue, report)
 
+        report = ExtractionReport()
+        self._loaded_pdf = None
         self.view.start_job(JobType.LoadPDF, do)
 
+    def refresh_pdf(self):
+        """Brings the document up to date with its PDF, which was rewritten since it was loaded.
+
+        Only pages whose contents changed are extracted again. Elements of unchanged pages are
+        kept as they are and elements of changed pages take the state, title level and order of
+        the old elements they match. See :mod:`core.refresh`.
+        """
+        if self.current_path is None:
+            return
+        if self._loader is not None:
+            if not self.watch_pdf:
+                self.view.show_message("The PDF can't be refreshed before it's fully loaded.")
+            return
+        path = self.current_path
+        old_pages = list(self.pages)
+        profile = self.extraction_profile
+
+        def do(j):
+            j = j.start_subjob([1, 9])
+            try:
+                with open(path, 'rb') as fp:
+                    pdfpages = list(open_document(fp).get_pages())
+                    desc = "Comparing page %i of %i"
+                    fingerprints = [
+                        content_fingerprint(pdfpage)
+                        for pdfpage in j.iter_with_progress(pdfpages, desc)
+                    ]
+                    sizes = [page_size(pdfpage) for pdfpage in pdfpages]
+                page_map = map_unchanged_pages(old_pages, fingerprints)
+                # Placeholders stay placeholders
+                to_extract = [
+                    pageno for pageno in range(len(pdfpages))
+                    if pageno not in page_map
+                    and (pageno >= len(old_pages) or old_pages[pageno].extracted)
+                ]
+                extracted = iter_text_elements_from_pages(path, to_extract, j, profile=profile)
+                page2elements = {}
+                new_pages = {}
+                for pageno, (page, elements) in extracted:
+                    new_pages[pageno] = page
+                    page2elements[pageno] = elements
+            except PDFSyntaxError:
+                self._refresh_error = "This file is not a PDF."
+                return
+            except JobCancelled:
+                raise
+            except Exception:
+                # pdfminer raises all kinds of errors on damaged or partly written PDFs.
+                logging.warning("Error while refreshing %s", path, exc_info=True)
+                self._refresh_error = "An error occurred while reading the PDF."
+                return
+            old2new = {old_pageno: new_pageno for new_pageno, old_pageno in page_map.items()}
+            pages = []
+            for pageno, size in enumerate(sizes):
+                if pageno in page_map:
+                    page = copy(old_pages[page_map[pageno]])
+                    page.duplicate_of = old2new.get(page.duplicate_of)
+                elif pageno in new_pages:
+                    page = new_pages[pageno]
+                else:
+                    page = Page(*size)
+                    page.extracted = False
+                pages.append(page)
+            self._refresh_result = (pages, page_map, page2elements)
+
+        self._refresh_result = None
+        self._refresh_error = None
+        # Our document is only up to date with that version once our job is completed.
+        self._refresh_mtime = self._current_pdf_mtime()
+        self.view.start_job(JobType.RefreshPDF, do)
+
+    def extract_pages(self, pagenos):
+        """Reads, in the background, the pages in ``pagenos`` that haven't been read yet.
+        
+        The elements of these pages are added to the document as they're read. Elements that were
+        already in the document are left untouched.
+        """
+        if self.current_path is None:
+            return
+        pagenos = [p for p in pagenos if 0 <= p < len(self.pages) and not self.pages[p].extracted]
+        if not pagenos:
+            return
+        if self._page_queue is not None:
+            # If our loader has already gone through its queue, pulse() will restart it.
+            self._page_queue.add(pagenos)
+        elif self._loader is None:
+            self._start_queued_loader(self.current_path, PageQueue(pagenos, self.lazy_prefetch))
+
     def load_project(self):
         path = self.view.query_load_path("Select a PdfMasher project to load", ['masherproj'])
         if not path:
             return
 
-        def str2rect(s):
-            elems = s.split(' ')
-            assert len(elems) == 4
-            return Rect(*map(float, elems))
+        def do(j):
+            # The project is applied in _job_completed(), on the main thread.
+            try:
+                project_format = detect_project_format(path)
+                if project_format == ProjectFormat.SQLite:
+                    # We keep the database open to write changes to it as they happen.
+                    project_db = DatabaseProject(path)
+                    try:
+                        pdfpath, pages, store = project_db.read(j)
+                    except BaseException:
+                        project_db.close()
+                        raise
+                    journal = None
+                else:
+                    project_db = None
+                    pdfpath, pages, store = load_project(path, j)
+                    # Changes that didn't make it to the project before we last quit
+                    journal = ChangeJournal(path)
+                    journal.replay(store)
+                self._loaded_project = (pdfpath, pages, store, project_format, project_db, journal)
+            except (InvalidProjectError, ET.ParseError, KeyError, ValueError, DatabaseError):
+                self._loaded_project = None
 
-        root = ET.parse(path).getroot()
-        self.pages = []
-        for page_elem in root.iter('page'):
-            attrs = page_elem.attrib
-            width = float(attrs['width'])
-            height = float(attrs['height'])
-            self.pages.append(Page(width, height))
-        self.elements = []
-        for elem_elem in root.iter('element'):
-            attrs = elem_elem.attrib
-            rect = str2rect(attrs['rect'])
-            fontsize = float(attrs['fontsize'])
-            text = attrs['text']
-            elem = TextElement(rect, fontsize, text)
-            elem.page = int(attrs['page'])
-            elem.order = int(attrs['order'])
-            elem.state = attrs['state']
-            elem.title_level = int(attrs['title_level'])
-            self.elements.append(elem)
-        self.current_path = root.attrib['pdfpath']
-        self.notify('file_opened')
-        self.opened_file_label.refresh()
-        self.notify('elements_changed')
+        self._loaded_project = None
+        self.view.start_job(JobType.LoadProject, do)
 
     def save_project(self):
         path = self.view.query_save_path("Select a PdfMasher project to save to", ['masherproj'])
         if not path:
             return
 
-        def rect2str(r):
-            return "{} {} {} {}".format(*r)
-
-        root = ET.Element('pdfmasher-project')
-        root.set('pdfpath', self.current_path)
-        for page in self.pages:
-            page_elem = ET.SubElement(root, 'page')
-            page_elem.set('width', str(page.width))
-            page_elem.set('height', str(page.height))
-        for elem in self.elements:
-            elem_elem = ET.SubElement(root, 'element')
-            elem_elem.set('page', str(elem.page))
-            elem_elem.set('order', str(elem.order))
-            elem_elem.set('rect', rect2str(elem.rect))
-            elem_elem.set('fontsize', str(elem.fontsize))
-            elem_elem.set('text', elem.text)
-            elem_elem.set('state', elem.state)
-            elem_elem.set('title_level', str(elem.title_level))
-        tree = ET.ElementTree(root)
-        with open(path, 'wb') as fp:
-            tree.write(fp, encoding='utf-8')
+        # Our journal's records refer to elements by their index in our store, so we save elements
+        # in store order.
+        elements = list(self.element_store)
+        if self.project_format == ProjectFormat.SQLite:
+            if self.project_db is not None and self.project_db.path == path:
+                # Our changes have already been written to it.
+                return
+            self._set_journal(None)
+            self._set_project_db(None)
+            save_project(path, self.current_path, self.pages, elements, self.project_format)
+            self._set_project_db(DatabaseProject(path))
+        else:
+            self._set_project_db(None)
+            if self._journal is not None and self._journal.project_path == path:
+                # No need to save our changes there, we're about to save everything.
+                self._journal.dirty = False
+            self._set_journal(None)
+            if self.project_format == ProjectFormat.Binary:
+                # Don't save texts that were replaced since our store was loaded.
+                self.element_store.compact()
+            save_project(path, self.current_path, self.pages, elements, self.project_format)
+            journal = ChangeJournal(path)
+            journal.clear()
+            self._set_journal(journal, self.project_format)
+
+    def close(self):
+        """Saves our journaled changes and closes our project, if any.
+
+        Must be called before the application quits.
+        """
+        self._stop_background_loading()
+        self._set_project_db(None)
+        self._set_journal(None)
+
+    def elements_of_page(self, pageno):
+        """Returns the elements of page ``pageno``, in document order.
+
+        When we have a project database, its page index is used instead of going through all our
+        elements.
+        """
+        if self.project_db is not None:
+            store = self.element_store
+            return [store[index] for index in self.project_db.page_element_ids(pageno)]
+        return [e for e in self.elements if e.page == pageno]
+
+    def elements_in_state(self, state):
+        """Returns the elements in ``state``, in document order.
+
+        When we have a project database, its state index is used instead of going through all our
+        elements.
+        """
+        if self.project_db is not None:
+            store = self.element_store
+            return [store[index] for index in self.project_db.state_element_ids(state)]
+        return [e for e in self.elements if e.state == state]
+
+    def pulse(self):
+        """Integrates pages read in the background since the last call and autosaves our project.
+
+        Must be called regularly by the view, from the main thread.
+        """
+        journal = self._journal
+        if journal is not None and journal.dirty:
+            if time.time() - self._last_autosave >= self.autosave_interval:
+                self._save_journaled_project()
+        loader = self._loader
+        if loader is None:
+            if self.watch_pdf and self.current_path is not None:
+                mtime = self._current_pdf_mtime()
+                if mtime is not None and mtime not in {self._pdf_mtime, self._refresh_mtime}:
+                    self.refresh_pdf()
+            return
+        finished = loader.finished
+        if self._integrate_loaded_pages():
+            self.notify('elements_added')
+        if finished:
+            self._loader = None
+            page_queue = self._page_queue
+            self._page_queue = None
+            if loader.error is not None:
+                msg = "An error occurred while reading the PDF. Some pages could not be read."
+                self.view.show_message(msg)
+            elif page_queue is not None and page_queue.pending_count():
+                # Pages were queued after our loader went through its queue.
+                self._start_queued_loader(self.current_path, page_queue)
+        self.opened_file_label.refresh()
+
+    def request_page(self, pageno):
+        """Makes ``pageno`` (and the pages following it) the next pages to be read.
+        
+        Only has an effect when a PDF is being loaded lazily.
+        """
+        if self.lazy_loading and self._page_queue is not None:
+            self._page_queue.request(pageno)
 
     #--- Properties
+    @property
+    def loading_desc(self):
+        # Describes the progress of the background loading, if any.
+        if self._loader is None:
+            return ''
+        return self._loader.progress_desc
+
+    @property
+    def can_revert_automatic_order(self):
+        # The backup doesn't apply anymore once another document is loaded.
+        return self._order_backup is not None and self._order_backup[0] is self.element_store
+
+    @property
+    def can_undo(self):
+        return self.undo_history.can_undo
+
+    @property
+    def can_redo(self):
+        return self.undo_history.can_redo
+
     @property
     def hide_ignored(self):
         return self._hide_ignored
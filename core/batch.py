@@ -0,0 +1,318 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-09
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+"""Converts PDFs without the GUI.
+
+Usage: python -m core.batch [options] <pdf or directory>...
+
+Each PDF goes through a fixed recipe: extraction, automatic title classification, markdown
+generation and then, optionally, HTML and e-book generation. Files are converted concurrently by a
+pool of worker processes and a per-file summary is printed at the end.
+"""
+
+import sys
+import os
+import os.path as op
+import logging
+import multiprocessing
+from argparse import ArgumentParser
+from functools import partial
+from time import perf_counter
+from xml.etree import ElementTree as ET
+
+from pdfminer.pdfparser import PDFSyntaxError
+
+from .const import ElementState, EbookType, ExtractionProfile
+from .pdf import extract_text_elements_from_pdf
+from .cache import ExtractionCache, ExtractionCheckpoint
+from .classify import classify_titles
+from .store import ElementStore
+from .stats import DocumentStats
+from .rules import apply_rules, load_rules
+from .report import peak_memory_usage
+from .output import generate_markdown, generate_html, create_ebook
+
+class OutputFormat:
+    Markdown = 'txt'
+    HTML = 'htm'
+    EPUB = 'epub'
+    MOBI = 'mobi'
+
+ALL_FORMATS = [OutputFormat.Markdown, OutputFormat.HTML, OutputFormat.EPUB, OutputFormat.MOBI]
+FORMAT2EBOOKTYPE = {
+    OutputFormat.EPUB: EbookType.EPUB,
+    OutputFormat.MOBI: EbookType.MOBI,
+}
+
+class ConversionStatus:
+    Success = 'ok'
+    Invalid = 'invalid'
+    Failed = 'failed'
+
+class ConversionResult:
+    """Outcome of the conversion of a single PDF.
+
+    ``durations`` is a list of ``(step, seconds)`` in the order in which the steps were performed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.status = ConversionStatus.Success
+        self.error = None
+        self.durations = []
+        self.element_count = 0
+        self.title_count = 0
+        # DocumentStats of the converted elements
+        self.stats = None
+        self.outputs = []
+        # Peak memory, in bytes, of the process that did the conversion. See peak_memory_usage().
+        self.peak_memory = None
+
+    def __repr__(self):
+        return '<ConversionResult {} {}>'.format(self.path, self.status)
+
+    #--- Properties
+    @property
+    def total_duration(self):
+        return sum(duration for _, duration in self.durations)
+
+
+#--- Private
+class _Timer:
+    def __init__(self, result, step):
+        self.result = result
+        self.step = step
+
+    def __enter__(self):
+        self.started_at = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.result.durations.append((self.step, perf_counter() - self.started_at))
+
+def _write(path, contents):
+    with open(path, 'wt', encoding='utf-8') as fp:
+        fp.write(contents)
+
+def _convert_item(convert, item):
+    path, dest_name = item
+    return convert(path, dest_name=dest_name)
+
+#--- Public
+def iter_pdf_paths(paths):
+    """Yields the PDFs in ``paths``. Directories are walked recursively.
+    """
+    for path in paths:
+        if op.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.lower().endswith('.pdf'):
+                        yield op.join(dirpath, filename)
+        else:
+            yield path
+
+def unique_dest_names(paths):
+    """Returns the base name of the converted files of each of ``paths``, in the same order.
+
+    When all files are converted in the same directory, PDFs with the same name (``a/x.pdf`` and
+    ``b/x.pdf``) would overwrite each other's output. The second one becomes ``x-2``, the third
+    ``x-3`` and so on. Names are compared without case because so are some file systems.
+    """
+    result = []
+    used = set()
+    for path in paths:
+        basename, _ = op.splitext(op.basename(path))
+        name = basename
+        suffix = 1
+        while name.lower() in used:
+            suffix += 1
+            name = '{}-{}'.format(basename, suffix)
+        used.add(name.lower())
+        result.append(name)
+    return result
+
+def convert_pdf(path, dest_dir=None, formats=(OutputFormat.Markdown, ), classify=True,
+        cache_dir=None, low_memory=False, profile=ExtractionProfile.Accurate, checkpoint_dir=None,
+        rules=None, dest_name=None):
+    """Converts the PDF at ``path`` in all ``formats`` and returns a :class:`ConversionResult`.
+
+    Converted files are written next to the PDF, or in ``dest_dir`` if it's given. Markdown is
+    always generated because all other formats are generated from it. Errors are reported in the
+    result rather than raised. ``low_memory`` and ``profile`` are passed to
+    :func:`core.pdf.extract_text_elements_from_pdf`. If ``checkpoint_dir`` is given, extracted
+    pages are saved in it as we go and an interrupted extraction is resumed by the next conversion
+    of the same PDF. ``rules``, a list of
+    :class:`core.rules.Rule`, are applied before automatic title classification. Converted files
+    are named after the PDF unless ``dest_name`` is given.
+    """
+    result = ConversionResult(path)
+    basename, _ = op.splitext(op.basename(path))
+    if dest_dir is None:
+        dest_dir = op.dirname(path)
+    if dest_name is None:
+        dest_name = basename
+    dest_base = op.join(dest_dir, dest_name)
+    # Files that weren't asked for, but that other formats are generated from
+    intermediates = []
+    try:
+        with _Timer(result, 'extract'):
+            cache = ExtractionCache(cache_dir) if cache_dir else None
+            pdf_checkpoint = ExtractionCheckpoint(checkpoint_dir) if checkpoint_dir else None
+            pages, elements = extract_text_elements_from_pdf(path, cache=cache,
+                low_memory=low_memory, profile=profile, checkpoint=pdf_checkpoint)
+        result.element_count = len(elements)
+        stats = result.stats = DocumentStats(elements)
+        if rules:
+            with _Timer(result, 'rules'):
+                store = ElementStore()
+                elements = store.extend(elements)
+                for index in apply_rules(rules, store, pages):
+                    stats.change_state(store[index], ElementState.Normal)
+        if classify:
+            with _Timer(result, 'classify'):
+                titles = classify_titles(elements, bodysize=stats.body_fontsize())
+                for elem in titles:
+                    stats.change_state(elem, ElementState.Normal)
+                result.title_count = len(titles)
+        with _Timer(result, 'markdown'):
+            md_contents = generate_markdown(elements)
+            md_path = dest_base + '.' + OutputFormat.Markdown
+            if OutputFormat.Markdown not in formats:
+                intermediates.append(md_path)
+            _write(md_path, md_contents)
+        if OutputFormat.Markdown in formats:
+            result.outputs.append(md_path)
+        needs_html = any(fmt in formats for fmt in ALL_FORMATS[1:])
+        if needs_html:
+            with _Timer(result, 'html'):
+                html_path = dest_base + '.' + OutputFormat.HTML
+                if OutputFormat.HTML not in formats:
+                    intermediates.append(html_path)
+                _write(html_path, generate_html(md_contents, 'utf-8'))
+            if OutputFormat.HTML in formats:
+                result.outputs.append(html_path)
+        for fmt in [OutputFormat.EPUB, OutputFormat.MOBI]:
+            if fmt not in formats:
+                continue
+            with _Timer(result, fmt):
+                ebook_path = dest_base + '.' + fmt
+                create_ebook(html_path, ebook_path, FORMAT2EBOOKTYPE[fmt], title=basename)
+            result.outputs.append(ebook_path)
+    except PDFSyntaxError:
+        result.status = ConversionStatus.Invalid
+        result.error = "This file is not a PDF."
+    except Exception as e:
+        logging.exception("Error while converting %s", path)
+        result.status = ConversionStatus.Failed
+        result.error = str(e) or e.__class__.__name__
+    finally:
+        # Whether we succeeded or not
+        for intermediate in intermediates:
+            try:
+                os.remove(intermediate)
+            except OSError:
+                pass
+    result.peak_memory = peak_memory_usage()
+    return result
+
+def iter_converted_pdfs(paths, processes=1, **options):
+    """Converts all ``paths`` with ``processes`` worker processes and yields their results.
+
+    ``options`` are passed to :func:`convert_pdf`. Results are yielded as soon as they're ready,
+    which isn't necessarily in the order of ``paths``.
+
+    With the ``low_memory`` option, each worker process only converts one file. Memory is then
+    given back to the system between files and the peak memory of each result is its own.
+
+    With the ``dest_dir`` option, PDFs with the same name get distinct output names (see
+    :func:`unique_dest_names`).
+    """
+    paths = list(paths)
+    processes = min(processes, len(paths))
+    if options.get('dest_dir') is not None:
+        dest_names = unique_dest_names(paths)
+    else:
+        dest_names = [None] * len(paths)
+    items = list(zip(paths, dest_names))
+    convert = partial(_convert_item, partial(convert_pdf, **options))
+    if processes <= 1:
+        for item in items:
+            yield convert(item)
+        return
+    maxtasksperchild = 1 if options.get('low_memory') else None
+    with multiprocessing.Pool(processes, maxtasksperchild=maxtasksperchild) as pool:
+        # Files vary greatly in size, so we hand them one by one to whoever is free.
+        yield from pool.imap_unordered(convert, items)
+
+def format_summary(results, wall_time=None):
+    """Returns a table of the status and durations of each result, followed by totals.
+    """
+    lines = []
+    for result in results:
+        steps = ' '.join('{}={:.2f}s'.format(step, duration) for step, duration in result.durations)
+        if result.peak_memory is not None:
+            memory = '{:.0f}MB'.format(result.peak_memory / (1024 * 1024))
+        else:
+            memory = '?'
+        line = '{:<7} {:>7.2f}s {:>6} {:>6} elements  {}  [{}]'.format(result.status,
+            result.total_duration, memory, result.element_count, result.path, steps)
+        if result.error:
+            line += ' ' + result.error
+        lines.append(line)
+    succeeded = sum(1 for result in results if result.status == ConversionStatus.Success)
+    total = "{} of {} files converted".format(succeeded, len(results))
+    if wall_time is not None:
+        total += " in {:.2f}s".format(wall_time)
+    lines.append(total)
+    return '\n'.join(lines)
+
+def main(args=None):
+    parser = ArgumentParser(description="Converts PDFs to markdown and e-books.")
+    parser.add_argument('paths', nargs='+', metavar='path',
+        help="PDF file or directory containing PDF files")
+    parser.add_argument('-o', '--output', dest='dest_dir',
+        help="Directory to write converted files to (default: next to the PDF)")
+    parser.add_argument('-f', '--format', dest='formats', action='append', choices=ALL_FORMATS,
+        help="Output format. Can be repeated (default: txt)")
+    parser.add_argument('-j', '--processes', type=int, default=multiprocessing.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument('--no-classify', dest='classify', action='store_false',
+        help="Don't automatically mark big text as titles")
+    parser.add_argument('--cache-dir', help="Directory in which to cache extraction results")
+    parser.add_argument('--low-memory', action='store_true',
+        help="Reduce peak memory usage at the cost of speed")
+    parser.add_argument('--fast', dest='profile', action='store_const',
+        const=ExtractionProfile.Fast, default=ExtractionProfile.Accurate,
+        help="Skip figures and approximate layout analysis for a much faster extraction")
+    parser.add_argument('--checkpoint-dir',
+        help="Directory in which to save extracted pages as we go, to resume interrupted runs")
+    parser.add_argument('--rules', metavar='RULEFILE',
+        help="Rule file (.masherrules) to classify elements with")
+    options = parser.parse_args(args)
+    rules = None
+    if options.rules:
+        try:
+            rules = load_rules(options.rules)
+        except (OSError, ET.ParseError, ValueError) as e:
+            parser.error("invalid rule file {}: {}".format(options.rules, e))
+    if options.dest_dir and not op.exists(options.dest_dir):
+        os.makedirs(options.dest_dir)
+    paths = list(iter_pdf_paths(options.paths))
+    started_at = perf_counter()
+    results = []
+    converted = iter_converted_pdfs(paths, processes=options.processes, dest_dir=options.dest_dir,
+        formats=options.formats or [OutputFormat.Markdown], classify=options.classify,
+        cache_dir=options.cache_dir, low_memory=options.low_memory, profile=options.profile,
+        checkpoint_dir=options.checkpoint_dir, rules=rules)
+    for result in converted:
+        results.append(result)
+        print("[{}/{}] {} {}".format(len(results), len(paths), result.status, result.path))
+    print(format_summary(results, perf_counter() - started_at))
+    return 0 if all(r.status == ConversionStatus.Success for r in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-02
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import os
+import os.path as op
+import hashlib
+import json
+import struct
+import zlib
+import logging
+
+from hscommon.geometry import Rect
+
+from .const import ExtractionProfile
+from .pdf import Page, TextElement
+
+# Bump this whenever a change in the extraction code changes its results. Old cache entries will
+# then simply never be hit again and will be evicted in time.
+CACHE_VERSION = 4
+CACHE_EXT = '.pmcache'
+DEFAULT_MAXSIZE = 200 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+CHECKPOINT_EXT = '.pmcheckpoint'
+CHECKPOINT_MAGIC = b'PMCHECKPOINT2\n'
+CHECKPOINT_INTERVAL = 25
+# Each chunk of a checkpoint file is preceded by its size, as a big endian 32-bit int
+CHUNK_HEADER = struct.Struct('>I')
+
+def laparams_signature(laparams):
+    """Returns a stable string describing all settings in ``laparams``.
+    """
+    return repr(sorted(vars(laparams).items()))
+
+def hash_pdf(path, extra=''):
+    """Returns a hex digest of the contents of the file at ``path``, salted with ``extra``.
+    """
+    h = hashlib.sha1()
+    h.update('{}:{}:'.format(CACHE_VERSION, extra).encode('utf-8'))
+    with open(path, 'rb') as fp:
+        while True:
+            chunk = fp.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def extraction_key(path, laparams, profile=ExtractionProfile.Accurate):
+    """Returns a key identifying the extraction of the PDF at ``path`` with the given settings.
+    """
+    return hash_pdf(path, '{}:{}'.format(profile, laparams_signature(laparams)))
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _is_optional(value, types):
+    return value is None or isinstance(value, types)
+
+def pack_extraction(pages, elements):
+    """Packs the result of an extraction into compressed bytes.
+
+    Pages and elements are packed as JSON arrays of plain values. Unlike pickles, they can't run
+    code when they're loaded and they don't break when our classes or Python itself change.
+    """
+    packed_pages = [[p.width, p.height, p.blank, p.duplicate_of, p.fingerprint] for p in pages]
+    packed_elements = [
+        [e.page, e.order, list(e.rect), e.fontsize, e.text]
+        for e in elements
+    ]
+    data = json.dumps([packed_pages, packed_elements], separators=(',', ':'))
+    return zlib.compress(data.encode('utf-8'))
+
+def unpack_extraction(data):
+    """Unpacks bytes packed with :func:`pack_extraction`.
+
+    Raises ``zlib.error``, ``ValueError`` or ``TypeError`` if ``data`` is invalid.
+    """
+    packed_pages, packed_elements = json.loads(zlib.decompress(data).decode('utf-8'))
+    pages = []
+    for width, height, blank, duplicate_of, fingerprint in packed_pages:
+        valid = (_is_number(width) and _is_number(height) and isinstance(blank, bool)
+            and _is_optional(duplicate_of, int) and _is_optional(fingerprint, str))
+        if not valid:
+            raise ValueError("Invalid page in extraction data")
+        page = Page(width, height)
+        page.blank = blank
+        page.duplicate_of = duplicate_of
+        page.fingerprint = fingerprint
+        pages.append(page)
+    elements = []
+    for pageno, order, rect, fontsize, text in packed_elements:
+        valid = (isinstance(pageno, int) and isinstance(order, int) and len(rect) == 4
+            and all(_is_number(value) for value in rect) and _is_number(fontsize)
+            and isinstance(text, str))
+        if not valid:
+            raise ValueError("Invalid element in extraction data")
+        elem = TextElement(Rect(*rect), fontsize, text)
+        elem.page = pageno
+        elem.order = order
+        elements.append(elem)
+    return pages, elements
+
+class ExtractionCache:
+    """Content-addressed cache of PDF extraction results.
+
+    Entries are keyed on a hash of the PDF contents and extraction settings, so a renamed or copied
+    PDF still hits the cache and a modified one never does. Each entry is a file in ``cachedir``.
+    When the total size of the cache exceeds ``maxsize`` bytes, the least recently used entries are
+    deleted (we touch an entry's mtime every time it's hit).
+    """
+    def __init__(self, cachedir, maxsize=DEFAULT_MAXSIZE):
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+
+    #--- Private
+    def _entry_path(self, key):
+        return op.join(self.cachedir, key + CACHE_EXT)
+
+    def _entries(self):
+        # Returns a list of (mtime, size, path) for all entries in the cache.
+        result = []
+        if not op.exists(self.cachedir):
+            return result
+        for name in os.listdir(self.cachedir):
+            if not name.endswith(CACHE_EXT):
+                continue
+            path = op.join(self.cachedir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+        return result
+
+    def _evict(self):
+        entries = self._entries()
+        totalsize = sum(size for _, size, _ in entries)
+        entries.sort()
+        for mtime, size, path in entries:
+            if totalsize <= self.maxsize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            totalsize -= size
+
+    #--- Public
+    def key_for(self, path, laparams, profile=ExtractionProfile.Accurate):
+        return extraction_key(path, laparams, profile)
+
+    def get(self, key):
+        """Returns the ``(pages, elements)`` cached under ``key`` or ``None`` if there's none.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as fp:
+                data = fp.read()
+            result = unpack_extraction(data)
+        except (OSError, zlib.error, ValueError, TypeError):
+            return None
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, pages, elements):
+        try:
+            if not op.exists(self.cachedir):
+                os.makedirs(self.cachedir)
+            entry_path = self._entry_path(key)
+            # We write to a temporary file first so that a concurrent reader never sees a partial
+            # entry.
+            tmp_path = entry_path + '.tmp{}'.format(os.getpid())
+            with open(tmp_path, 'wb') as fp:
+                fp.write(pack_extraction(pages, elements))
+            os.replace(tmp_path, entry_path)
+            self._evict()
+        except OSError:
+            # A cache that can't be written to is not a reason to fail a PDF load.
+            logging.warning("Could not write to extraction cache at %s", self.cachedir)
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ExtractionCheckpoint:
+    """File in ``checkpointdir`` in which the pages of a PDF are saved as they're extracted.
+
+    If an extraction is cancelled or if the process dies, the next extraction of the same PDF, with
+    the same settings, resumes after the last saved page instead of starting over. Like cache
+    entries, checkpoint files are named after the extraction key. A file starts with a header
+    holding that key. It's followed by chunks of consecutive pages, each of them packed like cache
+    entries, so that saving pages is only a matter of appending to the file. A chunk that was only
+    partly written is ignored (and overwritten).
+
+    Pages are saved every ``interval`` pages. Call :meth:`flush` to save pending pages right away.
+    """
+    def __init__(self, checkpointdir, interval=CHECKPOINT_INTERVAL):
+        self.checkpointdir = checkpointdir
+        # Our file, once we know the key of our extraction
+        self.path = None
+        self.interval = interval
+        self._pending_pages = []
+        self._pending_elements = []
+        self._header = None
+
+    #--- Private
+    def _read(self, header):
+        # Returns the (pages, elements) saved in our file and the offset at which the valid data
+        # ends. Raises OSError if there's no usable file.
+        pages = []
+        elements = []
+        with open(self.path, 'rb') as fp:
+            if fp.read(len(header)) != header:
+                raise OSError("Checkpoint is for another file or other settings")
+            offset = fp.tell()
+            while True:
+                size_data = fp.read(CHUNK_HEADER.size)
+                if len(size_data) < CHUNK_HEADER.size:
+                    break
+                [size] = CHUNK_HEADER.unpack(size_data)
+                data = fp.read(size)
+                try:
+                    chunk_pages, chunk_elements = unpack_extraction(data)
+                except (zlib.error, ValueError, TypeError):
+                    break
+                pages += chunk_pages
+                elements += chunk_elements
+                offset = fp.tell()
+        return pages, elements, offset
+
+    #--- Public
+    def key_for(self, path, laparams, profile=ExtractionProfile.Accurate):
+        return extraction_key(path, laparams, profile)
+
+    def resume(self, key):
+        """Returns the ``(pages, elements)`` saved for ``key`` and gets ready to save more pages.
+
+        Pages are always saved in order, starting with the first page. If there's nothing to
+        resume, we return empty lists and start a new checkpoint file.
+        """
+        self.path = op.join(self.checkpointdir, key + CHECKPOINT_EXT)
+        self._header = CHECKPOINT_MAGIC + key.encode('ascii') + b'\n'
+        self._pending_pages = []
+        self._pending_elements = []
+        try:
+            pages, elements, offset = self._read(self._header)
+            with open(self.path, 'r+b') as fp:
+                fp.truncate(offset)
+            return pages, elements
+        except OSError:
+            pass
+        try:
+            if not op.exists(self.checkpointdir):
+                os.makedirs(self.checkpointdir)
+            with open(self.path, 'wb') as fp:
+                fp.write(self._header)
+        except OSError:
+            logging.warning("Could not write extraction checkpoint at %s", self.path)
+            self._header = None
+        return [], []
+
+    def add(self, page, elements):
+        """Adds an extracted page. Pages have to be added in order.
+        """
+        if self._header is None:
+            return
+        self._pending_pages.append(page)
+        self._pending_elements += elements
+        if len(self._pending_pages) >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._header is None or not self._pending_pages:
+            return
+        data = pack_extraction(self._pending_pages, self._pending_elements)
+        self._pending_pages = []
+        self._pending_elements = []
+        try:
+            with open(self.path, 'ab') as fp:
+                fp.write(CHUNK_HEADER.pack(len(data)))
+                fp.write(data)
+        except OSError:
+            # A checkpoint that can't be written to is not a reason to fail a PDF load.
+            logging.warning("Could not write extraction checkpoint at %s", self.path)
+            self._header = None
+
+    def discard(self):
+        """Removes the checkpoint file. Called once the extraction is complete.
+        """
+        self._header = None
+        self._pending_pages = []
+        self._pending_elements = []
+        if self.path is None:
+            return
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,113 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-09
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from collections import Counter, defaultdict
+from math import ceil
+
+from .const import ElementState
+
+# An element needs a font this much bigger than the body font to be considered a title.
+TITLE_FONTSIZE_RATIO = 1.2
+MAX_TITLE_LEVEL = 6
+# Elements are considered to be at the same place on different pages when their y position is
+# within the same band of that many points. Same thing for font sizes.
+REPEATED_Y_BAND = 4
+REPEATED_FONTSIZE_BAND = 0.5
+# A text has to be repeated on at least this ratio of pages (and on at least REPEATED_MIN_PAGES
+# pages) to be a header or footer. It's low because of books that alternate headers on odd and
+# even pages.
+REPEATED_PAGE_RATIO = 0.25
+REPEATED_MIN_PAGES = 3
+# str.translate() table that removes digits
+DIGITS_REMOVAL = str.maketrans('', '', '0123456789')
+
+def body_fontsize(elements):
+    """Returns the font size in which most of the text of ``elements`` is written.
+    """
+    counter = Counter()
+    for elem in elements:
+        counter[round(elem.fontsize, 1)] += len(elem.text)
+    if not counter:
+        return None
+    [(fontsize, _)] = counter.most_common(1)
+    return fontsize
+
+def classify_titles(elements, ratio=TITLE_FONTSIZE_RATIO, bodysize=None):
+    """Sets the state of ``elements`` with a font significantly bigger than the body's to Title.
+
+    Title levels follow font sizes: the biggest font is level 1, the next one is level 2, and so
+    on. Only elements in the Normal state are touched, so manual classification is kept. Returns
+    the elements that became titles. If we already know the body font size (from a
+    :class:`core.stats.DocumentStats`), we can pass it as ``bodysize``.
+    """
+    if bodysize is None:
+        bodysize = body_fontsize(elements)
+    if bodysize is None:
+        return []
+    titles = [
+        elem for elem in elements
+        if elem.state == ElementState.Normal and round(elem.fontsize, 1) >= bodysize * ratio
+    ]
+    sizes = sorted({round(elem.fontsize, 1) for elem in titles}, reverse=True)
+    size2level = {size: min(level, MAX_TITLE_LEVEL) for level, size in enumerate(sizes, start=1)}
+    for elem in titles:
+        elem.state = ElementState.Title
+        elem.title_level = size2level[round(elem.fontsize, 1)]
+    return titles
+
+def normalize_repeated_text(text):
+    """Normalizes ``text`` so that headers and footers from different pages compare equal.
+
+    Digits are removed (folios, chapter numbers), whitespace is collapsed and case is ignored. A
+    text made only of digits becomes ``#``. We avoid regexps here because we normalize every
+    distinct text of the document.
+    """
+    result = ' '.join(text.translate(DIGITS_REMOVAL).split()).lower()
+    if not result and text.strip():
+        result = '#'
+    return result
+
+def find_repeated_elements(store, min_pages):
+    """Returns the indexes of the elements of ``store`` that repeat on at least ``min_pages`` pages.
+
+    ``store`` is a :class:`core.store.ElementStore`. Elements are bucketed in a dict by normalized
+    text (computed once per distinct text), y band and font size band, and each bucket collects
+    the pages it appears on. This is linear in the number of elements. To account for elements
+    sitting right at a band's boundary, a bucket's pages are merged with the pages of the buckets
+    just above and below it.
+    """
+    texts = store.texts
+    normalized = [normalize_repeated_text(texts[textid]) for textid in range(len(texts))]
+    keys = []
+    key2pages = defaultdict(set)
+    for textid, pageno, y, h, fontsize in zip(store.text_id, store.page, store.y, store.h,
+            store.fontsize):
+        text = normalized[textid]
+        if not text:
+            keys.append(None)
+            continue
+        key = (text, round((y + h) / REPEATED_Y_BAND), round(fontsize / REPEATED_FONTSIZE_BAND))
+        keys.append(key)
+        key2pages[key].add(pageno)
+    empty = frozenset()
+    repeated_keys = set()
+    for key, pages in key2pages.items():
+        if len(pages) >= min_pages:
+            repeated_keys.add(key)
+            continue
+        text, yband, fontband = key
+        above = key2pages.get((text, yband + 1, fontband), empty)
+        below = key2pages.get((text, yband - 1, fontband), empty)
+        if len(pages | above | below) >= min_pages:
+            repeated_keys.add(key)
+    return [index for index, key in enumerate(keys) if key in repeated_keys]
+
+def min_repeated_pages(pagecount):
+    """Returns the number of pages a text must be repeated on for a document of ``pagecount``.
+    """
+    return max(REPEATED_MIN_PAGES, ceil(pagecount * REPEATED_PAGE_RATIO))
@@ -13,6 +13,17 @@ class ElementState:
     ToFix = 'tofix'
     Ignored = 'ignored'
 
+class ExtractionProfile:
+    # Full layout analysis, with font sizes averaged over every character
+    Accurate = 'accurate'
+    # Figures and images are skipped, textboxes are kept in drawing order and font sizes are
+    # estimated from line heights
+    Fast = 'fast'
+
+class EbookType:
+    MOBI = 1
+    EPUB = 2
+
 SHORTCUTKEY2FLAG = {
     'N': ElementState.Normal,
     'T': ElementState.Title,
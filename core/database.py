@@ -0,0 +1,211 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-13
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+"""Projects living in a SQLite database.
+
+Unlike XML and binary projects, which are rewritten as a whole on each save, a database project
+is updated element by element. Elements are stored with the index they have in the
+:class:`core.store.ElementStore` they come from as their id, which is how we find the row to
+update when an element changes. The ids of the elements of a page or in a state can be queried
+through indexes instead of going through all elements.
+"""
+
+from itertools import islice
+from sqlite3 import DatabaseError
+
+from hscommon.sqlite import ThreadedConn
+from jobprogress.job import nulljob
+
+from .pdf import Page
+from .store import ElementStore, STATES, STATE2CODE
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+SCHEMA_VERSION = 1
+TABLES = {'project', 'pages', 'elements'}
+SCHEMA = [
+    "CREATE TABLE project (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE pages (pageno INTEGER PRIMARY KEY, width REAL, height REAL, extracted INTEGER, "
+    "blank INTEGER, duplicate_of INTEGER, fingerprint TEXT)",
+    "CREATE TABLE elements (id INTEGER PRIMARY KEY, page INTEGER, \"order\" INTEGER, x REAL, "
+    "y REAL, w REAL, h REAL, fontsize REAL, text TEXT, state TEXT, title_level INTEGER)",
+    "CREATE INDEX elements_page_order ON elements (page, \"order\")",
+    "CREATE INDEX elements_state ON elements (state)",
+]
+ELEMENT_FIELDS = 'id, page, "order", x, y, w, h, fontsize, text, state, title_level'
+ELEMENT_FIELD_COUNT = 11
+PAGE_FIELD_COUNT = 7
+# SQLite limits the number of variables in a query to 999, so we insert rows in batches.
+MAX_VARIABLES = 999
+LOAD_BATCH_SIZE = 10000
+
+class DatabaseProject:
+    """A project stored in the SQLite database at ``path``.
+
+    If ``create`` is true and the database is empty (or doesn't exist), our tables are created in
+    it. Raises ``sqlite3.DatabaseError`` if the database isn't a project saved by this version of
+    PdfMasher (or an older one). Queries go through a :class:`hscommon.sqlite.ThreadedConn`, so a
+    project can be used from any thread.
+    """
+    def __init__(self, path, create=False):
+        self.path = path
+        self.con = ThreadedConn(path, False)
+        try:
+            self._check_schema(create)
+        except BaseException:
+            self.con.close()
+            raise
+
+    #--- Private
+    def _check_schema(self, create):
+        tables = {row[0] for row in self.con.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not tables and create:
+            for sql in SCHEMA:
+                self.con.execute(sql)
+            self._set_value('version', str(SCHEMA_VERSION))
+            self.con.commit()
+            return
+        if not TABLES <= tables:
+            raise DatabaseError("Not a PdfMasher project")
+        version = self._get_value('version')
+        if version is None or not version.isdigit():
+            raise DatabaseError("Not a PdfMasher project")
+        if int(version) > SCHEMA_VERSION:
+            raise DatabaseError("This project was saved by a newer version of PdfMasher")
+
+    def _get_value(self, key):
+        row = self.con.execute("SELECT value FROM project WHERE key = ?", [key]).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_value(self, key, value):
+        self.con.execute("INSERT OR REPLACE INTO project (key, value) VALUES (?, ?)", [key, value])
+
+    def _insert_rows(self, table, field_count, rows):
+        batch_size = MAX_VARIABLES // field_count
+        placeholders = '({})'.format(', '.join(['?'] * field_count))
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            sql = "INSERT INTO {} VALUES {}".format(table,
+                ', '.join([placeholders] * len(batch)))
+            self.con.execute(sql, [value for row in batch for value in row])
+
+    #--- Public
+    def close(self):
+        self.con.close()
+
+    def write(self, pdfpath, pages, store):
+        """Replaces the contents of the project with ``pages`` and the elements of ``store``.
+        """
+        self.con.execute("DELETE FROM pages")
+        self.con.execute("DELETE FROM elements")
+        self._set_value('pdfpath', pdfpath)
+        page_rows = (
+            (pageno, page.width, page.height, int(page.extracted), int(page.blank),
+                page.duplicate_of, page.fingerprint)
+            for pageno, page in enumerate(pages)
+        )
+        self._insert_rows('pages', PAGE_FIELD_COUNT, page_rows)
+        texts = store.texts
+        element_rows = (
+            (index, pageno, order, x, y, w, h, fontsize, texts[textid], STATES[state],
+                title_level)
+            for index, (pageno, order, x, y, w, h, fontsize, textid, state, title_level)
+            in enumerate(zip(store.page, store.order, store.x, store.y, store.w, store.h,
+                store.fontsize, store.text_id, store.state, store.title_level))
+        )
+        self._insert_rows('elements', ELEMENT_FIELD_COUNT, element_rows)
+        self.con.commit()
+
+    def read(self, j=nulljob):
+        """Returns a ``(pdfpath, pages, store)`` tuple with the whole project.
+        """
+        pdfpath = self._get_value('pdfpath')
+        pages = []
+        for row in self.con.execute("SELECT * FROM pages ORDER BY pageno"):
+            _, width, height, extracted, blank, duplicate_of, fingerprint = row
+            page = Page(width, height)
+            page.extracted = bool(extracted)
+            page.blank = bool(blank)
+            page.duplicate_of = duplicate_of
+            page.fingerprint = fingerprint
+            pages.append(page)
+        store = ElementStore()
+        texts = store.texts
+        count = self.element_count()
+        starts = range(0, count, LOAD_BATCH_SIZE)
+        for start in j.iter_with_progress(starts, "Loading elements %i of %i"):
+            rows = self.con.execute("SELECT {} FROM elements WHERE id >= ? AND id < ? ORDER BY id"
+                .format(ELEMENT_FIELDS), [start, start + LOAD_BATCH_SIZE])
+            if not rows:
+                continue
+            _, pagenos, orders, xs, ys, ws, hs, fontsizes, textcol, states, title_levels = \
+                zip(*rows)
+            store.page.extend(pagenos)
+            store.order.extend(orders)
+            store.x.extend(xs)
+            store.y.extend(ys)
+            store.w.extend(ws)
+            store.h.extend(hs)
+            store.fontsize.extend(fontsizes)
+            store.text_id.extend(map(texts.add, textcol))
+            store.state.extend(STATE2CODE[state] for state in states)
+            store.title_level.extend(title_levels)
+        return pdfpath, pages, store
+
+    def element_count(self):
+        return self.con.execute("SELECT COUNT(*) FROM elements").fetchone()[0]
+
+    def page_element_ids(self, pageno):
+        """Returns the ids of the elements of page ``pageno``, in ascending order.
+        """
+        rows = self.con.execute("SELECT id FROM elements WHERE page = ? ORDER BY id", [pageno])
+        return [row[0] for row in rows]
+
+    def state_element_ids(self, state):
+        """Returns the ids of the elements in ``state``, by page and in ascending order.
+        """
+        rows = self.con.execute("SELECT id FROM elements WHERE state = ? ORDER BY page, id",
+            [state])
+        return [row[0] for row in rows]
+
+    def update_elements(self, elements):
+        """Writes the state, title level, order and text of ``elements`` to their rows.
+
+        ``elements`` are views on the store the project was written or read from.
+        """
+        sql = "UPDATE elements SET state = ?, title_level = ?, \"order\" = ?, text = ? WHERE id = ?"
+        # Queries go through our connection's thread, so we send all updates at once.
+        rows = [
+            (elem.state, elem.title_level, elem.order, elem.text, elem.index)
+            for elem in elements
+        ]
+        self.con.executemany(sql, rows)
+        self.con.commit()
+
+    def add_elements(self, pages, elements):
+        """Adds ``elements`` and replaces the rows of ``pages``, a ``{pageno: Page}`` dict.
+
+        Used when pages that were placeholders are extracted. ``elements`` are views on the store
+        the project was written or read from.
+        """
+        for pageno, page in pages.items():
+            self.con.execute("UPDATE pages SET width = ?, height = ?, extracted = ?, blank = ?, "
+                "duplicate_of = ?, fingerprint = ? WHERE pageno = ?", [page.width, page.height,
+                int(page.extracted), int(page.blank), page.duplicate_of, page.fingerprint,
+                pageno])
+        element_rows = (
+            (elem.index, elem.page, elem.order, elem.x, elem.store.y[elem.index],
+                elem.store.w[elem.index], elem.store.h[elem.index], elem.fontsize, elem.text,
+                elem.state, elem.title_level)
+            for elem in elements
+        )
+        self._insert_rows('elements', ELEMENT_FIELD_COUNT, element_rows)
+        self.con.commit()
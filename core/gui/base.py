@@ -20,6 +20,10 @@ class GUIObject(Listener, GUIObjectBase):
         # The list of loaded elements have changed.
         pass
     
+    def elements_added(self):
+        # New elements, in app.added_elements, have been appended to the list of loaded elements.
+        pass
+    
     def file_opened(self):
         pass
     
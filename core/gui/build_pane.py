@@ -9,19 +9,10 @@
 import os.path as op
 from datetime import datetime
 
-import markdown
-from ebooks.html.input import HTMLInput
-from ebooks.mobi.output import convert as convert2mobi
-from ebooks.epub.output import convert as convert2epub
-from ebooks.metadata.book import Metadata
-
-from ..output import generate_markdown, wrap_html
+from ..const import EbookType
+from ..output import generate_markdown, generate_html, create_ebook
 from .base import GUIObject
 
-class EbookType:
-    MOBI = 1
-    EPUB = 2
-
 class BuildPane(GUIObject):
     #--- model -> view calls:
     # refresh() (for generation label and post processing buttons)
@@ -48,10 +39,9 @@ class BuildPane(GUIObject):
         md_path = self._current_path('txt')
         with open(md_path, 'rt', encoding='utf-8') as fp:
             md_contents = fp.read()
-        html_body = markdown.markdown(md_contents)
         dest_path = self._current_path('htm')
         with open(dest_path, 'wt', encoding='utf-8') as fp:
-            fp.write(wrap_html(html_body, 'utf-8'))
+            fp.write(generate_html(md_contents, 'utf-8'))
         return dest_path
     
     #--- Public
@@ -79,14 +69,8 @@ class BuildPane(GUIObject):
         path = self.app.view.query_save_path("Select a destination for the e-book", [allowed_ext])
         if not path:
             return
-        hi = HTMLInput()
         html_path = self._generate_html()
-        mi = Metadata(self.ebook_title, [self.ebook_author])
-        oeb = hi.create_oebbook(html_path, mi)
-        if self.selected_ebook_type == EbookType.EPUB:
-            convert2epub(oeb, path)
-        else:
-            convert2mobi(oeb, path)
+        create_ebook(html_path, path, self.selected_ebook_type, self.ebook_title, self.ebook_author)
     
     #--- Events
     def file_opened(self):
@@ -25,12 +25,7 @@ class EditPane(GUIObject):
     
     #--- Public
     def save_edits(self):
-        elements = self.app.selected_elements
-        len(elements) == 1
-        first(elements).text = self.edit_text
-        # XXX Ok, this is a horrible hack, but I'll straighten this out later
-        # we need to refresh the elements table
-        self.app.notify('elements_changed')
+        self.app.change_text_of_selected(self.edit_text)
     
     def cancel_edits(self):
         self.elements_selected()
@@ -22,7 +22,7 @@ class ElementRow(Row):
         self._y = element.y
         self._fontsize = element.fontsize
         self._text_length = len(element.text)
-        self.text = element.text.replace('\n', ' ')
+        self.text = table.display_text(element.text)
         self._state = element.state
         
         # Format
@@ -70,9 +70,12 @@ class ElementTable(GUIObject, GUITable):
         GUIObject.__init__(self, app)
         GUITable.__init__(self)
         self.columns = Columns(self)
+        # Element texts repeat a lot. We make rows with the same text share their display text.
+        self._display_texts = {}
     
     #--- Override
     def _fill(self):
+        self._display_texts = {}
         elements = self.app.elements
         if self.app.hide_ignored:
             elements = [e for e in elements if e.state != ElementState.Ignored]
@@ -85,6 +88,13 @@ class ElementTable(GUIObject, GUITable):
         self.app.select_elements(elements)
     
     #--- Public
+    def display_text(self, text):
+        result = self._display_texts.get(text)
+        if result is None:
+            result = text.replace('\n', ' ')
+            self._display_texts[text] = result
+        return result
+    
     def press_key(self, key):
         key = key.upper()
         if key not in SHORTCUTKEY2FLAG:
@@ -96,6 +106,18 @@ class ElementTable(GUIObject, GUITable):
     def elements_changed(self):
         self.refresh()
     
+    def elements_added(self):
+        if self._sort_descriptor is not None:
+            # New rows have to be sorted with the others, refresh() takes care of that.
+            self.refresh()
+            return
+        elements = self.app.added_elements
+        if self.app.hide_ignored:
+            elements = [e for e in elements if e.state != ElementState.Ignored]
+        for element in elements:
+            self.append(ElementRow(self, element))
+        self.view.refresh()
+    
     def elements_selected(self):
         selected_elements = self.app.selected_elements
         selected_indexes = []
@@ -6,7 +6,16 @@
 # which should be included with this package. The terms are also available at 
 # http://www.hardcoded.net/licenses/gplv3_license
 
-from hscommon.gui.base import GUIObject
+from ..const import ElementState
+from .base import GUIObject
+
+# (state, description) of the state counts we show
+STATE_DESCS = [
+    (ElementState.Title, "titles"),
+    (ElementState.Footnote, "footnotes"),
+    (ElementState.ToFix, "to fix"),
+    (ElementState.Ignored, "ignored"),
+]
 
 class OpenedFileLabel(GUIObject):
     #--- model -> view calls:
@@ -14,8 +23,7 @@ class OpenedFileLabel(GUIObject):
     #
     
     def __init__(self, app):
-        GUIObject.__init__(self)
-        self.app = app
+        GUIObject.__init__(self, app)
         self.text = "Working on: Nothing"
     
     def _view_updated(self):
@@ -23,5 +31,24 @@ class OpenedFileLabel(GUIObject):
     
     def refresh(self):
         self.text = "Working on: {}".format(self.app.current_path)
+        # The app's stats are updated as elements change, so we don't have to count anything.
+        stats = self.app.stats
+        details = []
+        if stats.element_count:
+            details.append("{} elements".format(stats.element_count))
+            for state, desc in STATE_DESCS:
+                if stats.state_counts[state]:
+                    details.append("{} {}".format(stats.state_counts[state], desc))
+        if self.app.loading_desc:
+            details.append(self.app.loading_desc)
+        if details:
+            self.text += " ({})".format(', '.join(details))
         self.view.refresh()
     
+    #--- Events
+    def file_opened(self):
+        self.refresh()
+    
+    def elements_changed(self):
+        self.refresh()
+    
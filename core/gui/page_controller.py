@@ -29,6 +29,9 @@ class PageController(GUIObject):
     
     @property
     def page_label(self):
+        page = self.page_repr.page
+        if page is not None and not page.extracted:
+            return "Page: {} (not read yet)".format(self.page_repr.pageno)
         return "Page: {}".format(self.page_repr.pageno)
     
     #--- Events
@@ -39,6 +42,16 @@ class PageController(GUIObject):
     def elements_changed(self):
         self.page_repr.update_page()
     
+    def elements_added(self):
+        page_repr = self.page_repr
+        if page_repr.page is None:
+            # The first page has just been added, the pageno setter will now accept it.
+            page_repr.pageno = 0
+        elif page_repr.page is not self.app.pages[page_repr.pageno]:
+            # Our page has just been read, it replaced its placeholder.
+            page_repr.update_page()
+        self.view.refresh_page_label()
+    
 
     
     
\ No newline at end of file
@@ -209,8 +209,7 @@ class PageRepresentation:
         # we also add ignore elems to our big concat so that their order value doesn't conflict
         ignored = list(self._ignored_elems())
         concat = before + neworder + after + inbetween + ignored
-        for i, elem in enumerate(concat):
-            elem.order = i
+        self.app.reorder_elements(concat)
     
     def _select_elems_in_rect(self, r):
         toselect = set()
@@ -270,8 +269,9 @@ class PageRepresentation:
     
     def update_page(self):
         if self.app.pages:
+            self.app.request_page(self.pageno)
             self.page = self.app.pages[self.pageno]
-            self.elements = [e for e in self.app.elements if e.page == self.pageno]
+            self.elements = self.app.elements_of_page(self.pageno)
         else:
             self.page = None
             self.elements = None
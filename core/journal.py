@@ -0,0 +1,243 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-14
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import os
+import threading
+import logging
+import struct
+import zlib
+
+from .store import STATE2CODE
+
+JOURNAL_EXT = '.journal'
+JOURNAL_MAGIC = b'PMJRNL\n'
+# size and crc32 of the records that follow
+CHUNK_HEADER = struct.Struct('<II')
+# kind, element id, state code, title level, order
+ELEMENT_RECORD = struct.Struct('<BIbbi')
+# kind, element id, size of the UTF-8 text that follows
+TEXT_RECORD = struct.Struct('<BII')
+# Pending records are appended at most once every FLUSH_INTERVAL seconds.
+FLUSH_INTERVAL = 1
+
+class RecordKind:
+    Element = 1
+    Text = 2
+
+
+class ChangeJournal:
+    """Sidecar file next to a project in which changes to its elements are appended.
+
+    Changes are recorded as deltas: the new state, title level and order of an element or its new
+    text, the element being identified by its index in the project's
+    :class:`core.store.ElementStore`. Records only hold new values, so replaying them more than
+    once gives the same result.
+
+    Records are buffered and a background thread appends them every ``flush_interval`` seconds.
+    Records for the same element made in the meantime are coalesced. :meth:`compact` saves the
+    whole project from that same thread and empties the journal. If the process dies, records
+    appended since the last compaction are brought back with :meth:`replay`. Like in
+    :class:`core.cache.ExtractionCheckpoint`, records are appended in chunks and a chunk that was
+    only partly written is ignored. A journal that can't be written to is not a reason to stop
+    working: records are then dropped until the next successful compaction, autosaves still going
+    on.
+    """
+    def __init__(self, project_path, flush_interval=FLUSH_INTERVAL):
+        self.project_path = project_path
+        self.path = project_path + JOURNAL_EXT
+        self.flush_interval = flush_interval
+        # Whether changes were recorded since the last compaction
+        self.dirty = False
+        self.error = None
+        # False when our file can't be written to
+        self._writable = True
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # {(kind, element id): record}
+        self._pending = {}
+        # (records, save) waiting for our thread
+        self._compaction = None
+        self._stopped = False
+        self._thread = None
+
+    #--- Private
+    def _read(self):
+        # Returns the records in our file and the offset at which the valid data ends. Raises
+        # OSError if there's no usable file.
+        records = []
+        with open(self.path, 'rb') as fp:
+            if fp.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+                raise OSError("Not a journal file")
+            offset = fp.tell()
+            while True:
+                header = fp.read(CHUNK_HEADER.size)
+                if len(header) < CHUNK_HEADER.size:
+                    break
+                size, crc = CHUNK_HEADER.unpack(header)
+                data = fp.read(size)
+                if len(data) < size or zlib.crc32(data) != crc:
+                    break
+                records.append(data)
+                offset = fp.tell()
+        return records, offset
+
+    def _append(self, records):
+        if not records or not self._writable:
+            return
+        data = b''.join(records)
+        try:
+            with open(self.path, 'ab') as fp:
+                fp.write(CHUNK_HEADER.pack(len(data), zlib.crc32(data)))
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
+        except OSError:
+            logging.warning("Could not write to the change journal at %s", self.path)
+            self._writable = False
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                compaction, self._compaction = self._compaction, None
+                stopped = self._stopped
+            try:
+                if compaction is not None:
+                    records, save = compaction
+                    self._append(list(records.values()))
+                    # save() replaces the project atomically. Until it's done, our records are
+                    # still needed.
+                    save()
+                    self.clear()
+                self._append(list(pending.values()))
+            except Exception as e:
+                logging.exception("Error while saving the project of the change journal")
+                self.error = e
+                # The next autosave will try again.
+                self.dirty = True
+            if stopped:
+                break
+
+    #--- Public
+    def replay(self, store):
+        """Applies the records of our file to ``store`` and returns the number of records.
+
+        Records for elements that aren't in ``store`` are skipped.
+        """
+        try:
+            chunks, _ = self._read()
+        except OSError:
+            return 0
+        count = 0
+        elemcount = len(store)
+        for data in chunks:
+            offset = 0
+            while offset < len(data):
+                kind = data[offset]
+                if kind == RecordKind.Element:
+                    _, index, state, title_level, order = ELEMENT_RECORD.unpack_from(data, offset)
+                    offset += ELEMENT_RECORD.size
+                    if index < elemcount:
+                        store.state[index] = state
+                        store.title_level[index] = title_level
+                        store.order[index] = order
+                elif kind == RecordKind.Text:
+                    _, index, size = TEXT_RECORD.unpack_from(data, offset)
+                    offset += TEXT_RECORD.size
+                    text = data[offset:offset+size].decode('utf-8', 'surrogatepass')
+                    offset += size
+                    if index < elemcount:
+                        store.set_text(index, text)
+                else:
+                    # Can't happen with a valid crc, unless the file comes from a newer version.
+                    break
+                count += 1
+        if count:
+            # Those changes aren't in our project yet
+            self.dirty = True
+        return count
+
+    def start(self):
+        """Starts appending records from a background thread.
+
+        Valid records already in our file are kept (call :meth:`clear` first to get rid of them).
+        """
+        try:
+            _, offset = self._read()
+            with open(self.path, 'r+b') as fp:
+                fp.truncate(offset)
+        except OSError:
+            self.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Appends pending records, waits for a pending compaction and stops our thread.
+        """
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def clear(self):
+        """Removes all records from our file.
+
+        If our file can't be written to, records are dropped until the next successful call.
+        """
+        try:
+            with open(self.path, 'wb') as fp:
+                fp.write(JOURNAL_MAGIC)
+            self._writable = True
+        except OSError:
+            logging.warning("Could not write to the change journal at %s", self.path)
+            self._writable = False
+
+    def record_elements(self, elements):
+        """Records the state, title level and order of ``elements``.
+        """
+        records = {
+            (RecordKind.Element, elem.index): ELEMENT_RECORD.pack(RecordKind.Element, elem.index,
+                STATE2CODE[elem.state], elem.title_level, elem.order)
+            for elem in elements
+        }
+        with self._lock:
+            self._pending.update(records)
+        self.dirty = True
+
+    def record_text(self, elem):
+        """Records the text of ``elem``.
+        """
+        data = elem.text.encode('utf-8', 'surrogatepass')
+        record = TEXT_RECORD.pack(RecordKind.Text, elem.index, len(data)) + data
+        with self._lock:
+            self._pending[(RecordKind.Text, elem.index)] = record
+        self.dirty = True
+
+    def compact(self, save):
+        """Has our thread call ``save()``, which saves the whole project, and empty our file.
+
+        ``save`` must work on a copy of the project, made when this is called, because it's called
+        from our thread. Changes recorded from now on are appended after the compaction.
+        """
+        with self._lock:
+            records = self._pending
+            if self._compaction is not None:
+                # Our thread hasn't gotten to the previous compaction yet. This one replaces it.
+                previous_records, _ = self._compaction
+                previous_records.update(records)
+                records = previous_records
+            self._compaction = (records, save)
+            self._pending = {}
+        self.dirty = False
+        self._wakeup.set()
@@ -0,0 +1,159 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-03
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import threading
+import logging
+import heapq
+from collections import deque
+
+from jobprogress.job import Job, JobCancelled, nulljob
+
+class BackgroundLoader:
+    """Consumes a ``(Page, elements)`` iterator in a separate thread.
+
+    Results are buffered until the main thread picks them up with :meth:`pop_results`. We never
+    touch the app's pages and elements from our thread because GUI objects iterate over them.
+
+    The iterator is created by ``iterator_factory(j)``, ``j`` being a job reporting its progress to
+    us. That job is also how we cancel the iteration (it raises :exc:`JobCancelled`).
+    """
+    def __init__(self, iterator_factory):
+        self._iterator_factory = iterator_factory
+        self._lock = threading.Lock()
+        self._results = []
+        self._cancelled = False
+        self._available = threading.Event()
+        self._thread = None
+        self.progress_desc = ''
+        self.finished = False
+        self.error = None
+
+    #--- Private
+    def _update_progress(self, progress, desc=''):
+        if desc:
+            self.progress_desc = desc
+        return not self._cancelled
+
+    def _run(self):
+        try:
+            j = Job(1, self._update_progress)
+            for result in self._iterator_factory(j):
+                with self._lock:
+                    self._results.append(result)
+                self._available.set()
+        except JobCancelled:
+            pass
+        except Exception as e:
+            logging.exception("Error while loading pages in the background")
+            self.error = e
+        finally:
+            self.finished = True
+            self._available.set()
+
+    #--- Public
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def wait(self, j=nulljob):
+        """Blocks until we have results or until we're finished.
+
+        ``j`` is checked for cancellation while we wait. If it's cancelled, so are we.
+        """
+        while not self._available.wait(0.1):
+            try:
+                j.check_if_cancelled()
+            except JobCancelled:
+                self.cancel()
+                raise
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def pop_results(self):
+        """Returns the results that were produced since the last call and forget about them.
+        """
+        with self._lock:
+            result = self._results
+            self._results = []
+        return result
+
+
+class PageQueue:
+    """Page numbers that are left to read, in the order in which they should be read.
+
+    Pages are read in ascending order, except for pages that are explicitly requested (and the
+    ``prefetch`` pages following them), which jump the queue. The queue can be iterated over in a
+    thread while pages are requested or added from another one. Its length is the total number of
+    pages that were queued.
+    """
+    def __init__(self, pagenos, prefetch=3):
+        self._lock = threading.Lock()
+        self._remaining = set(pagenos)
+        self._popped = set()
+        self._sequential = sorted(self._remaining) # a sorted list is a valid heap
+        self._requested = deque()
+        self.prefetch = prefetch
+
+    def __iter__(self):
+        while True:
+            pageno = self._pop()
+            if pageno is None:
+                return
+            yield pageno
+
+    def __len__(self):
+        return len(self._remaining) + len(self._popped)
+
+    #--- Private
+    def _pop(self):
+        with self._lock:
+            while self._requested:
+                pageno = self._requested.popleft()
+                if pageno in self._remaining:
+                    break
+            else:
+                while self._sequential:
+                    pageno = heapq.heappop(self._sequential)
+                    if pageno in self._remaining:
+                        break
+                else:
+                    return None
+            self._remaining.remove(pageno)
+            self._popped.add(pageno)
+            return pageno
+
+    #--- Public
+    def add(self, pagenos):
+        """Queues ``pagenos``. Pages that were already queued are ignored.
+        """
+        with self._lock:
+            for pageno in pagenos:
+                if pageno in self._remaining or pageno in self._popped:
+                    continue
+                self._remaining.add(pageno)
+                heapq.heappush(self._sequential, pageno)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._remaining)
+
+    def request(self, pageno):
+        """Puts ``pageno`` and the ``prefetch`` pages following it at the front of the queue.
+
+        Only pages that are in the queue are affected.
+        """
+        with self._lock:
+            wanted = range(pageno, pageno + self.prefetch + 1)
+            wanted = [p for p in wanted if p in self._remaining]
+            self._requested.extendleft(reversed(wanted))
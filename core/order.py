@@ -0,0 +1,143 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-10
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from collections import defaultdict
+
+from .const import ElementState
+
+# Indexes in our (left, right, top, bottom, index, elem) boxes. top and bottom are negated pdfminer
+# y positions so that, like x positions, they grow in reading direction. index is the position of
+# the box in the list of all boxes of the page.
+LEFT, RIGHT, TOP, BOTTOM, INDEX, ELEM = range(6)
+
+def _gaps(boxes, start, end):
+    # Returns the gaps in the projection on one axis of boxes, sorted by ``start`` (start and end
+    # being the indexes of the box's interval on that axis), as (index, gap_start, gap_end), index
+    # being that of the first box after the gap.
+    result = []
+    reach = boxes[0][end]
+    for index, box in enumerate(boxes):
+        if box[start] > reach:
+            result.append((index, reach, box[start]))
+        reach = max(reach, box[end])
+    return result
+
+def _split(boxes, start, end):
+    # Splits boxes, sorted by ``start``, at each gap of their projection. Groups are sorted like
+    # boxes.
+    bounds = [0] + [index for index, _, _ in _gaps(boxes, start, end)] + [len(boxes)]
+    return [boxes[i:j] for i, j in zip(bounds, bounds[1:])]
+
+def _common_gaps(gaps1, gaps2):
+    # Returns the intersection of two sorted lists of (gap_start, gap_end).
+    result = []
+    i = j = 0
+    while i < len(gaps1) and j < len(gaps2):
+        gap_start = max(gaps1[i][0], gaps2[j][0])
+        gap_end = min(gaps1[i][1], gaps2[j][1])
+        if gap_start < gap_end:
+            result.append((gap_start, gap_end))
+        if gaps1[i][1] < gaps2[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+def _partition(boxes, groups, group_of):
+    # Returns ``boxes`` split in the same groups as ``groups``, keeping the order of ``boxes``.
+    for groupno, group in enumerate(groups):
+        for box in group:
+            group_of[box[INDEX]] = groupno
+    result = [[] for _ in groups]
+    for box in boxes:
+        result[group_of[box[INDEX]]].append(box)
+    return result
+
+def _row_blocks(rows, rows_by_x):
+    # Returns rows, sorted by y, grouped in blocks of consecutive rows sharing a gutter. Such a
+    # block is a multi-column part of the page and will be cut in columns.
+    blocks = []
+    block_gutters = []
+    for row, row_by_x in zip(rows, rows_by_x):
+        gutters = [(gap_start, gap_end) for _, gap_start, gap_end in _gaps(row_by_x, LEFT, RIGHT)]
+        common = _common_gaps(block_gutters, gutters) if blocks else []
+        if common:
+            blocks[-1] += row
+            block_gutters = common
+        else:
+            blocks.append(list(row))
+            block_gutters = gutters
+    return blocks
+
+def xycut_order(elements):
+    """Returns ``elements`` sorted in reading order, as determined by a recursive XY-cut.
+
+    When there are gaps running through the whole height of a group of elements (gutters between
+    columns), we cut the group there. Otherwise, we cut it between its rows, consecutive rows with
+    a gutter in common staying together. We then cut each group again until groups can't be cut
+    anymore. Groups are read left to right and top to bottom. An uncuttable group is read top to
+    bottom.
+
+    Elements are sorted once on each axis. Each group keeps its elements in both orders, so cutting
+    a group takes linear time. We don't recurse: there's no limit to how deep cuts can go.
+    """
+    boxes = []
+    for index, elem in enumerate(elements):
+        x, y, w, h = elem.rect
+        boxes.append((x, x + w, -(y + h), -y, index, elem))
+    group_of = [0] * len(boxes)
+    result = []
+    # Each group is a (boxes by x, boxes by y) tuple.
+    stack = []
+    if boxes:
+        by_x = sorted(boxes, key=lambda box: (box[LEFT], box[TOP]))
+        by_y = sorted(boxes, key=lambda box: (box[TOP], box[LEFT]))
+        stack.append((by_x, by_y))
+    while stack:
+        by_x, by_y = stack.pop()
+        if len(by_y) == 1:
+            result.append(by_y[0][ELEM])
+            continue
+        columns = _split(by_x, LEFT, RIGHT)
+        if len(columns) > 1:
+            groups = list(zip(columns, _partition(by_y, columns, group_of)))
+        else:
+            rows = _split(by_y, TOP, BOTTOM)
+            if len(rows) == 1:
+                result += [box[ELEM] for box in by_y]
+                continue
+            blocks = _row_blocks(rows, _partition(by_x, rows, group_of))
+            groups = list(zip(_partition(by_x, blocks, group_of), blocks))
+        # The stack is LIFO, so we push the first group last
+        stack += reversed(groups)
+    return result
+
+def compute_page_order(elements):
+    """Returns ``elements``, all from the same page, in the order they should get.
+
+    Like when reordering manually, ignored elements aren't part of the order and come last, in the
+    order in which they were given.
+    """
+    active = [e for e in elements if e.state != ElementState.Ignored]
+    ignored = [e for e in elements if e.state == ElementState.Ignored]
+    return xycut_order(active) + ignored
+
+def compute_document_order(elements, j):
+    """Returns a ``{element: order}`` dict for all ``elements`` based on :func:`xycut_order`.
+
+    ``j`` is a job reporting progress page by page.
+    """
+    page2elements = defaultdict(list)
+    for elem in elements:
+        page2elements[elem.page].append(elem)
+    result = {}
+    pagenos = sorted(page2elements)
+    for pageno in j.iter_with_progress(pagenos, "Ordering page %i of %i"):
+        for order, elem in enumerate(compute_page_order(page2elements[pageno])):
+            result[elem] = order
+    return result
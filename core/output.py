@@ -8,7 +8,13 @@
 
 import re
 
-from .const import ElementState
+import markdown
+from ebooks.html.input import HTMLInput
+from ebooks.mobi.output import convert as convert2mobi
+from ebooks.epub.output import convert as convert2epub
+from ebooks.metadata.book import Metadata
+
+from .const import ElementState, EbookType
 
 RE_STARTING_NUMBER = re.compile(r'^(\d+)')
 
@@ -78,4 +84,20 @@ def generate_markdown(elements):
         s = s.strip()
         paragraphs.append(s)
     s = '\n\n'.join(paragraphs)
-    return s
\ No newline at end of file
+    return s
+
+def generate_html(md_contents, encoding='utf-8'):
+    """Converts markdown generated by generate_markdown() into a full HTML document.
+    """
+    return wrap_html(markdown.markdown(md_contents), encoding)
+
+def create_ebook(html_path, dest_path, ebook_type, title='', author=''):
+    """Converts the HTML document at ``html_path`` into a ``ebook_type`` e-book at ``dest_path``.
+    """
+    hi = HTMLInput()
+    mi = Metadata(title, [author])
+    oeb = hi.create_oebbook(html_path, mi)
+    if ebook_type == EbookType.EPUB:
+        convert2epub(oeb, dest_path)
+    else:
+        convert2mobi(oeb, dest_path)
@@ -7,17 +7,31 @@
 # http://www.hardcoded.net/licenses/gplv3_license
 
 import re
+import hashlib
+import multiprocessing
+from itertools import islice
+from time import perf_counter
 
 from pdfminer.pdfparser import PDFParser, PDFDocument
+from pdfminer.pdftypes import PDFObjRef, PDFStream, resolve1
 from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.layout import LAParams, LTChar, LTTextBoxHorizontal
+from pdfminer.layout import (LAParams, LTChar, LTContainer, LTTextBoxHorizontal, LTFigure,
+    LTPage)
 from pdfminer.converter import PDFPageAggregator
 
 from hscommon.geometry import Rect, Line
 from hscommon.util import extract, remove_invalid_xml
 from jobprogress.job import nulljob
 
-from .const import ElementState
+from .const import ElementState, ExtractionProfile
+from .spatial import RectGrid
+from .report import ExtractionReport, PageReport
+
+PROGRESS_MSG = "Reading page %i of %i"
+# page_fingerprint() of pages on which nothing is drawn
+BLANK_FINGERPRINT = 'blank'
+# Content streams bigger than this (before decoding) are never considered empty
+MAX_BLANK_STREAM_SIZE = 64
 
 ###### PDF Wisdom (some wisdom gathered about pdf/pdfminer during the development of this unit)
 # 
@@ -67,68 +81,548 @@ class Page:
     def __init__(self, width, height):
         self.width = width
         self.height = height
+        # False for placeholder pages (see read_pages()) that haven't been laid out yet.
+        self.extracted = True
+        # True for pages on which nothing is drawn
+        self.blank = False
+        # Number of the first page with the exact same contents, if any. Elements of such a page
+        # are copies of the elements of that first page.
+        self.duplicate_of = None
+        # content_fingerprint() of the page, if it was extracted
+        self.fingerprint = None
     
     
-def extract_text_elements_from_pdf(path, j=nulljob):
-    """Opens a PDF and extract every element that is text based (LTText).
-    """
-    fp = open(path, 'rb')
-    doc = PDFDocument(caching=True)
+def create_laparams():
+    return LAParams(all_texts=True, paragraph_indent=5, heuristic_word_margin=True)
+
+def open_document(fp, caching=True):
+    # Without caching, pdfminer re-parses objects every time they're needed instead of keeping
+    # every object (page content streams included) it ever parsed in memory.
+    doc = PDFDocument(caching=caching)
     parser = PDFParser(fp)
     parser.set_document(doc)
     doc.set_parser(parser)
     doc.initialize()
-    rsrcmgr = PDFResourceManager()
-    laparams = LAParams(all_texts=True, paragraph_indent=5, heuristic_word_margin=True)
-    device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    return doc
+
+def read_pages(path):
+    """Returns a placeholder :class:`Page` for each page of the PDF at ``path``.
+    
+    This is fast because pages aren't laid out: we only read their sizes.
+    """
+    with open(path, 'rb') as fp:
+        doc = open_document(fp)
+        result = []
+        for page in doc.get_pages():
+            placeholder = Page(*page_size(page))
+            placeholder.extracted = False
+            result.append(placeholder)
+    return result
+
+def page_size(pdfpage):
+    """Returns the ``(width, height)`` a pdfminer ``pdfpage`` has once laid out.
+    """
+    # This computation mirrors what PDFPageAggregator does with mediabox and rotation.
+    x0, y0, x1, y1 = pdfpage.mediabox
+    width, height = abs(x1 - x0), abs(y1 - y0)
+    if pdfpage.rotate in {90, 270}:
+        width, height = height, width
+    return width, height
+
+def _object_signature(obj):
+    # Returns a string describing a PDF object without resolving its references. Two objects with
+    # the same signature are the same object.
+    if isinstance(obj, PDFObjRef):
+        return 'R{}'.format(obj.objid)
+    if isinstance(obj, dict):
+        items = sorted((str(key), _object_signature(value)) for key, value in obj.items())
+        return '<<{}>>'.format(' '.join('{} {}'.format(key, value) for key, value in items))
+    if isinstance(obj, list):
+        return '[{}]'.format(' '.join(_object_signature(value) for value in obj))
+    return repr(obj)
+
+def page_fingerprint(pdfpage):
+    """Returns a digest of the contents of a pdfminer ``pdfpage``.
+    
+    Pages with the same fingerprint are laid out identically. We hash the raw content streams
+    along with the page's geometry and resources. Resources are identified by object id, so
+    identical pages only have the same fingerprint if they share their fonts and forms, which is
+    how inserted ads and repeated title pages are usually made. It's much cheaper than a layout,
+    but it still requires reading content streams.
+    
+    Returns :data:`BLANK_FINGERPRINT` for pages with nothing in their content streams.
+    """
+    streams = [resolve1(stream) for stream in pdfpage.contents]
+    streams = [stream for stream in streams if isinstance(stream, PDFStream)]
+    datas = [
+        (b'raw', stream.rawdata) if stream.rawdata is not None else (b'data', stream.data)
+        for stream in streams
+    ]
+    if all(len(data or b'') <= MAX_BLANK_STREAM_SIZE for _, data in datas):
+        # Empty streams are usually compressed. Small streams are cheap to decode.
+        if not any(stream.get_data().strip() for stream in streams):
+            return BLANK_FINGERPRINT
+    h = hashlib.sha1()
+    signature = [pdfpage.mediabox, pdfpage.cropbox, pdfpage.rotate, pdfpage.resources]
+    h.update(_object_signature(signature).encode('utf-8'))
+    for kind, data in datas:
+        data = data or b''
+        h.update(kind + str(len(data)).encode('ascii'))
+        h.update(data)
+    return h.hexdigest()
+
+def content_fingerprint(pdfpage):
+    """Returns a digest of the decoded content streams and geometry of a pdfminer ``pdfpage``.
+    
+    Unlike :func:`page_fingerprint`, it doesn't depend on object ids, so it stays the same for
+    unchanged pages when a PDF is regenerated. Resources aren't hashed at all: a page that only
+    had its fonts or images swapped is considered unchanged. We use it to tell which pages of a
+    rewritten PDF have to be extracted again. Streams are decoded, but the pages we extract have
+    them decoded already.
+    """
+    h = hashlib.sha1()
+    geometry = [pdfpage.mediabox, pdfpage.cropbox, pdfpage.rotate]
+    h.update(_object_signature(geometry).encode('utf-8'))
+    for stream in pdfpage.contents:
+        stream = resolve1(stream)
+        if isinstance(stream, PDFStream):
+            data = stream.get_data()
+            h.update(str(len(data)).encode('ascii'))
+            h.update(data)
+    return h.hexdigest()
+
+def reuse_page(pdfpage, pageno, fingerprint, seen, report=None):
+    """Returns a ``(Page, elements)`` tuple for ``pdfpage`` if it doesn't need to be laid out.
+    
+    That's the case for blank pages and for pages whose ``fingerprint`` is in ``seen``, a
+    ``{fingerprint: (pageno, (Page, elements))}`` dict of the pages that were laid out so far.
+    Elements of a duplicate page are copies of the elements of its first occurrence. Returns
+    ``None`` if the page has to be laid out.
+    """
+    if fingerprint == BLANK_FINGERPRINT:
+        page = Page(*page_size(pdfpage))
+        page.blank = True
+        page.fingerprint = content_fingerprint(pdfpage)
+        elements = []
+    elif fingerprint in seen:
+        firstno, (firstpage, firstelements) = seen[fingerprint]
+        page = Page(firstpage.width, firstpage.height)
+        page.duplicate_of = firstno
+        page.fingerprint = firstpage.fingerprint
+        elements = []
+        for firstelem in firstelements:
+            elem = TextElement(Rect(*firstelem.rect), firstelem.fontsize, firstelem.text)
+            elem.page = pageno
+            elem.order = firstelem.order
+            elements.append(elem)
+    else:
+        return None
+    if report is not None:
+        report.add_reused_page(pageno, page, len(elements))
+    return page, elements
+
+def _extract_or_reuse_page(interpreter, device, pdfpage, pageno, seen, report, profile, texts):
+    fingerprint = page_fingerprint(pdfpage)
+    result = reuse_page(pdfpage, pageno, fingerprint, seen, report)
+    if result is None:
+        result = extract_page(interpreter, device, pdfpage, pageno, report, profile, texts)
+        seen[fingerprint] = (pageno, result)
+    return result
+
+class TextOnlyPageInterpreter(PDFPageInterpreter):
+    """Page interpreter that doesn't render XObjects (forms and images) or inline images.
+    
+    Figures are never interpreted, so no text is extracted from them.
+    """
+    def do_Do(self, xobjid):
+        pass
+    
+    def do_EI(self, obj):
+        pass
+    
+
+class UngroupedLTPage(LTPage):
+    """Page layout that keeps its textboxes in the order in which they're drawn.
+    
+    pdfminer orders textboxes by grouping them hierarchically, which is quadratic in the number of
+    boxes and takes most of the layout time on dense pages. The drawing order is often the reading
+    order anyway (pdfminer itself falls back to it on pages with more than 100 boxes).
+    """
+    def group_textboxes(self, laparams, boxes):
+        # Boxes are normally analyzed through their group. Our caller doesn't do it for us.
+        for index, box in enumerate(boxes):
+            box.analyze(laparams)
+            box.index = index
+        return []
+    
+
+class UngroupedPageAggregator(PDFPageAggregator):
+    def begin_page(self, page, ctm):
+        PDFPageAggregator.begin_page(self, page, ctm)
+        self.cur_item = UngroupedLTPage(self.pageno, self.cur_item.bbox)
+    
+
+def create_interpreter(caching=True, profile=ExtractionProfile.Accurate):
+    """Returns a ``(interpreter, device)`` pair ready to process pages with our layout params.
+    
+    If ``caching`` is false, fonts aren't kept from one page to the next.
+    """
+    rsrcmgr = PDFResourceManager(caching=caching)
+    if profile == ExtractionProfile.Fast:
+        device = UngroupedPageAggregator(rsrcmgr, laparams=create_laparams())
+        interpreter = TextOnlyPageInterpreter(rsrcmgr, device)
+    else:
+        device = PDFPageAggregator(rsrcmgr, laparams=create_laparams())
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+    return interpreter, device
+
+def extract_page(interpreter, device, page, pageno, report=None,
+        profile=ExtractionProfile.Accurate, texts=None):
+    """Lays out ``page`` and returns a ``(Page, elements)`` tuple for it.
+    
+    ``interpreter`` and ``device`` come from :func:`create_interpreter`, which must have been
+    called with the same ``profile``. ``texts`` is passed to :func:`create_element`. Use the same
+    dict for all pages of a document.
+    
+    If ``report`` (a :class:`core.report.ExtractionReport`) is given, the time spent in each stage
+    of the extraction is added to it.
+    """
+    started_at = perf_counter()
+    interpreter.process_page(page)
+    page_layout = device.get_result()
+    laid_out_at = perf_counter()
+    if profile == ExtractionProfile.Fast:
+        textboxes = walk_textboxes_by_line(page_layout)
+    else:
+        textboxes = walk_textboxes(page_layout)
+    elements = [
+        create_element(box, totheight / charcount, texts)
+        for box, charcount, totheight in textboxes
+    ]
+    result_page = Page(page_layout.width, page_layout.height)
+    result_page.fingerprint = content_fingerprint(page)
+    # The device holds on to the layout until the next page is processed. A layout is much bigger
+    # than the elements we get from it, so we don't want it to stay around needlessly.
+    device.result = device.cur_item = page_layout = None
+    created_at = perf_counter()
+    created_count = len(elements)
+    merge_oneletter_elems(elements)
+    merged_at = perf_counter()
+    for i, elem in enumerate(elements):
+        elem.page = pageno
+        elem.order = i
+    if report is not None:
+        report.add_page(PageReport(pageno, laid_out_at - started_at, created_at - laid_out_at,
+            merged_at - created_at, len(elements), created_count - len(elements)))
+    return result_page, elements
+
+# When extracting in parallel, each worker process opens its own copy of the document once (in
+# _init_worker()) and then lays out the pages it's being sent. We can't share pdfminer objects
+# between processes, but Page and TextElement pickle just fine.
+_worker_state = None
+
+def _init_worker(path, profile):
+    global _worker_state
+    fp = open(path, 'rb')
+    doc = open_document(fp)
+    interpreter, device = create_interpreter(profile=profile)
+    _worker_state = (list(doc.get_pages()), interpreter, device, profile, {})
+
+def _extract_page_in_worker(pageno):
+    # Returns a (result, page_report) tuple. The page report is added to the main report by the
+    # parent process.
+    pdfpages, interpreter, device, profile, texts = _worker_state
+    report = ExtractionReport()
+    result = extract_page(interpreter, device, pdfpages[pageno], pageno, report, profile, texts)
+    return result, report.pages[0]
+
+def _iter_extracted_pages_parallel(path, pagenos, processes, j, report=None,
+        profile=ExtractionProfile.Accurate):
+    # Pages are fingerprinted up front and only the first occurrence of each page is sent to
+    # workers. Duplicate and blank pages are filled in here as we go.
+    # Pages are sent to workers in chunks so that a worker usually processes consecutive pages,
+    # but chunks are small enough for the load to stay balanced. imap() yields results in the
+    # order of `to_extract`, which lets us report progress exactly like the serial path does.
+    started_at = perf_counter()
+    with open(path, 'rb') as fp:
+        pdfpages = list(open_document(fp).get_pages())
+        fingerprints = {pageno: page_fingerprint(pdfpages[pageno]) for pageno in pagenos}
+    first_occurrences = {}
+    for pageno in pagenos:
+        first_occurrences.setdefault(fingerprints[pageno], pageno)
+    to_extract = [
+        pageno for pageno in pagenos
+        if first_occurrences[fingerprints[pageno]] == pageno
+        and fingerprints[pageno] != BLANK_FINGERPRINT
+    ]
+    if report is not None:
+        report.parse_duration += perf_counter() - started_at
+    chunksize = max(1, len(to_extract) // (processes * 4))
+    initargs = (path, profile)
+    seen = {}
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+        results = pool.imap(_extract_page_in_worker, to_extract, chunksize)
+        for pageno in j.iter_with_progress(pagenos, PROGRESS_MSG):
+            fingerprint = fingerprints[pageno]
+            result = reuse_page(pdfpages[pageno], pageno, fingerprint, seen, report)
+            if result is None:
+                result, page_report = next(results)
+                if report is not None:
+                    report.add_page(page_report)
+                seen[fingerprint] = (pageno, result)
+            yield result
+
+def _iter_extracted_pages_serial(doc, j, report=None, low_memory=False,
+        profile=ExtractionProfile.Accurate, first_pageno=0):
+    interpreter, device = create_interpreter(caching=not low_memory, profile=profile)
+    started_at = perf_counter()
+    if low_memory:
+        # A page holds on to its content streams, so we don't keep pages around. We only count
+        # them (for progress reporting) and then go through them a second time.
+        pagecount = sum(1 for _ in doc.get_pages())
+        enumerated_pages = islice(enumerate(doc.get_pages()), first_pageno, None)
+    else:
+        enumerated_pages = list(enumerate(doc.get_pages()))
+        pagecount = len(enumerated_pages)
+        del enumerated_pages[:first_pageno]
+    if report is not None:
+        report.parse_duration += perf_counter() - started_at
+    progress = j.iter_with_progress(range(first_pageno, pagecount), PROGRESS_MSG)
+    texts = {}
+    seen = {}
+    for _, (pageno, page) in zip(progress, enumerated_pages):
+        yield _extract_or_reuse_page(interpreter, device, page, pageno, seen, report, profile,
+            texts)
+
+def _group_by_page(pages, elements):
+    # Returns a list of elements for each page in ``pages``, which start at page 0.
+    page2elements = [[] for _ in pages]
+    for elem in elements:
+        page2elements[elem.page].append(elem)
+    return page2elements
+
+def iter_text_elements_from_pdf(path, j=nulljob, processes=1, cache=None, report=None,
+        low_memory=False, profile=ExtractionProfile.Accurate, checkpoint=None):
+    """Opens a PDF and yields a ``(Page, elements)`` tuple for each of its pages, in order.
+    
+    Pages are yielded as soon as they're laid out, which lets the caller work with the beginning of
+    a document while the rest of it is still being processed. See
+    :func:`extract_text_elements_from_pdf` for arguments.
+    """
+    if cache is not None or checkpoint is not None:
+        keyer = cache if cache is not None else checkpoint
+        key = keyer.key_for(path, create_laparams(), profile)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            pages, all_elements = cached
+            if report is not None:
+                report.cache_hit = True
+            page2elements = _group_by_page(pages, all_elements)
+            yield from zip(j.iter_with_progress(pages, PROGRESS_MSG), page2elements)
+            if report is not None:
+                report.finish()
+            return
+    started_at = perf_counter()
+    fp = open(path, 'rb')
+    # We open the document in the main process even when extracting in parallel. It lets
+    # PDFSyntaxError be raised here rather than in a worker, and it tells us our page count.
+    doc = open_document(fp, caching=not low_memory)
+    if checkpoint is not None:
+        pages, all_elements = checkpoint.resume(key)
+    else:
+        pages, all_elements = [], []
+    if low_memory:
+        # Each worker would have to hold its own copy of the document
+        processes = 1
+    if processes > 1:
+        pagecount = sum(1 for _ in doc.get_pages())
+        processes = min(processes, pagecount - len(pages))
+    if report is not None:
+        report.parse_duration += perf_counter() - started_at
+    # Pages resumed from the checkpoint come first
+    yield from zip(pages, _group_by_page(pages, all_elements))
+    if processes > 1:
+        fp.close()
+        pagenos = range(len(pages), pagecount)
+        extracted = _iter_extracted_pages_parallel(path, pagenos, processes, j, report, profile)
+    else:
+        extracted = _iter_extracted_pages_serial(doc, j, report, low_memory, profile,
+            first_pageno=len(pages))
+    try:
+        for page, elements in extracted:
+            pages.append(page)
+            all_elements += elements
+            if checkpoint is not None:
+                checkpoint.add(page, elements)
+            yield page, elements
+    except BaseException:
+        # Cancelled or failed. Whatever was extracted so far will be resumed next time.
+        if checkpoint is not None:
+            checkpoint.flush()
+        raise
+    if checkpoint is not None:
+        checkpoint.discard()
+    if cache is not None:
+        cache.put(key, pages, all_elements)
+    if report is not None:
+        report.finish()
+
+def iter_text_elements_from_pages(path, pagenos, j=nulljob, report=None,
+        profile=ExtractionProfile.Accurate):
+    """Yields ``(pageno, (Page, elements))`` for each page number in ``pagenos``, in that order.
+    
+    ``pagenos`` is consumed lazily, so it can be a queue that is added to while we iterate over it.
+    It has to support ``len()``, which we use for progress reporting.
+    """
+    started_at = perf_counter()
+    fp = open(path, 'rb')
+    doc = open_document(fp)
+    pdfpages = list(doc.get_pages())
+    if report is not None:
+        report.parse_duration += perf_counter() - started_at
+    interpreter, device = create_interpreter(profile=profile)
+    texts = {}
+    seen = {}
+    j.start_job(len(pagenos), PROGRESS_MSG % (0, len(pagenos)))
+    for i, pageno in enumerate(pagenos, start=1):
+        pdfpage = pdfpages[pageno]
+        yield pageno, _extract_or_reuse_page(interpreter, device, pdfpage, pageno, seen, report,
+            profile, texts)
+        # len(pagenos) can grow as we go
+        j.add_progress(desc=PROGRESS_MSG % (i, len(pagenos)))
+    if report is not None:
+        report.finish()
+
+def extract_text_elements_from_pdf(path, j=nulljob, processes=1, cache=None, pagenos=None,
+        report=None, low_memory=False, profile=ExtractionProfile.Accurate, checkpoint=None):
+    """Opens a PDF and extract every element that is text based (LTText).
+    
+    If ``processes`` is higher than 1, pages are laid out in a pool of that many worker processes.
+    The result is the same as with a serial extraction.
+    
+    If ``cache`` (an :class:`core.cache.ExtractionCache`) is given, we first look for a previous
+    result for the same PDF contents and settings in it, and store our result there otherwise.
+    
+    If ``pagenos`` is given, only those pages are extracted. The returned page list still has an
+    item for every page of the PDF, but the pages that weren't extracted are placeholders (see
+    :func:`read_pages`). The cache isn't used for partial extractions.
+    
+    If ``report`` (a :class:`core.report.ExtractionReport`) is given, it's filled with timings for
+    each page and extraction stage.
+    
+    If ``low_memory`` is true, we trade some speed for a lower peak memory usage: pdfminer doesn't
+    cache parsed objects and fonts, pages are read from the document one at a time and extraction
+    is always serial. Use it for big documents or when running many extractions in parallel.
+    
+    ``profile`` is an :class:`core.const.ExtractionProfile`. With the fast profile, figures and
+    images are skipped, textboxes are ordered as they're drawn rather than through pdfminer's
+    (slow) grouping and font sizes are estimated from line heights rather than from every
+    character.
+    
+    If ``checkpoint`` (a :class:`core.cache.ExtractionCheckpoint`) is given, extracted pages are
+    regularly saved in it. If the extraction is cancelled or if the process dies, the next
+    extraction with the same checkpoint resumes where this one stopped. Like the cache, the
+    checkpoint isn't used for partial extractions.
+    """
+    if pagenos is not None:
+        return _extract_text_elements_from_pages(path, pagenos, j, processes, report, profile)
     pages = []
     all_elements = []
-    enumerated_pages = list(enumerate(doc.get_pages()))
-    progress_msg = "Reading page %i of %i"
-    for pageno, page in j.iter_with_progress(enumerated_pages, progress_msg):
-        interpreter.process_page(page)
-        page_layout = device.get_result()
-        pages.append(Page(page_layout.width, page_layout.height))
-        textboxes = extract_textboxes(page_layout)
-        elements = [create_element(box) for box in textboxes]
-        merge_oneletter_elems(elements)
-        for i, elem in enumerate(elements):
-            elem.page = pageno
-            elem.order = i
+    extracted = iter_text_elements_from_pdf(path, j, processes=processes, cache=cache,
+        report=report, low_memory=low_memory, profile=profile, checkpoint=checkpoint)
+    for page, elements in extracted:
+        pages.append(page)
         all_elements += elements
     return pages, all_elements
 
-def create_element(layout_element):
+def _extract_text_elements_from_pages(path, pagenos, j, processes, report, profile):
+    pages = read_pages(path)
+    pagenos = sorted({pageno for pageno in pagenos if 0 <= pageno < len(pages)})
+    processes = min(processes, len(pagenos))
+    if processes > 1:
+        extracted = _iter_extracted_pages_parallel(path, pagenos, processes, j, report, profile)
+        extracted = zip(pagenos, extracted)
+    else:
+        extracted = iter_text_elements_from_pages(path, pagenos, j, report, profile)
+    all_elements = []
+    for pageno, (page, elements) in extracted:
+        pages[pageno] = page
+        all_elements += elements
+    if report is not None:
+        report.finish()
+    return pages, all_elements
+
+def create_element(layout_element, fontsize, texts=None):
+    """Creates a :class:`TextElement` from ``layout_element``.
+    
+    ``texts``, if given, is a dict in which texts are interned. Running headers, footers and page
+    numbers repeat on many pages and this way, elements with the same text share the same string.
+    """
     rect = Rect(layout_element.x0, layout_element.y0, layout_element.width, layout_element.height)
-    chars = extract_chars(layout_element)
-    fontsize = get_avg_text_height(chars)
     text = fix_text(layout_element.get_text())
+    if texts is not None:
+        text = texts.setdefault(text, text)
     return TextElement(rect, fontsize, text)
 
-def extract_from_elem(elem, lookfor):
-    if isinstance(elem, lookfor):
-        return [elem]
-    else:
-        try:
-            return sum((extract_from_elem(subelem, lookfor) for subelem in elem), [])
-        except TypeError:
-            return []
-
-def extract_chars(elem):
-    """Returns a list of chars contained (possibly recursively) in `elem`.
+def walk_textboxes(layout):
+    """Returns a ``(textbox, charcount, totheight)`` tuple for each textbox in ``layout``.
+    
+    ``charcount`` is the number of LTChar (possibly recursively) contained in the textbox and
+    ``totheight`` is the sum of their height. It's all gathered in a single, non-recursive walk
+    through the layout tree. Textboxes come in the same order as in a depth-first traversal.
     """
-    return extract_from_elem(elem, lookfor=LTChar)
+    result = []
+    stack = [iter(layout)]
+    box = None
+    box_depth = 0 # The stack size at which we entered our current textbox
+    charcount = 0
+    totheight = 0
+    while stack:
+        elem = next(stack[-1], None)
+        if elem is None:
+            stack.pop()
+            if box is not None and len(stack) < box_depth:
+                result.append((box, charcount, totheight))
+                box = None
+        elif isinstance(elem, LTChar):
+            if box is not None:
+                charcount += 1
+                totheight += elem.height
+        elif isinstance(elem, LTContainer):
+            if box is None and isinstance(elem, LTTextBoxHorizontal):
+                box = elem
+                box_depth = len(stack) + 1
+                charcount = 0
+                totheight = 0
+            stack.append(iter(elem))
+    return result
 
-def extract_textboxes(elem):
-    return extract_from_elem(elem, lookfor=LTTextBoxHorizontal)
-
-def get_avg_text_height(chars):
-    """Returns the average height of LTChar elements contained in `text_container`.
+def walk_textboxes_by_line(layout):
+    """Same as :func:`walk_textboxes`, but without going through characters.
+    
+    ``totheight`` is the sum of the height of each line of the textbox multiplied by its number of
+    characters, which is the same as summing character heights when a line has a single font size.
+    Contents of figures are skipped.
     """
-    count = len(chars)
-    totheight = sum(c.height for c in chars)
-    return totheight / count
+    result = []
+    stack = [iter(layout)]
+    while stack:
+        elem = next(stack[-1], None)
+        if elem is None:
+            stack.pop()
+        elif isinstance(elem, LTTextBoxHorizontal):
+            charcount = 0
+            totheight = 0
+            for line in elem:
+                # Our count includes the LTAnno (spaces and newlines) pdfminer inserts in lines
+                count = len(line)
+                charcount += count
+                totheight += line.height * count
+            result.append((elem, charcount, totheight))
+        elif isinstance(elem, LTContainer) and not isinstance(elem, LTFigure):
+            stack.append(iter(elem))
+    return result
 
 def merge_oneletter_elems(elements):
     # we go through all one-lettered boxes, we check if it intersects with any other rect. In
@@ -136,18 +630,30 @@ def merge_oneletter_elems(elements):
     # of the paragraph.
     # HOWEVER, We must not forget that Y-positions in pdfminer layout is upside down. The bottom of
     # the page is 0 and the top is the max y-pos.
+    # Pages can have thousands of one-letter elements (math, tables, broken kerning) so we look for
+    # intersecting rects through a grid index rather than comparing every pair. Candidates are
+    # checked in the same order as `others` so that we pick the same element a full scan would.
     oneletter, others = extract(lambda e: len(e.text.strip()) == 1, elements)
+    if not oneletter:
+        return
+    grid = RectGrid()
+    for index, elem2 in enumerate(others):
+        grid.insert(index, elem2.rect)
+    merged = set()
     for elem1 in oneletter:
         rect = elem1.rect
-        for elem2 in others:
+        for index in sorted(grid.query(rect)):
+            elem2 = others[index]
             otherrect = elem2.rect
             if rect.intersects(otherrect):
                 corner = rect.corners()[1]
                 line = Line(otherrect.center(), corner)
                 if line.dx() < 0 and line.dy() > 0:
                     elem2.text = elem1.text.strip() + elem2.text
-                    elements.remove(elem1)
+                    merged.add(elem1)
                     break
+    if merged:
+        elements[:] = [e for e in elements if e not in merged]
 
 RE_MULTIPLE_SPACES = re.compile(r' {2,}')
 RE_NEWLINE_AND_SPACE = re.compile(r' \n |\n | \n')
@@ -0,0 +1,372 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-12
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+"""Reads and writes PdfMasher projects (``.masherproj`` files).
+
+Projects come in three formats, which are detected automatically when loading:
+
+* XML: an ``<element>`` tag with an attribute for each element attribute. Easy to read, but slow
+  to load and save when there are hundreds of thousands of elements. It's read and written as a
+  stream, so memory usage stays flat.
+* Binary: the columns of a :class:`core.store.ElementStore`, dumped and loaded as whole arrays,
+  followed by the text table. It's written as a header followed by sections:
+
+  - ``MAGIC``, then ``HEADER``: format version, page count, element count and text count.
+  - The PDF path, as a text section.
+  - Page columns (see ``PAGE_COLUMNS``), then page fingerprints as a text section.
+  - Element columns (see ``ELEMENT_COLUMNS``).
+  - Text occurrence counts (``TEXT_COUNTS_TYPECODE``), then texts as a text section.
+
+  A text section is an array of ``count + 1`` character offsets (``OFFSETS_TYPECODE``), the size
+  of the UTF-8 blob that follows (``BLOB_SIZE``) and the blob, which is all texts concatenated.
+
+  Numbers are little endian and columns use fixed-width types, whatever the platform.
+* SQLite: a database with a row per element, indexed by page and by state. Changes can be written
+  as single-row updates instead of a rewrite of the whole project. See :mod:`core.database`.
+
+Usage: python -m core.project (--xml | --binary | --sqlite) <source> <dest>
+"""
+
+import sys
+import os
+import os.path as op
+import struct
+from array import array
+from argparse import ArgumentParser
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from hscommon.geometry import Rect
+from jobprogress.job import nulljob
+
+from .pdf import Page, TextElement
+from .store import ElementStore, TextTable, STATES
+from .database import DatabaseProject, SQLITE_MAGIC
+
+class ProjectFormat:
+    XML = 'xml'
+    Binary = 'binary'
+    SQLite = 'sqlite'
+
+MAGIC = b'PMPROJ\n'
+BINARY_VERSION = 1
+HEADER = struct.Struct('<IIII')
+BLOB_SIZE = struct.Struct('<Q')
+OFFSETS_TYPECODE = 'q'
+TEXT_COUNTS_TYPECODE = 'i'
+# (attribute, file typecode) of the columns of pages and of the element store, in file order.
+PAGE_COLUMNS = [
+    ('width', 'd'),
+    ('height', 'd'),
+    ('extracted', 'b'),
+    ('blank', 'b'),
+    ('duplicate_of', 'i'), # -1 for None
+]
+ELEMENT_COLUMNS = [
+    ('page', 'i'),
+    ('order', 'i'),
+    ('x', 'd'),
+    ('y', 'd'),
+    ('w', 'd'),
+    ('h', 'd'),
+    ('fontsize', 'd'),
+    ('state', 'b'),
+    ('title_level', 'b'),
+    ('text_id', 'i'),
+]
+# Typecodes of the store's columns, which aren't always the same as in the file.
+STORE_TYPECODES = {attrname: getattr(ElementStore(), attrname).typecode
+    for attrname, _ in ELEMENT_COLUMNS}
+NEEDS_BYTESWAP = sys.byteorder == 'big'
+# Entities, on top of &, < and >, that we escape in XML attribute values
+XML_ATTR_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'}
+# Number of elements between progress updates when loading
+PROGRESS_INTERVAL = 1000
+
+class InvalidProjectError(Exception):
+    pass
+
+
+#--- Private
+def _write_array(fp, typecode, values):
+    if isinstance(values, array) and values.typecode == typecode and not NEEDS_BYTESWAP:
+        arr = values
+    else:
+        arr = array(typecode, values)
+    if NEEDS_BYTESWAP:
+        arr.byteswap()
+    arr.tofile(fp)
+
+def _read_array(fp, typecode, count):
+    arr = array(typecode)
+    try:
+        arr.fromfile(fp, count)
+    except (EOFError, ValueError):
+        raise InvalidProjectError("Truncated project file")
+    if NEEDS_BYTESWAP:
+        arr.byteswap()
+    return arr
+
+def _write_texts(fp, texts):
+    offsets = array(OFFSETS_TYPECODE, [0])
+    position = 0
+    for text in texts:
+        position += len(text)
+        offsets.append(position)
+    blob = ''.join(texts).encode('utf-8', 'surrogatepass')
+    _write_array(fp, OFFSETS_TYPECODE, offsets)
+    fp.write(BLOB_SIZE.pack(len(blob)))
+    fp.write(blob)
+
+def _read_texts(fp, count):
+    offsets = _read_array(fp, OFFSETS_TYPECODE, count + 1)
+    try:
+        [blob_size] = BLOB_SIZE.unpack(fp.read(BLOB_SIZE.size))
+    except struct.error:
+        raise InvalidProjectError("Truncated project file")
+    blob = fp.read(blob_size)
+    if len(blob) != blob_size:
+        raise InvalidProjectError("Truncated project file")
+    # Offsets are in characters. We decode the blob once and slice the resulting string.
+    try:
+        alltext = blob.decode('utf-8', 'surrogatepass')
+    except UnicodeDecodeError:
+        raise InvalidProjectError("Corrupted project file")
+    return [alltext[start:end] for start, end in zip(offsets, offsets[1:])]
+
+def _xml_attr(value):
+    # Like ElementTree, we escape whitespace so that it survives attribute value normalization.
+    return '"{}"'.format(escape(value, XML_ATTR_ENTITIES))
+
+def _save_xml_project(fp, pdfpath, pages, elements):
+    # We write tags as we go rather than building a tree, so memory usage doesn't depend on the
+    # size of the project. The output is the same as what ElementTree writes.
+    write = fp.write
+    write('<pdfmasher-project pdfpath={}>'.format(_xml_attr(pdfpath)))
+    for page in pages:
+        attrs = 'width="{}" height="{}"'.format(page.width, page.height)
+        if not page.extracted:
+            attrs += ' extracted="0"'
+        if page.fingerprint is not None:
+            attrs += ' fingerprint="{}"'.format(page.fingerprint)
+        write('<page {} />'.format(attrs))
+    for elem in elements:
+        write('<element page="{}" order="{}" rect="{} {} {} {}" fontsize="{}" text={} state="{}" '
+            'title_level="{}" />'.format(elem.page, elem.order, *elem.rect, elem.fontsize,
+            _xml_attr(elem.text), elem.state, elem.title_level))
+    write('</pdfmasher-project>')
+
+def _load_xml_project(fp, j):
+    # We go through the file with iterparse() and clear tags as soon as we've read them, so we
+    # never hold more than a few of them in memory. Progress is reported by file position.
+    def str2rect(s):
+        elems = s.split(' ')
+        assert len(elems) == 4
+        return Rect(*map(float, elems))
+
+    fp.seek(0, os.SEEK_END)
+    j.start_job(fp.tell(), "Loading project")
+    fp.seek(0)
+    pdfpath = None
+    pages = []
+    store = ElementStore()
+    root = None
+    for event, tag in ET.iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = tag
+                pdfpath = root.attrib['pdfpath']
+            continue
+        attrs = tag.attrib
+        if tag.tag == 'page':
+            width = float(attrs['width'])
+            height = float(attrs['height'])
+            page = Page(width, height)
+            page.extracted = attrs.get('extracted') != '0'
+            page.fingerprint = attrs.get('fingerprint')
+            pages.append(page)
+        elif tag.tag == 'element':
+            rect = str2rect(attrs['rect'])
+            fontsize = float(attrs['fontsize'])
+            text = attrs['text']
+            elem = TextElement(rect, fontsize, text)
+            elem.page = int(attrs['page'])
+            elem.order = int(attrs['order'])
+            elem.state = attrs['state']
+            elem.title_level = int(attrs['title_level'])
+            store.append(elem)
+            if len(store) % PROGRESS_INTERVAL == 0:
+                j.set_progress(fp.tell())
+        else:
+            continue
+        # Clearing the root gets rid of the tags we've read so far
+        root.clear()
+    if pdfpath is None:
+        raise InvalidProjectError("Not a project file")
+    return pdfpath, pages, store
+
+def _save_binary_project(fp, pdfpath, pages, store, indexes):
+    fp.write(MAGIC)
+    fp.write(HEADER.pack(BINARY_VERSION, len(pages), len(indexes), len(store.texts)))
+    _write_texts(fp, [pdfpath])
+    for attrname, typecode in PAGE_COLUMNS:
+        values = [getattr(page, attrname) for page in pages]
+        if attrname == 'duplicate_of':
+            values = [-1 if value is None else value for value in values]
+        _write_array(fp, typecode, values)
+    _write_texts(fp, [page.fingerprint or '' for page in pages])
+    in_store_order = indexes == range(len(store))
+    for attrname, typecode in ELEMENT_COLUMNS:
+        column = getattr(store, attrname)
+        if not in_store_order:
+            column = [column[index] for index in indexes]
+        _write_array(fp, typecode, column)
+    texts = store.texts
+    _write_array(fp, TEXT_COUNTS_TYPECODE, texts.counts)
+    _write_texts(fp, [texts[textid] for textid in range(len(texts))])
+
+def _check_column(column, limit, desc):
+    # Raises InvalidProjectError unless all values of ``column`` are in ``range(limit)``.
+    if column and (min(column) < 0 or max(column) >= limit):
+        raise InvalidProjectError("Corrupted project file (invalid {})".format(desc))
+
+def _load_binary_project(fp, j):
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise InvalidProjectError("Not a binary project file")
+    try:
+        version, pagecount, elemcount, textcount = HEADER.unpack(fp.read(HEADER.size))
+    except struct.error:
+        raise InvalidProjectError("Truncated project file")
+    if version > BINARY_VERSION:
+        raise InvalidProjectError("This project was saved by a newer version of PdfMasher")
+    [pdfpath] = _read_texts(fp, 1)
+    page_columns = {
+        attrname: _read_array(fp, typecode, pagecount) for attrname, typecode in PAGE_COLUMNS
+    }
+    fingerprints = _read_texts(fp, pagecount)
+    pages = []
+    for pageno in range(pagecount):
+        page = Page(page_columns['width'][pageno], page_columns['height'][pageno])
+        page.extracted = bool(page_columns['extracted'][pageno])
+        page.blank = bool(page_columns['blank'][pageno])
+        duplicate_of = page_columns['duplicate_of'][pageno]
+        page.duplicate_of = duplicate_of if duplicate_of >= 0 else None
+        page.fingerprint = fingerprints[pageno] or None
+        pages.append(page)
+    store = ElementStore()
+    for attrname, typecode in j.iter_with_progress(ELEMENT_COLUMNS, "Loading column %i of %i"):
+        column = _read_array(fp, typecode, elemcount)
+        store_typecode = STORE_TYPECODES[attrname]
+        if store_typecode != typecode:
+            column = array(store_typecode, column)
+        setattr(store, attrname, column)
+    counts = _read_array(fp, TEXT_COUNTS_TYPECODE, textcount)
+    texts = _read_texts(fp, textcount)
+    # Arrays load whatever they're given. We check the values that are used as indexes so that a
+    # corrupted file fails here rather than anywhere an element is used.
+    _check_column(store.page, pagecount, "page number")
+    _check_column(store.state, len(STATES), "state")
+    _check_column(store.text_id, textcount, "text id")
+    store.texts = TextTable.from_texts(texts, counts)
+    return pdfpath, pages, store
+
+#--- Public
+def detect_project_format(path):
+    """Returns the :class:`ProjectFormat` of the project at ``path``.
+    """
+    with open(path, 'rb') as fp:
+        header = fp.read(len(SQLITE_MAGIC))
+    if header.startswith(MAGIC):
+        return ProjectFormat.Binary
+    if header == SQLITE_MAGIC:
+        return ProjectFormat.SQLite
+    return ProjectFormat.XML
+
+def load_project(path, j=nulljob):
+    """Loads the project at ``path``, whatever its format, reporting progress to ``j``.
+
+    Returns a ``(pdfpath, pages, store)`` tuple, ``store`` being a
+    :class:`core.store.ElementStore` with the elements of the project in their saved order.
+    """
+    project_format = detect_project_format(path)
+    if project_format == ProjectFormat.SQLite:
+        project_db = DatabaseProject(path)
+        try:
+            return project_db.read(j)
+        finally:
+            project_db.close()
+    with open(path, 'rb') as fp:
+        if project_format == ProjectFormat.Binary:
+            return _load_binary_project(fp, j)
+        else:
+            return _load_xml_project(fp, j)
+
+def save_project(path, pdfpath, pages, elements, project_format=ProjectFormat.XML):
+    """Saves ``pages`` and ``elements`` of the PDF at ``pdfpath`` in a project at ``path``.
+
+    In the binary and SQLite formats, ``elements`` have to be views on the same
+    :class:`core.store.ElementStore`. In the SQLite format, the whole store is saved, in store
+    order. The project is written to a temporary file which then replaces the file at ``path``, so
+    a save that fails halfway leaves the previous project intact.
+    """
+    tmp_path = path + '.tmp{}'.format(os.getpid())
+    try:
+        if project_format == ProjectFormat.SQLite:
+            store = elements[0].store if elements else ElementStore()
+            if op.exists(tmp_path):
+                os.remove(tmp_path)
+            project_db = DatabaseProject(tmp_path, create=True)
+            try:
+                project_db.write(pdfpath, pages, store)
+            finally:
+                project_db.close()
+        elif project_format == ProjectFormat.Binary:
+            if elements:
+                store = elements[0].store
+                indexes = [elem.index for elem in elements]
+                if indexes == list(range(len(store))):
+                    indexes = range(len(store))
+            else:
+                store = ElementStore()
+                indexes = range(0)
+            with open(tmp_path, 'wb') as fp:
+                _save_binary_project(fp, pdfpath, pages, store, indexes)
+        else:
+            with open(tmp_path, 'wt', encoding='utf-8') as fp:
+                _save_xml_project(fp, pdfpath, pages, elements)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def convert_project(source, dest, project_format):
+    """Converts the project at ``source`` into ``project_format`` and saves it at ``dest``.
+    """
+    pdfpath, pages, store = load_project(source)
+    save_project(dest, pdfpath, pages, list(store), project_format)
+
+def main(args=None):
+    parser = ArgumentParser(description="Converts PdfMasher projects between formats.")
+    parser.add_argument('source', help="Project to convert (any format)")
+    parser.add_argument('dest', help="Path of the converted project")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--xml', dest='project_format', action='store_const',
+        const=ProjectFormat.XML, help="Convert to XML")
+    group.add_argument('--binary', dest='project_format', action='store_const',
+        const=ProjectFormat.Binary, help="Convert to the binary format")
+    group.add_argument('--sqlite', dest='project_format', action='store_const',
+        const=ProjectFormat.SQLite, help="Convert to a SQLite database")
+    options = parser.parse_args(args)
+    convert_project(options.source, options.dest, options.project_format)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-12
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+"""Brings a document up to date with a PDF that was rewritten since it was extracted.
+
+Pages are compared through their :func:`core.pdf.content_fingerprint`. Unchanged pages keep their
+elements as they are (classification and edits included), even if they moved around in the PDF.
+Changed pages are extracted again and their new elements take the state, title level and order
+of the old elements they match.
+"""
+
+from collections import defaultdict
+
+from .store import ElementStore
+
+# Elements whose text changed are matched with an old element whose top left corner is within
+# that many points of theirs. Their size, however, changes with their text.
+POSITION_TOLERANCE = 2
+
+def map_unchanged_pages(old_pages, fingerprints):
+    """Returns a ``{new_pageno: old_pageno}`` dict for the pages whose contents didn't change.
+
+    ``fingerprints`` are the content fingerprints of the new pages. Only extracted old pages are
+    mapped and each old page is mapped at most once.
+    """
+    fingerprint2pagenos = defaultdict(list)
+    for pageno, page in enumerate(old_pages):
+        if page.extracted and page.fingerprint is not None:
+            fingerprint2pagenos[page.fingerprint].append(pageno)
+    result = {}
+    for new_pageno, fingerprint in enumerate(fingerprints):
+        old_pagenos = fingerprint2pagenos.get(fingerprint)
+        if not old_pagenos:
+            continue
+        # When a page is repeated, we prefer the old page with the same number
+        old_pageno = new_pageno if new_pageno in old_pagenos else old_pagenos[0]
+        old_pagenos.remove(old_pageno)
+        result[new_pageno] = old_pageno
+    return result
+
+def _same_place(elem1, elem2):
+    return (abs(elem1.x - elem2.x) <= POSITION_TOLERANCE
+        and abs(elem1.y - elem2.y) <= POSITION_TOLERANCE)
+
+def carry_over(old_elements, new_elements):
+    """Gives ``new_elements`` the state and title level of the ``old_elements`` they match.
+
+    Both lists are the elements of a single page. An element matches the old element with the
+    same text that is the closest to it or, failing that, an old element at the same place.
+    New elements are then ordered like the old elements they match. Unmatched elements come
+    after, in the order they already have. Returns the number of matched elements.
+    """
+    text2olds = defaultdict(list)
+    for old in old_elements:
+        text2olds[old.text].append(old)
+    matches = {}
+    unmatched = []
+    for new in new_elements:
+        candidates = text2olds.get(new.text)
+        if not candidates:
+            unmatched.append(new)
+            continue
+        x, y = new.x, new.y
+        old = min(candidates, key=lambda e: abs(e.x - x) + abs(e.y - y))
+        candidates.remove(old)
+        matches[new] = old
+    if unmatched:
+        remaining = [old for olds in text2olds.values() for old in olds]
+        for new in unmatched:
+            for old in remaining:
+                if _same_place(old, new):
+                    remaining.remove(old)
+                    matches[new] = old
+                    break
+    for new, old in matches.items():
+        new.state = old.state
+        new.title_level = old.title_level
+    unmatched_order = len(old_elements)
+    ordered = sorted(new_elements,
+        key=lambda e: (matches[e].order, 0) if e in matches else (unmatched_order, e.order))
+    for order, elem in enumerate(ordered):
+        elem.order = order
+    return len(matches)
+
+def rebuild_document(old_pages, old_elements, new_pages, page_map, page2elements):
+    """Returns a ``(store, elements)`` tuple for the refreshed document.
+
+    ``new_pages`` are the pages of the rewritten PDF and ``page_map`` comes from
+    :func:`map_unchanged_pages`. ``page2elements`` maps the number of each page that was extracted
+    again to its new elements, which are matched with the elements of the old page with the same
+    number (see :func:`carry_over`), unless that old page was kept as another page. Elements of
+    unchanged pages are copied as they are.
+    """
+    old_page2elements = defaultdict(list)
+    for elem in old_elements:
+        old_page2elements[elem.page].append(elem)
+    kept_pagenos = set(page_map.values())
+    store = ElementStore()
+    elements = []
+    for pageno in range(len(new_pages)):
+        if pageno in page_map:
+            copied = store.extend(old_page2elements[page_map[pageno]])
+            for elem in copied:
+                elem.page = pageno
+            elements += copied
+        elif pageno in page2elements:
+            new_elements = page2elements[pageno]
+            if pageno not in kept_pagenos:
+                carry_over(old_page2elements.get(pageno, []), new_elements)
+            elements += store.extend(new_elements)
+    return store, elements
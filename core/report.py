@@ -0,0 +1,159 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-08
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from time import perf_counter
+
+from hscommon.plat import ISWINDOWS, ISOSX
+
+if not ISWINDOWS:
+    import resource
+
+def peak_memory_usage():
+    """Returns the peak resident memory of the current process, in bytes.
+    
+    This is a high-water mark for the whole life of the process. Returns ``None`` on Windows, where
+    we have no cheap way to get it.
+    """
+    if ISWINDOWS:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on OS X, but in kilobytes on Linux
+    return maxrss if ISOSX else maxrss * 1024
+
+class ExtractionStage:
+    # Opening the document and reading its page tree
+    Parse = 'parse'
+    # interpreter.process_page(), that is, pdfminer's interpretation and layout analysis
+    Layout = 'layout'
+    # Walking the layout and creating our TextElement instances (with fix_text())
+    Elements = 'elements'
+    # merge_oneletter_elems()
+    Merge = 'merge'
+
+PAGE_STAGES = [ExtractionStage.Layout, ExtractionStage.Elements, ExtractionStage.Merge]
+
+class PageReport:
+    """Time spent on each extraction stage for a page, in seconds, and the resulting counts.
+    """
+    def __init__(self, pageno, layout, elements, merge, element_count, merged_count):
+        self.pageno = pageno
+        self.durations = {
+            ExtractionStage.Layout: layout,
+            ExtractionStage.Elements: elements,
+            ExtractionStage.Merge: merge,
+        }
+        self.element_count = element_count
+        # Number of one-letter elements that were merged into another element
+        self.merged_count = merged_count
+
+    def __repr__(self):
+        return '<PageReport {} {:.3f}s {} elements>'.format(self.pageno, self.total_duration,
+            self.element_count)
+
+    @property
+    def total_duration(self):
+        return sum(self.durations.values())
+
+
+class ExtractionReport:
+    """Collects timings of a PDF extraction.
+
+    An extraction function that is given a report calls :meth:`add_page` for each page it
+    extracts. Recording a page costs a few ``perf_counter()`` calls, so it's fine to always pass a
+    report. Pages are recorded in the order in which they're extracted, which isn't always page
+    order.
+    """
+    def __init__(self):
+        self.started_at = perf_counter()
+        self.finished_at = None
+        self.parse_duration = 0
+        self.cache_hit = False
+        self.pages = []
+        # Numbers of the pages that weren't laid out because they were blank or duplicates
+        self.blank_pages = []
+        self.duplicate_pages = []
+        # Peak memory of the process at the time the extraction finished. See peak_memory_usage().
+        self.peak_memory = None
+
+    #--- Public
+    def add_page(self, page_report):
+        self.pages.append(page_report)
+
+    def add_reused_page(self, pageno, page, element_count):
+        """Records ``page`` (a :class:`core.pdf.Page`), which is blank or a duplicate.
+        """
+        self.add_page(PageReport(pageno, 0, 0, 0, element_count, 0))
+        if page.blank:
+            self.blank_pages.append(pageno)
+        else:
+            self.duplicate_pages.append(pageno)
+
+    def finish(self):
+        self.finished_at = perf_counter()
+        self.peak_memory = peak_memory_usage()
+
+    def stage_totals(self):
+        """Returns a dict of total seconds spent on each :class:`ExtractionStage`.
+        """
+        result = {stage: 0 for stage in PAGE_STAGES}
+        for page_report in self.pages:
+            for stage, duration in page_report.durations.items():
+                result[stage] += duration
+        result[ExtractionStage.Parse] = self.parse_duration
+        return result
+
+    def slowest_pages(self, count=10):
+        return sorted(self.pages, key=lambda p: p.total_duration, reverse=True)[:count]
+
+    def as_dict(self):
+        """Returns the report as a structure of plain dicts and lists, ready to be serialized.
+        """
+        return {
+            'wall_time': self.wall_time,
+            'cache_hit': self.cache_hit,
+            'blank_pages': self.blank_pages,
+            'duplicate_pages': self.duplicate_pages,
+            'element_count': self.element_count,
+            'peak_memory': self.peak_memory,
+            'stages': self.stage_totals(),
+            'pages': [
+                {
+                    'pageno': p.pageno,
+                    'durations': dict(p.durations),
+                    'element_count': p.element_count,
+                    'merged_count': p.merged_count,
+                }
+                for p in self.pages
+            ],
+        }
+
+    def summary(self):
+        """Returns a short human readable description of the report.
+        """
+        lines = ["{} pages, {} elements in {:.2f}s".format(len(self.pages), self.element_count,
+            self.wall_time)]
+        if self.cache_hit:
+            lines.append("(from the extraction cache)")
+        if self.blank_pages or self.duplicate_pages:
+            lines.append("{} blank and {} duplicate pages skipped".format(len(self.blank_pages),
+                len(self.duplicate_pages)))
+        if self.peak_memory is not None:
+            lines.append("peak memory: {:.1f} MB".format(self.peak_memory / (1024 * 1024)))
+        for stage, duration in sorted(self.stage_totals().items(), key=lambda t: -t[1]):
+            lines.append("  {}: {:.2f}s".format(stage, duration))
+        return '\n'.join(lines)
+
+    #--- Properties
+    @property
+    def element_count(self):
+        return sum(p.element_count for p in self.pages)
+
+    @property
+    def wall_time(self):
+        end = self.finished_at if self.finished_at is not None else perf_counter()
+        return end - self.started_at
@@ -0,0 +1,249 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-11
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+"""Rules that classify elements in bulk.
+
+A rule is a set of conditions on element features (font size percentile, text length, position on
+the page, text pattern, page parity) along with the state (and title level) to give to elements
+matching all of them. Rule sets are saved in XML files so that they can be reused on every
+document of a recurring publication::
+
+    <pdfmasher-rules>
+        <rule state="title" title_level="1" min_fontsize_percentile="98" max_length="80" />
+        <rule state="ignored" max_position="0.05" parity="even" />
+        <rule state="footnote" min_position="0.85" pattern="^\\d+ " />
+    </pdfmasher-rules>
+"""
+
+import re
+from bisect import bisect_left
+from xml.etree import ElementTree as ET
+
+from .const import ElementState
+from .store import STATE2CODE
+
+class PageParity:
+    # Parities are those of page numbers as a reader sees them. The first page is odd.
+    Odd = 'odd'
+    Even = 'even'
+
+# (attribute, type) of the conditions a rule can have, in the order in which they're evaluated.
+# Cheap conditions come first so that expensive ones run on fewer elements.
+CONDITIONS = [
+    ('parity', str),
+    ('min_fontsize_percentile', float),
+    ('max_fontsize_percentile', float),
+    ('min_position', float),
+    ('max_position', float),
+    ('min_length', int),
+    ('max_length', int),
+    ('pattern', str),
+]
+
+class Rule:
+    """Gives ``state`` (and ``title_level``, for titles) to elements matching all conditions.
+
+    Conditions that are ``None`` aren't checked.
+
+    * ``min_fontsize_percentile``/``max_fontsize_percentile``: Percentage (0-100) of the elements
+      of the document that have a smaller font size than the element.
+    * ``min_length``/``max_length``: Number of characters in the element's text.
+    * ``min_position``/``max_position``: Position of the element's top on its page, from 0 (top)
+      to 1 (bottom).
+    * ``pattern``: Regexp searched for in the element's text.
+    * ``parity``: A :class:`PageParity`.
+
+    ``title_level`` goes from 1 to 6, like HTML headings.
+    """
+    def __init__(self, state, title_level=1, **conditions):
+        if state not in STATE2CODE:
+            raise ValueError("Invalid state: {}".format(state))
+        if conditions.get('parity') not in {None, PageParity.Odd, PageParity.Even}:
+            raise ValueError("Invalid parity: {}".format(conditions['parity']))
+        if not 1 <= title_level <= 6:
+            raise ValueError("Invalid title level: {}".format(title_level))
+        self.state = state
+        self.title_level = title_level
+        for attrname, _ in CONDITIONS:
+            setattr(self, attrname, conditions.pop(attrname, None))
+        if conditions:
+            raise TypeError("Unknown conditions: {}".format(', '.join(conditions)))
+        if self.pattern is not None:
+            try:
+                re.compile(self.pattern)
+            except re.error as e:
+                raise ValueError("Invalid pattern: {}".format(e))
+
+    def __repr__(self):
+        conditions = ' '.join('{}={!r}'.format(attrname, value) for attrname, value in
+            self.conditions())
+        return '<Rule {} {}>'.format(self.state, conditions)
+
+    def conditions(self):
+        """Returns the ``(attrname, value)`` of the conditions this rule checks.
+        """
+        result = []
+        for attrname, _ in CONDITIONS:
+            value = getattr(self, attrname)
+            if value is not None:
+                result.append((attrname, value))
+        return result
+
+
+#--- Private
+class _Features:
+    # Features of the elements of a store, computed once per apply_rules() call. Features that
+    # only depend on the text are computed once per distinct text.
+    def __init__(self, store, pages):
+        self.store = store
+        self.pages = pages
+        self._percentiles = None
+        self._positions = None
+        self._lengths = None
+
+    @property
+    def percentiles(self):
+        if self._percentiles is None:
+            fontsizes = self.store.fontsize
+            ordered = sorted(fontsizes)
+            count = len(ordered)
+            size2percentile = {
+                size: bisect_left(ordered, size) * 100 / count for size in set(fontsizes)
+            }
+            self._percentiles = [size2percentile[size] for size in fontsizes]
+        return self._percentiles
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            heights = [page.height or 1 for page in self.pages]
+            store = self.store
+            self._positions = [
+                (heights[pageno] - (y + h)) / heights[pageno]
+                for pageno, y, h in zip(store.page, store.y, store.h)
+            ]
+        return self._positions
+
+    @property
+    def lengths(self):
+        if self._lengths is None:
+            texts = self.store.texts
+            self._lengths = [len(texts[textid]) for textid in range(len(texts))]
+        return self._lengths
+
+    def filter(self, indexes, attrname, value):
+        store = self.store
+        if attrname == 'parity':
+            remainder = 0 if value == PageParity.Odd else 1
+            page = store.page
+            return [i for i in indexes if page[i] % 2 == remainder]
+        if attrname == 'min_fontsize_percentile':
+            percentiles = self.percentiles
+            return [i for i in indexes if percentiles[i] >= value]
+        if attrname == 'max_fontsize_percentile':
+            percentiles = self.percentiles
+            return [i for i in indexes if percentiles[i] <= value]
+        if attrname == 'min_position':
+            positions = self.positions
+            return [i for i in indexes if positions[i] >= value]
+        if attrname == 'max_position':
+            positions = self.positions
+            return [i for i in indexes if positions[i] <= value]
+        text_id = store.text_id
+        if attrname == 'min_length':
+            lengths = self.lengths
+            return [i for i in indexes if lengths[text_id[i]] >= value]
+        if attrname == 'max_length':
+            lengths = self.lengths
+            return [i for i in indexes if lengths[text_id[i]] <= value]
+        if attrname == 'pattern':
+            regexp = re.compile(value)
+            texts = store.texts
+            matches = {}
+            result = []
+            for i in indexes:
+                textid = text_id[i]
+                matched = matches.get(textid)
+                if matched is None:
+                    matched = matches[textid] = regexp.search(texts[textid]) is not None
+                if matched:
+                    result.append(i)
+            return result
+        raise ValueError(attrname)
+
+
+#--- Public
+def apply_rules(rules, store, pages):
+    """Applies ``rules`` to the elements of ``store`` and returns the indexes of changed elements.
+
+    ``store`` is a :class:`core.store.ElementStore` and ``pages`` are the pages of its document.
+    Like :func:`core.classify.classify_titles`, only elements in the Normal state are touched, so
+    manual classification is kept. When more than one rule match an element, the first one wins.
+    Each condition of a rule is checked in a single pass over the elements left by the previous
+    condition.
+    """
+    features = _Features(store, pages)
+    normal = STATE2CODE[ElementState.Normal]
+    remaining = [i for i, state in enumerate(store.state) if state == normal]
+    result = []
+    for rule in rules:
+        if not remaining:
+            break
+        matching = remaining
+        for attrname, value in rule.conditions():
+            matching = features.filter(matching, attrname, value)
+        if not matching:
+            continue
+        code = STATE2CODE[rule.state]
+        for i in matching:
+            store.state[i] = code
+        if rule.state == ElementState.Title:
+            for i in matching:
+                store.title_level[i] = rule.title_level
+        matched = set(matching)
+        remaining = [i for i in remaining if i not in matched]
+        result += matching
+    return sorted(result)
+
+def load_rules(path):
+    """Returns the list of :class:`Rule` saved in the rule file at ``path``.
+
+    Raises ``ValueError`` if a rule has no state, an invalid value or an unknown attribute (a
+    misspelled condition would otherwise be silently ignored).
+    """
+    root = ET.parse(path).getroot()
+    result = []
+    for rule_elem in root.iter('rule'):
+        attrs = dict(rule_elem.attrib)
+        if 'state' not in attrs:
+            raise ValueError("Rule without a state")
+        state = attrs.pop('state')
+        title_level = int(attrs.pop('title_level', 1))
+        conditions = {}
+        for attrname, attrtype in CONDITIONS:
+            if attrname in attrs:
+                conditions[attrname] = attrtype(attrs.pop(attrname))
+        if attrs:
+            raise ValueError("Unknown rule attributes: {}".format(', '.join(sorted(attrs))))
+        result.append(Rule(state, title_level, **conditions))
+    return result
+
+def save_rules(rules, path):
+    """Saves ``rules`` in a rule file at ``path``.
+    """
+    root = ET.Element('pdfmasher-rules')
+    for rule in rules:
+        rule_elem = ET.SubElement(root, 'rule')
+        rule_elem.set('state', rule.state)
+        if rule.state == ElementState.Title:
+            rule_elem.set('title_level', str(rule.title_level))
+        for attrname, value in rule.conditions():
+            rule_elem.set(attrname, str(value))
+    tree = ET.ElementTree(root)
+    with open(path, 'wb') as fp:
+        tree.write(fp, encoding='utf-8')
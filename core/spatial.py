@@ -0,0 +1,48 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-05
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from collections import defaultdict
+
+class RectGrid:
+    """Spatial index of rects on a uniform grid.
+
+    Each key is registered in every cell its rect overlaps. :meth:`query` then only has to look at
+    the cells overlapped by the query rect, which makes finding rects that may intersect with
+    another one close to constant time. Cells are closed on both ends, like
+    :meth:`hscommon.geometry.Rect.intersects`, so rects that merely touch are still candidates.
+    """
+    def __init__(self, cellsize=64):
+        self.cellsize = cellsize
+        self._cells = defaultdict(list)
+
+    def _cells_for(self, rect):
+        size = self.cellsize
+        x1 = int(rect.x // size)
+        x2 = int((rect.x + rect.w) // size)
+        y1 = int(rect.y // size)
+        y2 = int((rect.y + rect.h) // size)
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                yield cx, cy
+
+    def insert(self, key, rect):
+        for cell in self._cells_for(rect):
+            self._cells[cell].append(key)
+
+    def query(self, rect):
+        """Returns the set of keys that might intersect with ``rect``.
+
+        This is a superset of the intersecting keys: callers still have to check for the actual
+        intersection.
+        """
+        result = set()
+        cells = self._cells
+        for cell in self._cells_for(rect):
+            if cell in cells:
+                result.update(cells[cell])
+        return result
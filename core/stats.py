@@ -0,0 +1,96 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-11
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from collections import Counter
+
+def _rounded_fontsize(elem):
+    # Font sizes are compared with a precision of 0.1, like in core.classify.
+    return round(elem.fontsize, 1)
+
+class DocumentStats:
+    """Statistics on the elements of a document.
+
+    The index is never rebuilt from scratch: it's updated with the elements that are added or
+    changed. Whoever changes an element's state or text has to tell us with :meth:`change_state` or
+    :meth:`change_text`. The GUI shows our counts in the opened file label.
+
+    * ``fontsize_histogram``: Number of elements for each font size (rounded to 0.1).
+    * ``fontsize_chars``: Number of characters for each font size (rounded to 0.1).
+    * ``page_counts``: Number of elements on each page.
+    * ``text_lengths``: Number of elements for each text length.
+    * ``state_counts``: Number of elements in each state.
+    """
+    def __init__(self, elements=()):
+        self.fontsize_histogram = Counter()
+        self.fontsize_chars = Counter()
+        self.page_counts = Counter()
+        self.text_lengths = Counter()
+        self.state_counts = Counter()
+        self.element_count = 0
+        self.add(elements)
+
+    #--- Public
+    def add(self, elements):
+        fontsize_histogram = self.fontsize_histogram
+        fontsize_chars = self.fontsize_chars
+        page_counts = self.page_counts
+        text_lengths = self.text_lengths
+        state_counts = self.state_counts
+        count = 0
+        for elem in elements:
+            fontsize = _rounded_fontsize(elem)
+            length = len(elem.text)
+            fontsize_histogram[fontsize] += 1
+            fontsize_chars[fontsize] += length
+            page_counts[elem.page] += 1
+            text_lengths[length] += 1
+            state_counts[elem.state] += 1
+            count += 1
+        self.element_count += count
+
+    def change_state(self, elem, oldstate):
+        """Updates the index after the state of ``elem`` changed from ``oldstate``.
+        """
+        if elem.state == oldstate:
+            return
+        self.state_counts[oldstate] -= 1
+        if not self.state_counts[oldstate]:
+            del self.state_counts[oldstate]
+        self.state_counts[elem.state] += 1
+
+    def change_text(self, elem, oldtext):
+        """Updates the index after the text of ``elem`` changed from ``oldtext``.
+        """
+        oldlength = len(oldtext)
+        newlength = len(elem.text)
+        if newlength == oldlength:
+            return
+        self.text_lengths[oldlength] -= 1
+        if not self.text_lengths[oldlength]:
+            del self.text_lengths[oldlength]
+        self.text_lengths[newlength] += 1
+        self.fontsize_chars[_rounded_fontsize(elem)] += newlength - oldlength
+
+    def body_fontsize(self):
+        """Returns the font size in which most of the text is written.
+
+        Same as :func:`core.classify.body_fontsize`, without going through elements.
+        """
+        if not self.fontsize_chars:
+            return None
+        [(fontsize, _)] = self.fontsize_chars.most_common(1)
+        return fontsize
+
+    def fontsize_percentile(self, fontsize):
+        """Returns the percentage of elements with a font size smaller than ``fontsize``.
+        """
+        if not self.element_count:
+            return 0
+        fontsize = round(fontsize, 1)
+        smaller = sum(count for size, count in self.fontsize_histogram.items() if size < fontsize)
+        return smaller * 100 / self.element_count
@@ -0,0 +1,261 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-06
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from array import array
+
+from hscommon.geometry import Rect
+
+from .const import ElementState
+
+# The order of this list defines the codes under which states are stored. Only append to it.
+STATES = [
+    ElementState.Normal,
+    ElementState.Title,
+    ElementState.Footnote,
+    ElementState.ToFix,
+    ElementState.Ignored,
+]
+STATE2CODE = {state: code for code, state in enumerate(STATES)}
+
+class TextTable:
+    """Interned texts, along with the number of elements using each of them.
+
+    Running headers, footers and page numbers are repeated on many pages. Each distinct text is
+    stored once and referred to by its id, which is its index in the table. Texts that aren't used
+    anymore keep their id (with a count of zero) until the table is rebuilt.
+    """
+    def __init__(self):
+        self._texts = []
+        self._text2id = {}
+        self.counts = array('l')
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __getitem__(self, textid):
+        return self._texts[textid]
+
+    @classmethod
+    def from_texts(cls, texts, counts):
+        """Returns a table with ``texts``, whose ids are their index, and their ``counts``.
+        """
+        result = cls()
+        result._texts = texts
+        result._text2id = {text: textid for textid, text in enumerate(texts)}
+        result.counts = array('l', counts)
+        return result
+
+    def add(self, text):
+        """Adds an occurrence of ``text`` and returns its id.
+        """
+        textid = self._text2id.get(text)
+        if textid is None:
+            textid = len(self._texts)
+            self._texts.append(text)
+            self._text2id[text] = textid
+            self.counts.append(1)
+        else:
+            self.counts[textid] += 1
+        return textid
+
+    def remove(self, textid):
+        """Removes an occurrence of the text with ``textid``.
+        """
+        self.counts[textid] -= 1
+
+    def count(self, text):
+        """Returns the number of occurrences of ``text``.
+        """
+        textid = self._text2id.get(text)
+        return self.counts[textid] if textid is not None else 0
+
+
+class ElementStore:
+    """Columnar storage for text elements.
+
+    A big PDF yields hundreds of thousands of elements and a :class:`core.pdf.TextElement`
+    instance for each of them is expensive (a ``__dict__``, a ``Rect``, duplicated coordinates).
+    Here, each attribute lives in a typed array and texts are interned in a :class:`TextTable`.
+    Elements are accessed through :class:`ElementView`, which behaves like a ``TextElement``.
+
+    ``x`` and ``y`` are the coordinates of the element's rect as pdfminer gives them (y being the
+    bottom), like in ``TextElement.rect``.
+    """
+    def __init__(self):
+        self.page = array('l')
+        self.order = array('l')
+        self.x = array('d')
+        self.y = array('d')
+        self.w = array('d')
+        self.h = array('d')
+        self.fontsize = array('d')
+        self.state = array('b')
+        self.title_level = array('b')
+        self.texts = TextTable()
+        self.text_id = array('l')
+        # modified_text is transient and only set on a few elements at once
+        self._modified_text = {}
+
+    def __len__(self):
+        return len(self.page)
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return ElementView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ElementView(self, index)
+
+    #--- Public
+    def append(self, elem):
+        """Copies ``elem``, a ``TextElement`` or alike, in the store and returns a view on it.
+        """
+        x, y, w, h = elem.rect
+        self.page.append(elem.page)
+        self.order.append(elem.order)
+        self.x.append(x)
+        self.y.append(y)
+        self.w.append(w)
+        self.h.append(h)
+        self.fontsize.append(elem.fontsize)
+        self.state.append(STATE2CODE[elem.state])
+        self.title_level.append(elem.title_level)
+        self.text_id.append(self.texts.add(elem.text))
+        return ElementView(self, len(self) - 1)
+
+    def extend(self, elements):
+        """Copies all ``elements`` in the store and returns a list of views on them.
+        """
+        return [self.append(elem) for elem in elements]
+
+    def copy(self):
+        """Returns a copy of the store, which can be read from another thread.
+        """
+        result = ElementStore()
+        for column_name in ['page', 'order', 'x', 'y', 'w', 'h', 'fontsize', 'state',
+                'title_level', 'text_id']:
+            setattr(result, column_name, getattr(self, column_name)[:])
+        texts = self.texts
+        result.texts = TextTable.from_texts(texts._texts[:], texts.counts)
+        return result
+
+    def get_text(self, index):
+        return self.texts[self.text_id[index]]
+
+    def set_text(self, index, text):
+        # The old text stays in our text table until the next compact()
+        self.texts.remove(self.text_id[index])
+        self.text_id[index] = self.texts.add(text)
+
+    def compact(self):
+        """Rebuilds the text table without the texts that were replaced through set_text().
+        """
+        old_texts = self.texts
+        self.texts = TextTable()
+        for index, textid in enumerate(self.text_id):
+            self.text_id[index] = self.texts.add(old_texts[textid])
+
+    def text_page_counts(self):
+        """Returns, for each text id, the number of distinct pages the text appears on.
+        """
+        result = array('l', [0]) * len(self.texts)
+        for textid, pageno in set(zip(self.text_id, self.page)):
+            result[textid] += 1
+        return result
+
+    def indexes_of_repeated_texts(self, max_pages):
+        """Returns the indexes of elements whose text appears on more than ``max_pages`` pages.
+        """
+        page_counts = self.text_page_counts()
+        return [
+            index for index, textid in enumerate(self.text_id)
+            if page_counts[textid] > max_pages
+        ]
+
+
+def _column_property(column_name):
+    def getter(self):
+        return getattr(self.store, column_name)[self.index]
+
+    def setter(self, value):
+        getattr(self.store, column_name)[self.index] = value
+
+    return property(getter, setter)
+
+class ElementView:
+    """A lightweight handle on an element of an :class:`ElementStore`.
+
+    It has the same interface as :class:`core.pdf.TextElement`. Views don't hold any data, so two
+    views on the same element are equal and hash the same way.
+    """
+    __slots__ = ['store', 'index']
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __eq__(self, other):
+        if not isinstance(other, ElementView):
+            return NotImplemented
+        return self.store is other.store and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    def __repr__(self):
+        return '<ElementView {} {}-{} {} "{}">'.format(self.page, self.x, self.y, self.state,
+            self.text)
+
+    page = _column_property('page')
+    order = _column_property('order')
+    fontsize = _column_property('fontsize')
+    title_level = _column_property('title_level')
+
+    @property
+    def rect(self):
+        store = self.store
+        index = self.index
+        return Rect(store.x[index], store.y[index], store.w[index], store.h[index])
+
+    @property
+    def x(self):
+        return self.store.x[self.index]
+
+    @property
+    def y(self):
+        # Like TextElement, our y is the top of the element. ypos in pdfminer are inverted.
+        return self.store.y[self.index] + self.store.h[self.index]
+
+    @property
+    def state(self):
+        return STATES[self.store.state[self.index]]
+
+    @state.setter
+    def state(self, value):
+        self.store.state[self.index] = STATE2CODE[value]
+
+    @property
+    def text(self):
+        return self.store.get_text(self.index)
+
+    @text.setter
+    def text(self, value):
+        self.store.set_text(self.index, value)
+
+    @property
+    def modified_text(self):
+        return self.store._modified_text.get(self.index)
+
+    @modified_text.setter
+    def modified_text(self, value):
+        if value is None:
+            self.store._modified_text.pop(self.index, None)
+        else:
+            self.store._modified_text[self.index] = value
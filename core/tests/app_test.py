@@ -0,0 +1,283 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import os.path as op
+import time
+
+from jobprogress.job import Job
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_, CallLogger
+
+from ..const import ElementState
+from ..pdf import Page, TextElement, extract_text_elements_from_pdf
+from ..store import ElementStore
+from ..stats import DocumentStats
+from ..project import ProjectFormat, save_project
+from ..app import App
+
+TESTDATA = op.join(op.dirname(__file__), 'testdata')
+
+class FakeView:
+    # Runs jobs synchronously
+    def __init__(self):
+        self.load_path = None
+        self.save_path = None
+        self.messages = []
+
+    def start_job(self, jobid, func, *args):
+        func(Job(1, lambda progress, desc='': True), *args)
+        # Like the GUI's timer, which keeps running during jobs
+        self.app.pulse()
+        self.app._job_completed(jobid)
+
+    def query_load_path(self, prompt, allowed_exts):
+        return self.load_path
+
+    def query_save_path(self, prompt, allowed_exts):
+        return self.save_path
+
+    def show_message(self, msg):
+        self.messages.append(msg)
+
+
+def create_project(path):
+    # Two pages with two columns of two paragraphs each. Elements are given in an order that isn't
+    # their reading order.
+    pages = [Page(612, 792), Page(612, 792)]
+    store = ElementStore()
+    positions = [(320, 600), (50, 600), (320, 700), (50, 700)]
+    for pageno in range(2):
+        for order, (x, y) in enumerate(positions):
+            elem = TextElement(Rect(x, y, 240, 80), 12, 'p{} {}-{}'.format(pageno, x, y))
+            elem.page = pageno
+            elem.order = order
+            store.append(elem)
+    save_project(path, '/nonexistent.pdf', pages, list(store), ProjectFormat.XML)
+
+def create_app(request):
+    view = FakeView()
+    app = App(view)
+    view.app = app
+    for gui in [app.element_table, app.opened_file_label, app.page_controller,
+            app.page_controller.page_repr, app.build_pane, app.edit_pane]:
+        gui.view = CallLogger()
+    # Don't touch the user's cache
+    app.extraction_cache = None
+    request.addfinalizer(app.close)
+    return app
+
+def load_app(path, request):
+    # Returns an app with the project at ``path`` loaded.
+    app = create_app(request)
+    app.view.load_path = path
+    app.load_project()
+    return app
+
+def wait_for_loading(app):
+    # Pulses until the PDF is fully loaded
+    while app._loader is not None:
+        time.sleep(0.01)
+        app.pulse()
+
+def app_with_project(tmpdir, request):
+    path = str(tmpdir.join('foo.masherproj'))
+    create_project(path)
+    return load_app(path, request)
+
+def load_test_pdf(app, pagenos=None):
+    app.view.load_path = op.join(TESTDATA, 'columns.pdf')
+    app.load_pdf(pagenos)
+    wait_for_loading(app)
+
+def elem_attrs(elements):
+    return [(e.page, e.order, tuple(e.rect), e.fontsize, e.text) for e in elements]
+
+def extracted_attrs(pagenos):
+    # Attributes of the elements of ``pagenos`` when the test PDF is fully extracted
+    _, elements = extract_text_elements_from_pdf(op.join(TESTDATA, 'columns.pdf'))
+    return elem_attrs(e for e in elements if e.page in pagenos)
+
+def elem_values(app):
+    return [(e.state, e.title_level, e.text, e.order) for e in app.elements]
+
+def check_stats(app):
+    fresh = DocumentStats(app.elements)
+    eq_(app.stats.state_counts, fresh.state_counts)
+    eq_(app.stats.text_lengths, fresh.text_lengths)
+
+#--- Undo
+def test_undo_and_redo_all_kinds_of_changes(tmpdir, request):
+    app = app_with_project(tmpdir, request)
+    eq_(len(app.elements), 8)
+    snapshots = [elem_values(app)]
+    app.select_elements({app.elements[0], app.elements[1]})
+    app.change_state_of_selected(ElementState.Title)
+    snapshots.append(elem_values(app))
+    # Titles get their level bumped
+    app.change_state_of_selected(ElementState.Title)
+    snapshots.append(elem_values(app))
+    app.select_elements({app.elements[2]})
+    app.change_text_of_selected('changed text')
+    snapshots.append(elem_values(app))
+    app.reorder_elements(list(reversed(app.elements_of_page(1))))
+    snapshots.append(elem_values(app))
+    app.order_elements_automatically()
+    snapshots.append(elem_values(app))
+    app.revert_automatic_order()
+    snapshots.append(elem_values(app))
+    # Each snapshot is different from the previous one
+    for before, after in zip(snapshots, snapshots[1:]):
+        assert before != after
+    for snapshot in reversed(snapshots[:-1]):
+        assert app.can_undo
+        app.undo()
+        eq_(elem_values(app), snapshot)
+        check_stats(app)
+    assert not app.can_undo
+    for snapshot in snapshots[1:]:
+        assert app.can_redo
+        app.redo()
+        eq_(elem_values(app), snapshot)
+        check_stats(app)
+    assert not app.can_redo
+
+def test_automatic_order_follows_columns(tmpdir, request):
+    app = app_with_project(tmpdir, request)
+    app.order_elements_automatically()
+    page = sorted(app.elements_of_page(0), key=lambda e: e.order)
+    eq_([e.text for e in page], ['p0 50-700', 'p0 50-600', 'p0 320-700', 'p0 320-600'])
+
+def test_new_change_clears_redo(tmpdir, request):
+    app = app_with_project(tmpdir, request)
+    app.select_elements({app.elements[0]})
+    app.change_state_of_selected(ElementState.Ignored)
+    app.undo()
+    assert app.can_redo
+    app.change_state_of_selected(ElementState.Footnote)
+    assert not app.can_redo
+
+def test_undo_budget(tmpdir, request):
+    app = app_with_project(tmpdir, request)
+    app.select_elements({app.elements[0]})
+    app.change_state_of_selected(ElementState.Ignored)
+    app.undo_history.budget = app.undo_history.size
+    app.select_elements({app.elements[1]})
+    app.change_state_of_selected(ElementState.Ignored)
+    app.undo()
+    # Only the last change could be kept
+    assert not app.can_undo
+    eq_(app.elements[0].state, ElementState.Ignored)
+    eq_(app.elements[1].state, ElementState.Normal)
+
+def test_undo_is_journaled(tmpdir, request):
+    # Undone changes make it to the project like any other change.
+    app = app_with_project(tmpdir, request)
+    app.select_elements({app.elements[0]})
+    app.change_state_of_selected(ElementState.Ignored)
+    app.undo()
+    app.close()
+    app = load_app(str(tmpdir.join('foo.masherproj')), request)
+    eq_(app.elements[0].state, ElementState.Normal)
+
+#--- PDF loading
+def test_pulse_during_pdf_load_doesnt_mix_documents(tmpdir, request, monkeypatch):
+    # Letting go of our project can take a while. Pages read in the meantime must end up in the
+    # new document, not in the old one or in its project.
+    path = str(tmpdir.join('foo.masherproj'))
+    app = app_with_project(tmpdir, request)
+    app.select_elements({app.elements[0]})
+    app.change_state_of_selected(ElementState.Ignored)
+    set_journal = app._set_journal
+
+    def set_journal_and_pulse(*args, **kwargs):
+        app.pulse()
+        set_journal(*args, **kwargs)
+
+    monkeypatch.setattr(app, '_set_journal', set_journal_and_pulse)
+    app.view.load_path = op.join(TESTDATA, 'columns.pdf')
+    app.load_pdf()
+    wait_for_loading(app)
+    eq_(len(app.pages), 4)
+    assert all(page.extracted for page in app.pages)
+    eq_(len(app.elements), len(app.element_store))
+    eq_(sorted({e.page for e in app.elements}), [0, 1, 2, 3])
+    eq_(app.stats.state_counts[ElementState.Normal], len(app.elements))
+    # Our previous project got our change, and only that.
+    other = load_app(path, request)
+    eq_(len(other.elements), 8)
+    eq_(other.elements[0].state, ElementState.Ignored)
+
+#--- Rules
+def test_apply_missing_rule_file(tmpdir, request):
+    app = app_with_project(tmpdir, request)
+    app.view.load_path = str(tmpdir.join('missing.masherrules'))
+    app.apply_rule_file()
+    eq_(app.view.messages, ["This file is not a valid rule file."])
+
+#--- Stats
+def test_opened_file_label_shows_element_counts(tmpdir, request):
+    app = app_with_project(tmpdir, request)
+    eq_(app.opened_file_label.text, "Working on: /nonexistent.pdf (8 elements)")
+    app.select_elements({app.elements[0], app.elements[1]})
+    app.change_state_of_selected(ElementState.Ignored)
+    eq_(app.opened_file_label.text, "Working on: /nonexistent.pdf (8 elements, 2 ignored)")
+    app.undo()
+    eq_(app.opened_file_label.text, "Working on: /nonexistent.pdf (8 elements)")
+
+#--- Page extraction
+def test_extract_placeholder_pages(request):
+    app = create_app(request)
+    load_test_pdf(app, pagenos=[1])
+    eq_([page.extracted for page in app.pages], [False, True, False, False])
+    eq_(elem_attrs(app.elements), extracted_attrs({1}))
+    app.extract_pages([3, 0, 1])
+    wait_for_loading(app)
+    eq_([page.extracted for page in app.pages], [True, True, False, True])
+    # Elements stay in document order
+    eq_(elem_attrs(app.elements), extracted_attrs({0, 1, 3}))
+    check_stats(app)
+
+def test_extract_pages_while_loading(request):
+    app = create_app(request)
+    app.view.load_path = op.join(TESTDATA, 'columns.pdf')
+    app.load_pdf([0])
+    app.extract_pages([2])
+    wait_for_loading(app)
+    eq_([page.extracted for page in app.pages], [True, False, True, False])
+    eq_(elem_attrs(app.elements), extracted_attrs({0, 2}))
+
+def test_lazy_loading_reads_every_page(request):
+    app = create_app(request)
+    app.lazy_loading = True
+    app.view.load_path = op.join(TESTDATA, 'columns.pdf')
+    app.load_pdf()
+    app.request_page(2)
+    wait_for_loading(app)
+    assert all(page.extracted for page in app.pages)
+    eq_(elem_attrs(app.elements), extracted_attrs({0, 1, 2, 3}))
+    check_stats(app)
+
+def test_extracted_pages_are_added_to_project_database(tmpdir, request):
+    path = str(tmpdir.join('foo.masherproj'))
+    app = create_app(request)
+    load_test_pdf(app, pagenos=[1])
+    app.project_format = ProjectFormat.SQLite
+    app.view.save_path = path
+    app.save_project()
+    app.extract_pages([2])
+    wait_for_loading(app)
+    page2 = app.elements_of_page(2)
+    eq_(elem_attrs(page2), extracted_attrs({2}))
+    app.select_elements({page2[0]})
+    app.change_state_of_selected(ElementState.Ignored)
+    app.close()
+    other = load_app(path, request)
+    eq_([page.extracted for page in other.pages], [False, True, True, False])
+    eq_(elem_attrs(other.elements), extracted_attrs({1, 2}))
+    eq_(other.elements_in_state(ElementState.Ignored), [other.elements_of_page(2)[0]])
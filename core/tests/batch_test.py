@@ -0,0 +1,47 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import os.path as op
+
+from hscommon.testutil import eq_
+
+from .. import batch
+from ..batch import OutputFormat, ConversionStatus, convert_pdf, unique_dest_names
+
+TESTDATA = op.join(op.dirname(__file__), 'testdata')
+
+def test_unique_dest_names():
+    paths = ['/a/foo.pdf', '/b/foo.pdf', '/c/FOO.pdf', '/a/bar.pdf', '/b/foo-2.pdf']
+    eq_(unique_dest_names(paths), ['foo', 'foo-2', 'FOO-3', 'bar', 'foo-2-2'])
+
+def test_convert_to_markdown(tmpdir):
+    result = convert_pdf(op.join(TESTDATA, 'columns.pdf'), dest_dir=str(tmpdir))
+    eq_(result.status, ConversionStatus.Success)
+    eq_(result.outputs, [str(tmpdir.join('columns.txt'))])
+    eq_(tmpdir.listdir(), [tmpdir.join('columns.txt')])
+
+def test_failed_conversion_removes_intermediate_files(tmpdir, monkeypatch):
+    def create_ebook(html_path, dest_path, ebook_type, title=''):
+        raise ValueError("can't create ebook")
+
+    monkeypatch.setattr(batch, 'create_ebook', create_ebook)
+    result = convert_pdf(op.join(TESTDATA, 'columns.pdf'), dest_dir=str(tmpdir),
+        formats=[OutputFormat.EPUB])
+    eq_(result.status, ConversionStatus.Failed)
+    eq_(result.error, "can't create ebook")
+    # Our markdown and HTML files were only needed to create the ebook
+    eq_(tmpdir.listdir(), [])
+
+def test_requested_intermediate_format_is_kept(tmpdir, monkeypatch):
+    def create_ebook(html_path, dest_path, ebook_type, title=''):
+        raise ValueError("can't create ebook")
+
+    monkeypatch.setattr(batch, 'create_ebook', create_ebook)
+    convert_pdf(op.join(TESTDATA, 'columns.pdf'), dest_dir=str(tmpdir),
+        formats=[OutputFormat.HTML, OutputFormat.EPUB])
+    eq_(tmpdir.listdir(), [tmpdir.join('columns.htm')])
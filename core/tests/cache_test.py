@@ -0,0 +1,104 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import json
+import os
+import os.path as op
+import pickle
+import zlib
+
+from pytest import raises
+
+from hscommon.testutil import eq_
+
+from ..pdf import extract_text_elements_from_pdf, create_laparams
+from ..cache import ExtractionCache, ExtractionCheckpoint, pack_extraction, unpack_extraction
+
+TESTDATA = op.join(op.dirname(__file__), 'testdata')
+
+def page_attrs(pages):
+    return [(p.width, p.height, p.blank, p.duplicate_of, p.fingerprint) for p in pages]
+
+def element_attrs(elements):
+    return [(e.page, e.order, tuple(e.rect), e.fontsize, e.text) for e in elements]
+
+def extract_test_pdf(**kwargs):
+    return extract_text_elements_from_pdf(op.join(TESTDATA, 'columns.pdf'), **kwargs)
+
+#--- Packing
+def test_pack_and_unpack():
+    pages, elements = extract_test_pdf()
+    pages[1].duplicate_of = 0
+    pages[2].blank = True
+    elements[0].text = 'caf\xe9 ✓\n"quoted"'
+    unpacked_pages, unpacked_elements = unpack_extraction(pack_extraction(pages, elements))
+    eq_(page_attrs(unpacked_pages), page_attrs(pages))
+    eq_(element_attrs(unpacked_elements), element_attrs(elements))
+
+def test_unpack_rejects_pickles():
+    # Pickles can run arbitrary code when they're loaded
+    data = zlib.compress(pickle.dumps(([], [])))
+    with raises(ValueError):
+        unpack_extraction(data)
+
+def test_unpack_rejects_invalid_values():
+    invalid = [
+        [[['612', 792, False, None, None]], []],
+        [[[612, 792, False, None, None]], [[0, 0, [1, 2, 3], 12, 'foo']]],
+        [[[612, 792, False, None, None]], [[0, 0, [1, 2, 3, 4], 12, 42]]],
+    ]
+    for packed in invalid:
+        data = zlib.compress(json.dumps(packed).encode('utf-8'))
+        with raises(ValueError):
+            unpack_extraction(data)
+
+#--- ExtractionCache
+def test_cached_extraction_is_the_same(tmpdir):
+    cache = ExtractionCache(str(tmpdir))
+    pages, elements = extract_test_pdf(cache=cache)
+    key = cache.key_for(op.join(TESTDATA, 'columns.pdf'), create_laparams())
+    cached_pages, cached_elements = cache.get(key)
+    eq_(page_attrs(cached_pages), page_attrs(pages))
+    eq_(element_attrs(cached_elements), element_attrs(elements))
+
+def test_corrupt_entry_is_a_miss(tmpdir):
+    cache = ExtractionCache(str(tmpdir))
+    with open(str(tmpdir.join('foo.pmcache')), 'wb') as fp:
+        fp.write(zlib.compress(pickle.dumps(([], []))))
+    eq_(cache.get('foo'), None)
+
+#--- ExtractionCheckpoint
+def test_checkpoint_resumes_interrupted_extraction(tmpdir):
+    # The checkpoint lives in its own directory, not next to the PDF.
+    checkpointdir = str(tmpdir.join('checkpoints'))
+    pages, elements = extract_test_pdf()
+    checkpoint = ExtractionCheckpoint(checkpointdir, interval=2)
+    key = checkpoint.key_for(op.join(TESTDATA, 'columns.pdf'), create_laparams())
+    eq_(checkpoint.resume(key), ([], []))
+    page0_elements = [e for e in elements if e.page == 0]
+    page1_elements = [e for e in elements if e.page == 1]
+    checkpoint.add(pages[0], page0_elements)
+    checkpoint.add(pages[1], page1_elements)
+    eq_(op.dirname(checkpoint.path), checkpointdir)
+    assert not op.exists(op.join(TESTDATA, 'columns.pdf.pmcheckpoint'))
+    # The extraction is interrupted here and started again.
+    resumed_pages, resumed_elements = extract_test_pdf(
+        checkpoint=ExtractionCheckpoint(checkpointdir))
+    eq_(page_attrs(resumed_pages), page_attrs(pages))
+    eq_(element_attrs(resumed_elements), element_attrs(elements))
+    # The checkpoint isn't needed anymore
+    eq_(os.listdir(checkpointdir), [])
+
+def test_checkpoint_for_other_settings_is_ignored(tmpdir):
+    checkpointdir = str(tmpdir)
+    checkpoint = ExtractionCheckpoint(checkpointdir)
+    checkpoint.resume('foo')
+    with open(checkpoint.path, 'wb') as fp:
+        fp.write(b'PMCHECKPOINT1\nfoo\n')
+    checkpoint = ExtractionCheckpoint(checkpointdir)
+    eq_(checkpoint.resume('foo'), ([], []))
@@ -0,0 +1,62 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import Page, TextElement
+from ..store import ElementStore
+from ..database import DatabaseProject
+
+def create_store(count):
+    store = ElementStore()
+    for index in range(count):
+        elem = TextElement(Rect(0, index, 10, 5), 12, 'text{}'.format(index))
+        elem.page = index % 2
+        elem.order = index // 2
+        store.append(elem)
+    return store
+
+def elem_values(store):
+    return [(e.page, e.order, e.text, e.state, e.title_level) for e in store]
+
+def written_project(tmpdir, store, request):
+    project_db = DatabaseProject(str(tmpdir.join('foo.masherproj')), create=True)
+    request.addfinalizer(project_db.close)
+    project_db.write('/foo/bar.pdf', [Page(612, 792), Page(612, 792)], store)
+    return project_db
+
+#---
+def test_update_many_elements(tmpdir, request):
+    store = create_store(3000)
+    project_db = written_project(tmpdir, store, request)
+    changed = [store[index] for index in range(0, 3000, 3)]
+    for elem in changed:
+        elem.state = ElementState.Title
+        elem.title_level = 2
+        elem.order += 1000
+        elem.text = elem.text.upper()
+    project_db.update_elements(changed)
+    _, _, loaded_store = project_db.read()
+    eq_(elem_values(loaded_store), elem_values(store))
+    expected_ids = [e.index for e in sorted(changed, key=lambda e: (e.page, e.index))]
+    eq_(project_db.state_element_ids(ElementState.Title), expected_ids)
+
+def test_update_no_elements(tmpdir, request):
+    store = create_store(2)
+    project_db = written_project(tmpdir, store, request)
+    project_db.update_elements([])
+    _, _, loaded_store = project_db.read()
+    eq_(elem_values(loaded_store), elem_values(store))
+
+def test_page_element_ids(tmpdir, request):
+    project_db = written_project(tmpdir, create_store(5), request)
+    eq_(project_db.page_element_ids(0), [0, 2, 4])
+    eq_(project_db.page_element_ids(1), [1, 3])
+    eq_(project_db.page_element_ids(2), [])
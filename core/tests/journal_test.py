@@ -0,0 +1,189 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import os
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import TextElement
+from ..store import ElementStore
+from ..journal import ChangeJournal, JOURNAL_MAGIC, CHUNK_HEADER
+
+def create_store(count=3):
+    store = ElementStore()
+    for index in range(count):
+        elem = TextElement(Rect(0, index * 10, 10, 5), 12, 'text{}'.format(index))
+        elem.page = 0
+        elem.order = index
+        store.append(elem)
+    return store
+
+def elem_values(store):
+    return [(e.state, e.title_level, e.order, e.text) for e in store]
+
+def journaled_changes(path):
+    # Records changes to a store in a journal for the project at path. Returns the changed store.
+    store = create_store()
+    journal = ChangeJournal(path)
+    journal.clear()
+    journal.start()
+    store[0].state = ElementState.Title
+    store[0].title_level = 3
+    store[2].order = 42
+    journal.record_elements([store[0], store[2]])
+    store[1].text = 'changed ✓'
+    journal.record_text(store[1])
+    journal.close()
+    return store
+
+#---
+def test_replay_brings_back_recorded_changes(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    changed = journaled_changes(path)
+    store = create_store()
+    journal = ChangeJournal(path)
+    eq_(journal.replay(store), 3)
+    eq_(elem_values(store), elem_values(changed))
+    # Those changes aren't in the project yet
+    assert journal.dirty
+
+def test_replay_twice_gives_same_result(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    changed = journaled_changes(path)
+    store = create_store()
+    ChangeJournal(path).replay(store)
+    ChangeJournal(path).replay(store)
+    eq_(elem_values(store), elem_values(changed))
+
+def test_replay_without_file(tmpdir):
+    store = create_store()
+    journal = ChangeJournal(str(tmpdir.join('foo.masherproj')))
+    eq_(journal.replay(store), 0)
+    eq_(elem_values(store), elem_values(create_store()))
+    assert not journal.dirty
+
+def test_records_for_same_element_are_coalesced(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    store = create_store()
+    journal = ChangeJournal(path, flush_interval=60)
+    journal.clear()
+    journal.start()
+    for state in [ElementState.Title, ElementState.Footnote, ElementState.Ignored]:
+        store[0].state = state
+        journal.record_elements([store[0]])
+    journal.close()
+    replayed = create_store()
+    eq_(ChangeJournal(path).replay(replayed), 1)
+    eq_(replayed[0].state, ElementState.Ignored)
+
+def test_replay_skips_elements_that_arent_in_store(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    journaled_changes(path)
+    store = create_store(count=1)
+    ChangeJournal(path).replay(store)
+    eq_(store[0].state, ElementState.Title)
+    eq_(len(store), 1)
+
+def test_torn_chunk_is_ignored(tmpdir):
+    # The process died while appending a chunk
+    path = str(tmpdir.join('foo.masherproj'))
+    changed = journaled_changes(path)
+    journal_path = path + '.journal'
+    with open(journal_path, 'ab') as fp:
+        fp.write(CHUNK_HEADER.pack(1000, 0))
+        fp.write(b'\x01\x00\x00')
+    store = create_store()
+    eq_(ChangeJournal(path).replay(store), 3)
+    eq_(elem_values(store), elem_values(changed))
+
+def test_chunk_with_bad_crc_is_ignored(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    journaled_changes(path)
+    journal_path = path + '.journal'
+    with open(journal_path, 'r+b') as fp:
+        fp.seek(len(JOURNAL_MAGIC) + CHUNK_HEADER.size)
+        fp.write(b'\xff')
+    eq_(ChangeJournal(path).replay(create_store()), 0)
+
+def test_start_truncates_torn_chunk(tmpdir):
+    # New records are appended after the last valid chunk, so they aren't hidden by a torn one.
+    path = str(tmpdir.join('foo.masherproj'))
+    changed = journaled_changes(path)
+    journal_path = path + '.journal'
+    with open(journal_path, 'ab') as fp:
+        fp.write(CHUNK_HEADER.pack(1000, 0))
+    journal = ChangeJournal(path)
+    journal.replay(changed)
+    journal.start()
+    changed[1].state = ElementState.ToFix
+    journal.record_elements([changed[1]])
+    journal.close()
+    store = create_store()
+    eq_(ChangeJournal(path).replay(store), 4)
+    eq_(elem_values(store), elem_values(changed))
+
+def test_file_with_wrong_magic_is_ignored(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    with open(path + '.journal', 'wb') as fp:
+        fp.write(b'garbage')
+    eq_(ChangeJournal(path).replay(create_store()), 0)
+
+def test_compact_saves_and_empties_journal(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    store = create_store()
+    journal = ChangeJournal(path, flush_interval=60)
+    journal.clear()
+    journal.start()
+    store[0].state = ElementState.Ignored
+    journal.record_elements([store[0]])
+    saved = []
+    journal.compact(lambda: saved.append(store[0].state))
+    assert not journal.dirty
+    journal.close()
+    eq_(saved, [ElementState.Ignored])
+    eq_(ChangeJournal(path).replay(create_store()), 0)
+    eq_(os.path.getsize(path + '.journal'), len(JOURNAL_MAGIC))
+
+def test_failed_save_keeps_records(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    store = create_store()
+    journal = ChangeJournal(path, flush_interval=60)
+    journal.clear()
+    journal.start()
+    store[0].state = ElementState.Ignored
+    journal.record_elements([store[0]])
+
+    def save():
+        raise OSError("disk full")
+
+    journal.compact(save)
+    journal.close()
+    assert journal.error is not None
+    # The next autosave will try again
+    assert journal.dirty
+    replayed = create_store()
+    eq_(ChangeJournal(path).replay(replayed), 1)
+    eq_(replayed[0].state, ElementState.Ignored)
+
+def test_unwritable_journal(tmpdir):
+    # Records are dropped, but compactions still save the project.
+    path = str(tmpdir.join('foo.masherproj'))
+    os.mkdir(path + '.journal')
+    store = create_store()
+    journal = ChangeJournal(path)
+    journal.clear()
+    journal.start()
+    store[0].state = ElementState.Ignored
+    journal.record_elements([store[0]])
+    saved = []
+    journal.compact(lambda: saved.append(True))
+    journal.close()
+    eq_(saved, [True])
+    eq_(journal.error, None)
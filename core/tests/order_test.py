@@ -0,0 +1,129 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from jobprogress.job import nulljob
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import TextElement
+from ..order import xycut_order, compute_page_order, compute_document_order
+
+def create_elements(specs):
+    # ``specs`` is a list of (text, x, y, w, h), y being the bottom of the element, like in
+    # pdfminer. Elements are returned in an order that isn't their reading order.
+    result = []
+    for text, x, y, w, h in specs:
+        elem = TextElement(Rect(x, y, w, h), 12, text)
+        elem.page = 0
+        result.append(elem)
+    return list(reversed(result))
+
+def texts(elements):
+    return [e.text for e in elements]
+
+#--- xycut_order
+def test_empty_and_single():
+    eq_(xycut_order([]), [])
+    elements = create_elements([('foo', 50, 50, 100, 10)])
+    eq_(xycut_order(elements), elements)
+
+def test_two_columns():
+    elements = create_elements([
+        ('left1', 50, 600, 240, 100),
+        ('left2', 50, 480, 240, 100),
+        ('right1', 320, 600, 240, 100),
+        ('right2', 320, 480, 240, 100),
+    ])
+    eq_(texts(xycut_order(elements)), ['left1', 'left2', 'right1', 'right2'])
+
+def test_header_and_footer_spanning_both_columns():
+    elements = create_elements([
+        ('header', 50, 740, 510, 20),
+        ('left1', 50, 600, 240, 100),
+        ('left2', 50, 480, 240, 100),
+        ('right1', 320, 600, 240, 100),
+        ('right2', 320, 480, 240, 100),
+        ('footer', 50, 30, 510, 20),
+    ])
+    expected = ['header', 'left1', 'left2', 'right1', 'right2', 'footer']
+    eq_(texts(xycut_order(elements)), expected)
+
+def test_columns_under_a_full_width_paragraph_in_the_middle():
+    # Two columns, then a full width paragraph, then two columns again
+    elements = create_elements([
+        ('a1', 50, 650, 240, 100),
+        ('b1', 320, 650, 240, 100),
+        ('middle', 50, 500, 510, 100),
+        ('a2', 50, 350, 240, 100),
+        ('b2', 320, 350, 240, 100),
+    ])
+    eq_(texts(xycut_order(elements)), ['a1', 'b1', 'middle', 'a2', 'b2'])
+
+def test_nested_cuts():
+    # The left column has a title over two sub-columns, the right column is a single block.
+    elements = create_elements([
+        ('title', 50, 700, 240, 30),
+        ('sub1a', 50, 600, 110, 80),
+        ('sub1b', 50, 500, 110, 80),
+        ('sub2a', 180, 600, 110, 80),
+        ('sub2b', 180, 500, 110, 80),
+        ('right', 320, 500, 240, 230),
+    ])
+    expected = ['title', 'sub1a', 'sub1b', 'sub2a', 'sub2b', 'right']
+    eq_(texts(xycut_order(elements)), expected)
+
+def test_uncuttable_boxes_are_read_top_to_bottom():
+    # Each box overlaps the next one on both axes, so there's no gap to cut at.
+    elements = create_elements([
+        ('first', 100, 600, 200, 100),
+        ('second', 50, 550, 200, 100),
+        ('third', 150, 500, 200, 100),
+    ])
+    eq_(texts(xycut_order(elements)), ['first', 'second', 'third'])
+
+def test_boxes_at_the_same_height_are_read_left_to_right():
+    elements = create_elements([
+        ('a', 50, 600, 100, 20),
+        ('b', 200, 600, 100, 20),
+        ('c', 350, 600, 100, 20),
+    ])
+    eq_(texts(xycut_order(elements)), ['a', 'b', 'c'])
+
+#--- compute_page_order
+def test_ignored_elements_come_last():
+    elements = create_elements([
+        ('left', 50, 600, 240, 100),
+        ('folio', 300, 30, 10, 10),
+        ('right', 320, 600, 240, 100),
+        ('header', 50, 740, 510, 20),
+    ])
+    # create_elements() reversed them
+    header, right, folio, left = elements
+    header.state = ElementState.Ignored
+    folio.state = ElementState.Ignored
+    eq_(texts(compute_page_order(elements)), ['left', 'right', 'header', 'folio'])
+
+#--- compute_document_order
+def test_orders_are_per_page():
+    elements = create_elements([
+        ('p0 right', 320, 600, 240, 100),
+        ('p0 left', 50, 600, 240, 100),
+        ('p1 bottom', 50, 100, 240, 100),
+        ('p1 top', 50, 600, 240, 100),
+    ])
+    for elem in elements:
+        elem.page = 1 if elem.text.startswith('p1') else 0
+    orders = compute_document_order(elements, nulljob)
+    eq_(sorted((e.page, order, e.text) for e, order in orders.items()), [
+        (0, 0, 'p0 left'),
+        (0, 1, 'p0 right'),
+        (1, 0, 'p1 top'),
+        (1, 1, 'p1 bottom'),
+    ])
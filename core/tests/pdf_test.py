@@ -0,0 +1,120 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import os.path as op
+import random
+
+from hscommon.geometry import Rect, Line
+from hscommon.testutil import eq_
+
+from ..pdf import TextElement, extract_text_elements_from_pdf, merge_oneletter_elems
+
+TESTDATA = op.join(op.dirname(__file__), 'testdata')
+
+def page_attrs(pages):
+    return [(p.width, p.height, p.extracted, p.blank, p.duplicate_of, p.fingerprint)
+        for p in pages]
+
+def element_attrs(elements):
+    return [(e.page, e.order, tuple(e.rect), e.fontsize, e.text, e.state, e.title_level)
+        for e in elements]
+
+#--- Extraction
+def test_parallel_extraction_gives_the_same_result_as_serial():
+    path = op.join(TESTDATA, 'columns.pdf')
+    serial_pages, serial_elements = extract_text_elements_from_pdf(path, processes=1)
+    parallel_pages, parallel_elements = extract_text_elements_from_pdf(path, processes=2)
+    eq_(len(serial_pages), 4)
+    assert serial_elements
+    eq_(page_attrs(parallel_pages), page_attrs(serial_pages))
+    eq_(element_attrs(parallel_elements), element_attrs(serial_elements))
+
+def test_parallel_extraction_of_some_pages():
+    path = op.join(TESTDATA, 'columns.pdf')
+    serial_pages, serial_elements = extract_text_elements_from_pdf(path, pagenos=[1, 3])
+    parallel_pages, parallel_elements = extract_text_elements_from_pdf(path, processes=2,
+        pagenos=[3, 1])
+    eq_([p.extracted for p in serial_pages], [False, True, False, True])
+    eq_(page_attrs(parallel_pages), page_attrs(serial_pages))
+    eq_(element_attrs(parallel_elements), element_attrs(serial_elements))
+
+#--- One-letter elements
+def quadratic_merge_oneletter_elems(elements):
+    # The merge as it was before merge_oneletter_elems() used a grid. Every one-letter element is
+    # compared with every other element.
+    oneletter = [e for e in elements if len(e.text.strip()) == 1]
+    others = [e for e in elements if len(e.text.strip()) != 1]
+    for elem1 in oneletter:
+        rect = elem1.rect
+        for elem2 in others:
+            otherrect = elem2.rect
+            if rect.intersects(otherrect):
+                corner = rect.corners()[1]
+                line = Line(otherrect.center(), corner)
+                if line.dx() < 0 and line.dy() > 0:
+                    elem2.text = elem1.text.strip() + elem2.text
+                    elements.remove(elem1)
+                    break
+
+def check_same_merge(specs):
+    # ``specs`` is a list of (x, y, w, h, text).
+    def create_elements():
+        return [TextElement(Rect(x, y, w, h), 12, text) for x, y, w, h, text in specs]
+
+    expected = create_elements()
+    quadratic_merge_oneletter_elems(expected)
+    elements = create_elements()
+    merge_oneletter_elems(elements)
+    eq_([(tuple(e.rect), e.text) for e in elements], [(tuple(e.rect), e.text) for e in expected])
+    return elements
+
+def test_overlapping_letter_is_merged():
+    # A drop cap overlapping the top-left corner of its paragraph
+    elements = check_same_merge([(100, 100, 300, 100, 'paragraph'), (90, 180, 30, 30, ' D ')])
+    eq_([e.text for e in elements], ['Dparagraph'])
+
+def test_adjacent_letter():
+    # Rects that merely touch intersect
+    elements = check_same_merge([(100, 100, 300, 100, 'paragraph'), (70, 200, 30, 30, 'D')])
+    eq_([e.text for e in elements], ['Dparagraph'])
+
+def test_far_letter_is_left_alone():
+    elements = check_same_merge([(100, 100, 300, 100, 'paragraph'), (500, 500, 10, 10, 'D')])
+    eq_([e.text for e in elements], ['paragraph', 'D'])
+
+def test_letter_in_the_wrong_corner_is_left_alone():
+    elements = check_same_merge([(100, 100, 300, 100, 'paragraph'), (380, 90, 30, 30, 'D')])
+    eq_([e.text for e in elements], ['paragraph', 'D'])
+
+def test_letter_is_merged_with_the_first_candidate():
+    # Two paragraphs overlap the letter, it goes to the first one, like with a full scan
+    specs = [
+        (100, 100, 300, 100, 'first'),
+        (95, 150, 300, 50, 'second'),
+        (90, 180, 30, 30, 'D'),
+    ]
+    elements = check_same_merge(specs)
+    eq_([e.text for e in elements], ['Dfirst', 'second'])
+
+def test_random_layouts_merge_like_a_full_scan():
+    # Many letters and paragraphs, spanning several grid cells, including cell boundaries
+    rng = random.Random(0)
+    merged_count = 0
+    for _ in range(20):
+        specs = []
+        for _ in range(30):
+            x, y = rng.randrange(0, 600, 16), rng.randrange(0, 800, 16)
+            specs.append((x, y, rng.choice([64, 100, 250]), rng.choice([32, 64, 90]), 'paragraph'))
+        for _ in range(60):
+            x, y = rng.uniform(0, 600), rng.uniform(0, 800)
+            w, h = rng.choice([8, 16, 30]), rng.choice([8, 16, 30])
+            specs.append((x, y, w, h, rng.choice(['a', 'b', ' c\n'])))
+        rng.shuffle(specs)
+        merged_count += 90 - len(check_same_merge(specs))
+    # Our layouts aren't so sparse that nothing is merged
+    assert merged_count > 20
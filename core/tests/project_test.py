@@ -0,0 +1,221 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+import sqlite3
+
+from pytest import raises
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import Page, TextElement
+from ..store import ElementStore
+from ..project import (ProjectFormat, InvalidProjectError, load_project, save_project,
+    detect_project_format, convert_project, main)
+
+ALL_FORMATS = [ProjectFormat.XML, ProjectFormat.Binary, ProjectFormat.SQLite]
+
+# As saved by PdfMasher before projects had fingerprints and other formats
+OLD_XML_PROJECT = """<?xml version='1.0' encoding='utf-8'?>
+<pdfmasher-project pdfpath="/foo/bar.pdf"><page width="612" height="792" /><page width="612.0" \
+height="792.0" /><element page="0" order="0" rect="72.0 700.5 200.25 14.0" fontsize="14.0" \
+text="A &quot;title&quot;&#10;&amp; more" state="title" title_level="2" /><element page="1" \
+order="1" rect="72.0 100.0 400.0 50.0" fontsize="10.0" text="body" state="normal" \
+title_level="1" /><element page="1" order="0" rect="72.0 20.0 10.0 10.0" fontsize="8.0" text="2" \
+state="ignored" title_level="1" /></pdfmasher-project>"""
+
+def project_contents():
+    pages = [Page(612, 792), Page(612, 792), Page(595.5, 842)]
+    pages[0].fingerprint = 'abc'
+    pages[1].blank = True
+    pages[2].extracted = False
+    store = ElementStore()
+    specs = [
+        (0, 0, (72, 700.5, 200.25, 14), 14, 'A "title"\n& <more>', ElementState.Title, 2),
+        (0, 1, (72, 100, 400, 50), 10, 'caf\xe9 ✓\ttab', ElementState.Normal, 1),
+        (0, 2, (72, 20, 10, 10), 8, '1', ElementState.Ignored, 1),
+        (1, 0, (72, 20, 10, 10), 8, 'footnote', ElementState.Footnote, 1),
+        (0, 3, (72, 20, 10, 10), 8, '1', ElementState.ToFix, 1),
+    ]
+    for pageno, order, rect, fontsize, text, state, title_level in specs:
+        elem = TextElement(Rect(*rect), fontsize, text)
+        elem.page = pageno
+        elem.order = order
+        elem.state = state
+        elem.title_level = title_level
+        store.append(elem)
+    return '/foo/bar.pdf', pages, store
+
+def element_attrs(store):
+    return [(e.page, e.order, tuple(e.rect), e.fontsize, e.text, e.state, e.title_level)
+        for e in store]
+
+def page_attrs(pages, project_format):
+    if project_format == ProjectFormat.XML:
+        # Blank pages and duplicates aren't saved in XML projects
+        return [(p.width, p.height, p.extracted, p.fingerprint) for p in pages]
+    return [(p.width, p.height, p.extracted, p.blank, p.duplicate_of, p.fingerprint)
+        for p in pages]
+
+def check_round_trip(path, project_format):
+    pdfpath, pages, store = project_contents()
+    save_project(path, pdfpath, pages, list(store), project_format)
+    eq_(detect_project_format(path), project_format)
+    loaded_pdfpath, loaded_pages, loaded_store = load_project(path)
+    eq_(loaded_pdfpath, pdfpath)
+    eq_(page_attrs(loaded_pages, project_format), page_attrs(pages, project_format))
+    eq_(element_attrs(loaded_store), element_attrs(store))
+
+#---
+def test_xml_round_trip(tmpdir):
+    check_round_trip(str(tmpdir.join('foo.masherproj')), ProjectFormat.XML)
+
+def test_binary_round_trip(tmpdir):
+    check_round_trip(str(tmpdir.join('foo.masherproj')), ProjectFormat.Binary)
+
+def test_sqlite_round_trip(tmpdir):
+    check_round_trip(str(tmpdir.join('foo.masherproj')), ProjectFormat.SQLite)
+
+def test_binary_keeps_text_table(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    pdfpath, pages, store = project_contents()
+    save_project(path, pdfpath, pages, list(store), ProjectFormat.Binary)
+    _, _, loaded_store = load_project(path)
+    eq_(len(loaded_store.texts), len(store.texts))
+    eq_(loaded_store.texts.count('1'), 2)
+
+def test_binary_saves_elements_in_the_given_order(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    pdfpath, pages, store = project_contents()
+    elements = list(reversed(store))
+    save_project(path, pdfpath, pages, elements, ProjectFormat.Binary)
+    _, _, loaded_store = load_project(path)
+    eq_(element_attrs(loaded_store), element_attrs(elements))
+
+def test_conversions_between_all_formats(tmpdir):
+    pdfpath, pages, store = project_contents()
+    source = str(tmpdir.join('source'))
+    save_project(source, pdfpath, pages, list(store), ProjectFormat.XML)
+    for project_format in [ProjectFormat.Binary, ProjectFormat.SQLite, ProjectFormat.XML]:
+        dest = str(tmpdir.join(project_format))
+        convert_project(source, dest, project_format)
+        eq_(detect_project_format(dest), project_format)
+        _, _, loaded_store = load_project(dest)
+        eq_(element_attrs(loaded_store), element_attrs(store))
+        source = dest
+
+def test_load_old_xml_project(tmpdir):
+    path = str(tmpdir.join('old.masherproj'))
+    with open(path, 'wt', encoding='utf-8') as fp:
+        fp.write(OLD_XML_PROJECT)
+    eq_(detect_project_format(path), ProjectFormat.XML)
+    pdfpath, pages, store = load_project(path)
+    eq_(pdfpath, '/foo/bar.pdf')
+    eq_([(p.width, p.height, p.extracted, p.fingerprint) for p in pages],
+        [(612, 792, True, None)] * 2)
+    eq_(element_attrs(store), [
+        (0, 0, (72, 700.5, 200.25, 14), 14, 'A "title"\n& more', ElementState.Title, 2),
+        (1, 1, (72, 100, 400, 50), 10, 'body', ElementState.Normal, 1),
+        (1, 0, (72, 20, 10, 10), 8, '2', ElementState.Ignored, 1),
+    ])
+
+def test_old_xml_project_converts_to_all_formats(tmpdir):
+    path = str(tmpdir.join('old.masherproj'))
+    with open(path, 'wt', encoding='utf-8') as fp:
+        fp.write(OLD_XML_PROJECT)
+    _, _, store = load_project(path)
+    for project_format in ALL_FORMATS:
+        dest = str(tmpdir.join(project_format))
+        convert_project(path, dest, project_format)
+        _, _, loaded_store = load_project(dest)
+        eq_(element_attrs(loaded_store), element_attrs(store))
+
+def test_save_replaces_existing_project(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    pdfpath, pages, store = project_contents()
+    smaller_store = ElementStore()
+    smaller_store.extend(list(store)[:2])
+    for project_format in ALL_FORMATS + ALL_FORMATS:
+        save_project(path, pdfpath, pages, list(smaller_store), project_format)
+        _, _, loaded_store = load_project(path)
+        eq_(element_attrs(loaded_store), element_attrs(smaller_store))
+    # No temporary file is left behind
+    eq_(tmpdir.listdir(), [tmpdir.join('foo.masherproj')])
+
+def test_failed_save_keeps_previous_project(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    pdfpath, pages, store = project_contents()
+    save_project(path, pdfpath, pages, list(store), ProjectFormat.Binary)
+    with raises(AttributeError):
+        # Elements without a rect can't be saved
+        save_project(path, pdfpath, pages, list(store) + [object()], ProjectFormat.XML)
+    eq_(detect_project_format(path), ProjectFormat.Binary)
+    _, _, loaded_store = load_project(path)
+    eq_(element_attrs(loaded_store), element_attrs(store))
+    eq_(tmpdir.listdir(), [tmpdir.join('foo.masherproj')])
+
+def test_empty_project(tmpdir):
+    for project_format in ALL_FORMATS:
+        path = str(tmpdir.join(project_format))
+        save_project(path, '/foo/bar.pdf', [], [], project_format)
+        pdfpath, pages, store = load_project(path)
+        eq_((pdfpath, pages, len(store)), ('/foo/bar.pdf', [], 0))
+
+def test_load_truncated_binary_project(tmpdir):
+    path = str(tmpdir.join('foo.masherproj'))
+    pdfpath, pages, store = project_contents()
+    save_project(path, pdfpath, pages, list(store), ProjectFormat.Binary)
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    with open(path, 'wb') as fp:
+        fp.write(data[:len(data) // 2])
+    with raises(InvalidProjectError):
+        load_project(path)
+
+def test_load_sqlite_database_that_isnt_a_project(tmpdir):
+    path = str(tmpdir.join('foo.db'))
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE foo (bar TEXT)")
+    con.commit()
+    con.close()
+    eq_(detect_project_format(path), ProjectFormat.SQLite)
+    with raises(sqlite3.DatabaseError):
+        load_project(path)
+    # Our tables weren't added to it
+    con = sqlite3.connect(path)
+    eq_([row[0] for row in con.execute("SELECT name FROM sqlite_master")], ['foo'])
+    con.close()
+
+def test_load_binary_project_with_invalid_indexes(tmpdir):
+    # Values used as indexes are checked when loading rather than failing when they're used.
+    path = str(tmpdir.join('foo.masherproj'))
+    for attrname, value in [('state', 42), ('text_id', 1000), ('page', 3), ('page', -1)]:
+        pdfpath, pages, store = project_contents()
+        getattr(store, attrname)[1] = value
+        save_project(path, pdfpath, pages, list(store), ProjectFormat.Binary)
+        with raises(InvalidProjectError):
+            load_project(path)
+
+def test_xml_is_the_default_format(tmpdir):
+    # Like in the app
+    path = str(tmpdir.join('foo.masherproj'))
+    pdfpath, pages, store = project_contents()
+    save_project(path, pdfpath, pages, list(store))
+    eq_(detect_project_format(path), ProjectFormat.XML)
+
+def test_converter_requires_a_format(tmpdir):
+    source = str(tmpdir.join('source'))
+    dest = str(tmpdir.join('dest'))
+    pdfpath, pages, store = project_contents()
+    save_project(source, pdfpath, pages, list(store), ProjectFormat.XML)
+    with raises(SystemExit):
+        main([source, dest])
+    assert not tmpdir.join('dest').check()
+    eq_(main(['--sqlite', source, dest]), 0)
+    eq_(detect_project_format(dest), ProjectFormat.SQLite)
@@ -0,0 +1,154 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import Page, TextElement
+from ..store import ElementStore
+from ..refresh import map_unchanged_pages, carry_over, rebuild_document
+
+def create_pages(fingerprints):
+    result = []
+    for fingerprint in fingerprints:
+        page = Page(612, 792)
+        page.fingerprint = fingerprint
+        result.append(page)
+    return result
+
+def create_elements(pageno, specs):
+    # ``specs`` is a list of (text, x, y). Elements are ordered as given.
+    result = []
+    for order, (text, x, y) in enumerate(specs):
+        elem = TextElement(Rect(x, y, 200, 20), 12, text)
+        elem.page = pageno
+        elem.order = order
+        result.append(elem)
+    return result
+
+def old_document():
+    # Three pages, classified and edited
+    pages = create_pages(['a', 'b', 'c'])
+    specs = [
+        [('Chapter', 50, 700), ('body a', 50, 600)],
+        [('header', 50, 750), ('body b', 50, 600), ('folio', 300, 20)],
+        [('body c', 50, 600), ('footnote', 50, 100)],
+    ]
+    store = ElementStore()
+    for pageno, page_specs in enumerate(specs):
+        store.extend(create_elements(pageno, page_specs))
+    elements = list(store)
+    elements[0].state = ElementState.Title
+    elements[0].title_level = 2
+    elements[1].text = 'body a, fixed'
+    elements[2].state = ElementState.Ignored
+    elements[3].state = ElementState.ToFix
+    elements[4].state = ElementState.Ignored
+    elements[6].state = ElementState.Footnote
+    # Page 1 was reordered by hand
+    elements[3].order, elements[2].order = 0, 1
+    return pages, elements
+
+def attrs(elements):
+    return [(e.page, e.order, e.text, e.state, e.title_level) for e in elements]
+
+#--- map_unchanged_pages
+def test_map_unchanged_pages():
+    old_pages = create_pages(['a', 'b', 'c', None])
+    eq_(map_unchanged_pages(old_pages, ['a', 'x', 'b', 'c']), {0: 0, 2: 1, 3: 2})
+
+def test_placeholders_are_never_mapped():
+    old_pages = create_pages(['a', 'b'])
+    old_pages[1].extracted = False
+    eq_(map_unchanged_pages(old_pages, ['a', 'b']), {0: 0})
+
+def test_repeated_pages_are_mapped_once():
+    old_pages = create_pages(['blank', 'a', 'blank'])
+    eq_(map_unchanged_pages(old_pages, ['blank', 'blank', 'blank']), {0: 0, 1: 2})
+    # The page with the same number is preferred
+    eq_(map_unchanged_pages(old_pages, ['x', 'x', 'blank']), {2: 2})
+
+#--- carry_over
+def test_carry_over_matches_text_then_position():
+    old = create_elements(0, [('title', 50, 700), ('typo', 50, 600), ('gone', 50, 100)])
+    old[0].state = ElementState.Title
+    old[0].title_level = 3
+    old[1].state = ElementState.ToFix
+    old[2].state = ElementState.Ignored
+    # The typo was fixed in the PDF and the title moved a bit
+    new = create_elements(0, [('new', 50, 400), ('fixed', 51, 601), ('title', 60, 690)])
+    eq_(carry_over(old, new), 2)
+    eq_([(e.text, e.state, e.title_level, e.order) for e in new], [
+        ('new', ElementState.Normal, 1, 2),
+        ('fixed', ElementState.ToFix, 1, 1),
+        ('title', ElementState.Title, 3, 0),
+    ])
+
+def test_carry_over_repeated_texts_go_to_the_closest():
+    old = create_elements(0, [('*', 50, 700), ('*', 50, 100)])
+    old[1].state = ElementState.Footnote
+    new = create_elements(0, [('*', 50, 110), ('*', 50, 690)])
+    carry_over(old, new)
+    eq_([e.state for e in new], [ElementState.Footnote, ElementState.Normal])
+    eq_([e.order for e in new], [1, 0])
+
+#--- rebuild_document
+def test_unchanged_pages_are_kept_as_they_are():
+    old_pages, old_elements = old_document()
+    new_pages = create_pages(['a', 'b', 'c'])
+    page_map = map_unchanged_pages(old_pages, ['a', 'b', 'c'])
+    store, elements = rebuild_document(old_pages, old_elements, new_pages, page_map, {})
+    eq_(attrs(elements), attrs(old_elements))
+    eq_(len(store), len(old_elements))
+
+def test_changed_page_is_extracted_again():
+    old_pages, old_elements = old_document()
+    new_pages = create_pages(['a', 'b2', 'c'])
+    page_map = map_unchanged_pages(old_pages, ['a', 'b2', 'c'])
+    eq_(page_map, {0: 0, 2: 2})
+    # The body of page 1 changed. It's at the same place as the old body, so it takes its state
+    # and its place in the manual order.
+    specs = [('header', 50, 750), ('new body', 50, 600), ('folio', 300, 20)]
+    store, elements = rebuild_document(old_pages, old_elements, new_pages, page_map,
+        {1: create_elements(1, specs)})
+    eq_(attrs(elements), attrs(old_elements[:2]) + [
+        (1, 1, 'header', ElementState.Ignored, 1),
+        (1, 0, 'new body', ElementState.ToFix, 1),
+        (1, 2, 'folio', ElementState.Ignored, 1),
+    ] + attrs(old_elements[5:]))
+
+def test_inserted_page_shifts_following_pages():
+    old_pages, old_elements = old_document()
+    fingerprints = ['a', 'new', 'b', 'c']
+    new_pages = create_pages(fingerprints)
+    page_map = map_unchanged_pages(old_pages, fingerprints)
+    eq_(page_map, {0: 0, 2: 1, 3: 2})
+    # The inserted page has the number of the old page 1, but it's not the same page, so it
+    # doesn't take anything from it.
+    inserted = create_elements(1, [('header', 50, 750), ('inserted', 50, 600)])
+    store, elements = rebuild_document(old_pages, old_elements, new_pages, page_map,
+        {1: inserted})
+    shifted = [(page + 1, order, text, state, level)
+        for page, order, text, state, level in attrs(old_elements[2:])]
+    eq_(attrs(elements), attrs(old_elements[:2]) + [
+        (1, 0, 'header', ElementState.Normal, 1),
+        (1, 1, 'inserted', ElementState.Normal, 1),
+    ] + shifted)
+
+def test_removed_page_shifts_following_pages():
+    old_pages, old_elements = old_document()
+    fingerprints = ['a', 'c']
+    new_pages = create_pages(fingerprints)
+    page_map = map_unchanged_pages(old_pages, fingerprints)
+    eq_(page_map, {0: 0, 1: 2})
+    store, elements = rebuild_document(old_pages, old_elements, new_pages, page_map, {})
+    shifted = [(page - 1, order, text, state, level)
+        for page, order, text, state, level in attrs(old_elements[5:])]
+    eq_(attrs(elements), attrs(old_elements[:2]) + shifted)
+    eq_([e.page for e in store], [0, 0, 1, 1])
@@ -0,0 +1,87 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from pytest import raises
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import Page, TextElement
+from ..store import ElementStore
+from ..rules import Rule, apply_rules, load_rules, save_rules
+
+def write_rules(tmpdir, contents):
+    path = str(tmpdir.join('foo.masherrules'))
+    with open(path, 'wt', encoding='utf-8') as fp:
+        fp.write('<pdfmasher-rules>{}</pdfmasher-rules>'.format(contents))
+    return path
+
+def create_store():
+    # A big title, a body paragraph and a folio at the bottom of the page
+    store = ElementStore()
+    specs = [(700, 24, 'Title'), (400, 10, 'Some body text'), (20, 8, '12')]
+    for y, fontsize, text in specs:
+        elem = TextElement(Rect(50, y, 400, fontsize), fontsize, text)
+        elem.page = 0
+        store.append(elem)
+    return store
+
+#--- Rule
+def test_invalid_title_level():
+    for title_level in [0, 7, 200]:
+        with raises(ValueError):
+            Rule(ElementState.Title, title_level)
+
+def test_invalid_state():
+    with raises(ValueError):
+        Rule('foo')
+
+#--- apply_rules
+def test_first_matching_rule_wins():
+    store = create_store()
+    rules = [
+        Rule(ElementState.Title, 2, min_fontsize_percentile=60),
+        Rule(ElementState.Ignored, min_position=0.9),
+        Rule(ElementState.Footnote, max_length=2),
+    ]
+    eq_(apply_rules(rules, store, [Page(612, 792)]), [0, 2])
+    eq_([e.state for e in store], [ElementState.Title, ElementState.Normal, ElementState.Ignored])
+    eq_(store[0].title_level, 2)
+
+def test_only_normal_elements_are_touched():
+    store = create_store()
+    store[0].state = ElementState.ToFix
+    eq_(apply_rules([Rule(ElementState.Ignored)], store, [Page(612, 792)]), [1, 2])
+    eq_(store[0].state, ElementState.ToFix)
+
+#--- Rule files
+def test_save_and_load(tmpdir):
+    path = str(tmpdir.join('foo.masherrules'))
+    rules = [
+        Rule(ElementState.Title, 3, min_fontsize_percentile=98.5, max_length=80),
+        Rule(ElementState.Ignored, max_position=0.05, parity='even', pattern=r'^\d+$'),
+    ]
+    save_rules(rules, path)
+    eq_([repr(rule) for rule in load_rules(path)], [repr(rule) for rule in rules])
+    eq_(load_rules(path)[0].title_level, 3)
+
+def test_load_invalid_title_level(tmpdir):
+    path = write_rules(tmpdir, '<rule state="title" title_level="200" />')
+    with raises(ValueError):
+        load_rules(path)
+
+def test_load_unknown_attribute(tmpdir):
+    path = write_rules(tmpdir, '<rule state="ignored" max_postion="0.05" />')
+    with raises(ValueError):
+        load_rules(path)
+
+def test_load_rule_without_state(tmpdir):
+    path = write_rules(tmpdir, '<rule max_position="0.05" />')
+    with raises(ValueError):
+        load_rules(path)
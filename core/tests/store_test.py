@@ -0,0 +1,169 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from pytest import raises
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import TextElement
+from ..store import ElementStore, ElementView
+
+def text_element(text, page=0, rect=(10, 20, 30, 5), fontsize=12, order=0,
+        state=ElementState.Normal, title_level=1):
+    result = TextElement(Rect(*rect), fontsize, text)
+    result.page = page
+    result.order = order
+    result.state = state
+    result.title_level = title_level
+    return result
+
+def attrs(elem):
+    return (elem.page, elem.order, tuple(elem.rect), elem.x, elem.y, elem.fontsize, elem.text,
+        elem.state, elem.title_level, elem.modified_text)
+
+#--- ElementStore
+def test_append_copies_all_attributes():
+    store = ElementStore()
+    elem = text_element('foo', page=2, rect=(1.5, 2.5, 3, 4), fontsize=9.5, order=3,
+        state=ElementState.Title, title_level=2)
+    view = store.append(elem)
+    eq_(attrs(view), attrs(elem))
+    eq_(len(store), 1)
+
+def test_view_y_is_the_top_of_the_element():
+    # Like TextElement.y, even if the store keeps pdfminer's bottom y
+    store = ElementStore()
+    view = store.append(text_element('foo', rect=(10, 20, 30, 5)))
+    eq_(view.y, 25)
+    eq_(store.y[view.index], 20)
+
+def test_extend_returns_views_in_order():
+    store = ElementStore()
+    elements = [text_element(text, order=order) for order, text in enumerate('abc')]
+    views = store.extend(elements)
+    eq_([v.index for v in views], [0, 1, 2])
+    eq_([attrs(v) for v in store], [attrs(e) for e in elements])
+
+def test_getitem_out_of_bounds():
+    store = ElementStore()
+    store.append(text_element('foo'))
+    with raises(IndexError):
+        store[1]
+    with raises(IndexError):
+        store[-1]
+
+def test_copy_is_independent():
+    store = ElementStore()
+    store.extend([text_element('foo'), text_element('bar')])
+    copied = store.copy()
+    store[0].state = ElementState.Ignored
+    store[1].text = 'baz'
+    eq_(copied[0].state, ElementState.Normal)
+    eq_(copied[1].text, 'bar')
+    eq_(len(copied), 2)
+
+#--- ElementView
+def test_setters_write_to_the_store():
+    store = ElementStore()
+    view = store.append(text_element('foo'))
+    view.state = ElementState.Footnote
+    view.title_level = 4
+    view.order = 12
+    view.text = 'bar'
+    view.modified_text = 'modified'
+    other = store[0]
+    eq_((other.state, other.title_level, other.order, other.text, other.modified_text),
+        (ElementState.Footnote, 4, 12, 'bar', 'modified'))
+    view.modified_text = None
+    eq_(other.modified_text, None)
+
+def test_views_on_the_same_element_are_equal():
+    store = ElementStore()
+    store.extend([text_element('foo'), text_element('foo')])
+    eq_(store[0], store[0])
+    eq_(hash(store[0]), hash(store[0]))
+    assert store[0] != store[1]
+    eq_(len({store[0], store[0], store[1]}), 2)
+
+def test_views_on_different_stores_are_different():
+    store1 = ElementStore()
+    store2 = ElementStore()
+    store1.append(text_element('foo'))
+    store2.append(text_element('foo'))
+    assert store1[0] != store2[0]
+
+def test_view_is_slotted():
+    # Views are created by the hundreds of thousands. They can't have a __dict__.
+    view = ElementView(ElementStore(), 0)
+    with raises(AttributeError):
+        view.foo = 'bar'
+
+#--- Text interning
+def test_repeated_texts_are_stored_once():
+    store = ElementStore()
+    store.extend([text_element('header', page=pageno) for pageno in range(3)])
+    store.append(text_element('body'))
+    eq_(len(store.texts), 2)
+    eq_(store.text_id[0], store.text_id[2])
+    eq_(store.texts.count('header'), 3)
+    eq_(store.texts.count('body'), 1)
+    eq_(store.texts.count('nope'), 0)
+
+def test_set_text_updates_counts():
+    store = ElementStore()
+    store.extend([text_element('foo'), text_element('foo')])
+    store[0].text = 'bar'
+    eq_(store.texts.count('foo'), 1)
+    eq_(store.texts.count('bar'), 1)
+    store[1].text = 'bar'
+    eq_(store.texts.count('foo'), 0)
+    eq_(store.texts.count('bar'), 2)
+    # The replaced text stays in the table until compact()
+    eq_(len(store.texts), 2)
+
+def test_compact_drops_replaced_texts():
+    store = ElementStore()
+    store.extend([text_element('foo'), text_element('bar'), text_element('foo')])
+    store[1].text = 'baz'
+    store[1].text = 'foo'
+    eq_(len(store.texts), 3)
+    store.compact()
+    eq_(len(store.texts), 1)
+    eq_([elem.text for elem in store], ['foo', 'foo', 'foo'])
+    eq_(store.texts.count('foo'), 3)
+    eq_(list(store.texts.counts), [3])
+
+def test_copy_keeps_text_table():
+    store = ElementStore()
+    store.extend([text_element('foo'), text_element('foo')])
+    copied = store.copy()
+    copied[0].text = 'bar'
+    eq_(store.texts.count('foo'), 2)
+    eq_(copied.texts.count('foo'), 1)
+    eq_(store.texts.count('bar'), 0)
+
+def test_text_page_counts():
+    store = ElementStore()
+    store.extend([
+        text_element('header', page=0),
+        text_element('header', page=0),
+        text_element('header', page=1),
+        text_element('body', page=1),
+    ])
+    counts = store.text_page_counts()
+    eq_(counts[store.text_id[0]], 2)
+    eq_(counts[store.text_id[3]], 1)
+
+def test_indexes_of_repeated_texts():
+    store = ElementStore()
+    for pageno in range(3):
+        store.extend([text_element('header', page=pageno), text_element(str(pageno), page=pageno)])
+    eq_(store.indexes_of_repeated_texts(2), [0, 2, 4])
+    eq_(store.indexes_of_repeated_texts(3), [])
@@ -0,0 +1,155 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-15
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+from hscommon.geometry import Rect
+from hscommon.testutil import eq_
+
+from ..const import ElementState
+from ..pdf import TextElement
+from ..store import ElementStore, STATE2CODE
+from ..undo import ElementDelta, UndoHistory
+
+def create_store(count=4):
+    store = ElementStore()
+    for index in range(count):
+        elem = TextElement(Rect(0, index * 10, 10, 5), 12, 'text{}'.format(index))
+        elem.page = 0
+        elem.order = index
+        store.append(elem)
+    return store
+
+def elem_values(store):
+    return [(e.state, e.title_level, e.order, e.text) for e in store]
+
+def change_state(store, indexes, state):
+    delta = ElementDelta(store, indexes, ['state', 'title_level'])
+    for index in indexes:
+        store[index].state = state
+    delta.finish()
+    return delta
+
+#--- ElementDelta
+def test_delta_undo_and_redo():
+    store = create_store()
+    before = elem_values(store)
+    delta = ElementDelta(store, [0, 2], ['state', 'order', 'text'])
+    store[0].state = ElementState.Title
+    store[2].order = 42
+    store[2].text = 'changed'
+    delta.finish()
+    after = elem_values(store)
+    delta.undo()
+    eq_(elem_values(store), before)
+    delta.redo()
+    eq_(elem_values(store), after)
+
+def test_delta_old_and_new_values():
+    store = create_store()
+    delta = change_state(store, [1], ElementState.Footnote)
+    eq_(list(delta.old_values('state')), [STATE2CODE[ElementState.Normal]])
+    eq_(list(delta.new_values('state')), [STATE2CODE[ElementState.Footnote]])
+
+def test_finish_drops_unchanged_elements():
+    store = create_store()
+    store[1].state = ElementState.Ignored
+    delta = change_state(store, [0, 1, 2], ElementState.Ignored)
+    eq_(list(delta.indexes), [0, 2])
+    eq_(len(delta.old_values('state')), 2)
+    delta.undo()
+    eq_(store[1].state, ElementState.Ignored)
+    eq_(store[0].state, ElementState.Normal)
+
+def test_text_size_counts_in_delta_size():
+    store = create_store()
+    small = ElementDelta(store, [0], ['text'])
+    store[0].text = 'a'
+    small.finish()
+    big = ElementDelta(store, [1], ['text'])
+    store[1].text = 'a' * 1000
+    big.finish()
+    assert big.size >= small.size + 900
+
+#--- UndoHistory
+def test_undo_redo_sequence():
+    store = create_store()
+    history = UndoHistory()
+    snapshots = [elem_values(store)]
+    history.add(change_state(store, [0, 1], ElementState.Title))
+    snapshots.append(elem_values(store))
+    delta = ElementDelta(store, [1], ['text'])
+    store[1].text = 'new text'
+    delta.finish()
+    history.add(delta)
+    snapshots.append(elem_values(store))
+    delta = ElementDelta(store, range(4), ['order'])
+    for order, index in enumerate(reversed(range(4))):
+        store[index].order = order
+    delta.finish()
+    history.add(delta)
+    snapshots.append(elem_values(store))
+    for snapshot in reversed(snapshots[:-1]):
+        assert history.undo() is not None
+        eq_(elem_values(store), snapshot)
+    assert not history.can_undo
+    eq_(history.undo(), None)
+    for snapshot in snapshots[1:]:
+        assert history.redo() is not None
+        eq_(elem_values(store), snapshot)
+    assert not history.can_redo
+    eq_(history.redo(), None)
+
+def test_new_change_clears_redo():
+    store = create_store()
+    history = UndoHistory()
+    history.add(change_state(store, [0], ElementState.Title))
+    history.undo()
+    assert history.can_redo
+    delta = change_state(store, [1], ElementState.Ignored)
+    history.add(delta)
+    assert not history.can_redo
+    eq_(history.size, delta.size)
+
+def test_empty_delta_is_ignored():
+    store = create_store()
+    history = UndoHistory()
+    history.add(change_state(store, [0], ElementState.Normal))
+    assert not history.can_undo
+    eq_(history.size, 0)
+
+def test_budget_drops_oldest_changes():
+    store = create_store()
+    first = change_state(store, [0], ElementState.Title)
+    history = UndoHistory(budget=first.size * 2)
+    history.add(first)
+    history.add(change_state(store, [1], ElementState.Title))
+    history.add(change_state(store, [2], ElementState.Title))
+    assert history.size <= history.budget
+    history.undo()
+    history.undo()
+    assert not history.can_undo
+    # The first change couldn't be undone anymore
+    eq_([e.state for e in store][:3], [ElementState.Title, ElementState.Normal,
+        ElementState.Normal])
+
+def test_delta_bigger_than_budget_cant_be_undone():
+    store = create_store()
+    history = UndoHistory(budget=10)
+    history.add(change_state(store, [0, 1, 2, 3], ElementState.Ignored))
+    assert not history.can_undo
+    eq_(history.size, 0)
+
+def test_clear():
+    store = create_store()
+    history = UndoHistory()
+    history.add(change_state(store, [0], ElementState.Title))
+    history.add(change_state(store, [1], ElementState.Title))
+    history.undo()
+    history.clear()
+    assert not history.can_undo
+    assert not history.can_redo
+    eq_(history.size, 0)
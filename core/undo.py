@@ -0,0 +1,178 @@
+# Created By: Virgil Dupras
+# Created On: 2013-11-14
+# Copyright 2013 Hardcoded Software (http://www.hardcoded.net)
+#
+# This software is licensed under the "GPL v3" License as described in the "LICENSE" file,
+# which should be included with this package. The terms are also available at
+# http://www.hardcoded.net/licenses/gplv3_license
+
+"""Undo and redo of changes to elements.
+
+Snapshotting a document with hundreds of thousands of elements for each change is out of the
+question. Instead, each change is kept as an :class:`ElementDelta`: the indexes of the elements it
+touched in their :class:`core.store.ElementStore`, along with the values they had before and after
+the change, for the columns it touched. Numeric values are kept in typed arrays.
+"""
+
+from array import array
+from collections import deque
+
+# Default memory budget, in bytes, of an UndoHistory
+UNDO_BUDGET = 8 * 1024 * 1024
+# Rough size, in bytes, of a delta without its values
+DELTA_OVERHEAD = 200
+
+class ElementDelta:
+    """Values of ``columns`` of the elements at ``indexes`` of ``store``, before and after a change.
+
+    Old values are read when the delta is created, which has to be before the change. ``columns``
+    are names of store columns (``state``, ``title_level``, ``order``) or ``text``. Call
+    :meth:`finish` once the change has been made.
+    """
+    def __init__(self, store, indexes, columns):
+        self.store = store
+        self.indexes = array('l', indexes)
+        self.columns = columns
+        self._old = self._read_values()
+        self._new = None
+
+    #--- Private
+    def _read_values(self):
+        store = self.store
+        result = {}
+        for column_name in self.columns:
+            if column_name == 'text':
+                result[column_name] = [store.get_text(index) for index in self.indexes]
+            else:
+                column = getattr(store, column_name)
+                result[column_name] = array(column.typecode,
+                    (column[index] for index in self.indexes))
+        return result
+
+    def _write_values(self, values):
+        store = self.store
+        for column_name in self.columns:
+            if column_name == 'text':
+                for index, text in zip(self.indexes, values[column_name]):
+                    store.set_text(index, text)
+            else:
+                column = getattr(store, column_name)
+                for index, value in zip(self.indexes, values[column_name]):
+                    column[index] = value
+
+    #--- Public
+    def finish(self):
+        """Reads new values. Elements that didn't change are dropped from the delta.
+        """
+        self._new = self._read_values()
+        old = self._old
+        new = self._new
+        changed = [
+            i for i in range(len(self.indexes))
+            if any(old[column_name][i] != new[column_name][i] for column_name in self.columns)
+        ]
+        if len(changed) < len(self.indexes):
+            self.indexes = array('l', (self.indexes[i] for i in changed))
+            for values in [old, new]:
+                for column_name, column in values.items():
+                    if column_name == 'text':
+                        values[column_name] = [column[i] for i in changed]
+                    else:
+                        values[column_name] = array(column.typecode, (column[i] for i in changed))
+
+    def old_values(self, column_name):
+        return self._old[column_name]
+
+    def new_values(self, column_name):
+        return self._new[column_name]
+
+    def undo(self):
+        self._write_values(self._old)
+
+    def redo(self):
+        self._write_values(self._new)
+
+    @property
+    def size(self):
+        # Approximate memory used by the delta, in bytes
+        result = DELTA_OVERHEAD + self.indexes.itemsize * len(self.indexes)
+        for values in [self._old, self._new]:
+            for column_name, column in values.items():
+                if column_name == 'text':
+                    result += sum(len(text) for text in column)
+                else:
+                    result += column.itemsize * len(column)
+        return result
+
+
+class UndoHistory:
+    """Undo and redo stacks of :class:`ElementDelta`.
+
+    Deltas are dropped, oldest first, to keep the memory used by both stacks under ``budget``
+    bytes. A delta that doesn't fit in the budget by itself can't be undone.
+    """
+    def __init__(self, budget=UNDO_BUDGET):
+        self.budget = budget
+        self._undo_stack = deque()
+        self._redo_stack = []
+        self._size = 0
+
+    #--- Private
+    def _trim(self):
+        while self._size > self.budget and self._undo_stack:
+            self._size -= self._undo_stack.popleft().size
+        while self._size > self.budget and self._redo_stack:
+            # The oldest redo is at the bottom of the stack
+            self._size -= self._redo_stack.pop(0).size
+
+    #--- Public
+    def clear(self):
+        self._undo_stack.clear()
+        self._redo_stack = []
+        self._size = 0
+
+    def add(self, delta):
+        """Adds a finished ``delta`` to the undo stack and clears the redo stack.
+
+        Deltas without elements are ignored.
+        """
+        if not delta.indexes:
+            return
+        self._size -= sum(d.size for d in self._redo_stack)
+        self._redo_stack = []
+        self._undo_stack.append(delta)
+        self._size += delta.size
+        self._trim()
+
+    def undo(self):
+        """Undoes the last change and returns its delta, or ``None`` if there's nothing to undo.
+        """
+        if not self._undo_stack:
+            return None
+        delta = self._undo_stack.pop()
+        delta.undo()
+        self._redo_stack.append(delta)
+        return delta
+
+    def redo(self):
+        """Redoes the last undone change and returns its delta, or ``None`` if there's nothing to
+        redo.
+        """
+        if not self._redo_stack:
+            return None
+        delta = self._redo_stack.pop()
+        delta.redo()
+        self._undo_stack.append(delta)
+        return delta
+
+    @property
+    def can_undo(self):
+        return bool(self._undo_stack)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo_stack)
+
+    @property
+    def size(self):
+        return self._size
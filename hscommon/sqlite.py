@@ -70,7 +70,15 @@ class _ActualThread(threading.Thread):
     def execute(self, sql, values=()):
         if not self._run:
             return None # Connection closed
-        result = self._query((sql, values))
+        result = self._query((sql, values, False))
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def executemany(self, sql, values_list):
+        if not self._run:
+            return None # Connection closed
+        result = self._query((sql, values_list, True))
         if isinstance(result, Exception):
             raise result
         return result
@@ -101,9 +109,12 @@ class _ActualThread(threading.Thread):
             elif query is ROLLBACK:
                 con.rollback()
             else:
-                sql, values = query
+                sql, values, many = query
                 try:
-                    cur = con.execute(sql, values)
+                    if many:
+                        cur = con.executemany(sql, values)
+                    else:
+                        cur = con.execute(sql, values)
                     self.lastrowid = cur.lastrowid
                     result = FakeCursor(cur.fetchall())
                     result.lastrowid = cur.lastrowid
@@ -136,6 +147,12 @@ class ThreadedConn:
         self.lastrowid = self._t.lastrowid
         return result
     
+    def executemany(self, sql, values_list):
+        """Executes ``sql`` once for each item of ``values_list``, in a single round-trip to our
+        thread.
+        """
+        return self._t.executemany(sql, list(values_list))
+    
     def rollback(self):
         self._t.rollback()
     
@@ -72,6 +72,15 @@ def test_query_palceholders():
     eq_(1, len(result))
     eq_('baz', result[0][0])
 
+def test_executemany():
+    con = ThreadedConn(':memory:', True)
+    con.execute('create table foo(bar TEXT)')
+    con.executemany('insert into foo(bar) values(?)', (['baz{}'.format(i)] for i in range(3)))
+    result = con.execute('select bar from foo order by bar')
+    eq_(['baz0', 'baz1', 'baz2'], [row[0] for row in result])
+    with raises(sqlite.OperationalError):
+        con.executemany('insert into bleh(bar) values(?)', [['baz']])
+
 def test_make_sure_theres_no_messup_between_queries():
     def run(expected_rowid):
         time.sleep(0.1)
@@ -8,7 +8,7 @@
 
 import os.path as op
 
-from PyQt4.QtCore import SIGNAL, QUrl, QCoreApplication, QProcess
+from PyQt4.QtCore import SIGNAL, QUrl, QCoreApplication, QProcess, QTimer
 from PyQt4.QtGui import QDesktopServices, QMessageBox, QFileDialog
 
 from hscommon.trans import tr
@@ -40,6 +40,10 @@ class PdfMasher(ApplicationBase):
         self.connect(self, SIGNAL('applicationFinishedLaunching()'), self.applicationFinishedLaunching)
         self.connect(QCoreApplication.instance(), SIGNAL('aboutToQuit()'), self.applicationWillTerminate)
         self._progress.finished.connect(self.jobFinished)
+        # Pages read in the background are integrated in the model on each pulse.
+        self._pulseTimer = QTimer(self)
+        self._pulseTimer.timeout.connect(self.model.pulse)
+        self._pulseTimer.start(500)
     
     #--- Public
     def askForRegCode(self):
@@ -67,6 +71,7 @@ class PdfMasher(ApplicationBase):
     
     def applicationWillTerminate(self):
         self.prefs.save()
+        self.model.close()
     
     def jobFinished(self, jobid):
         self.model._job_completed(jobid)
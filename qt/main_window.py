@@ -31,28 +31,53 @@ class MainWindow(QMainWindow):
     def _setupActions(self):
         ACTIONS = [
             ('actionLoadPDF', 'Ctrl+O', '', tr("Load PDF"), self.app.model.load_pdf),
+            ('actionUndo', 'Ctrl+Z', '', tr("Undo"), self.app.model.undo),
+            ('actionRedo', 'Ctrl+Shift+Z', '', tr("Redo"), self.app.model.redo),
+            ('actionRefreshPDF', 'Ctrl+R', '', tr("Refresh PDF"), self.app.model.refresh_pdf),
+            ('actionWatchPDF', '', '', tr("Watch PDF for Changes"), self.watchPDFTriggered),
+            ('actionIgnoreHeadersAndFooters', 'Ctrl+Shift+I', '', tr("Ignore Headers and Footers"),
+                self.app.model.ignore_headers_and_footers),
+            ('actionApplyRuleFile', '', '', tr("Apply Rule File..."),
+                self.app.model.apply_rule_file),
+            ('actionOrderElements', 'Ctrl+Shift+R', '', tr("Order Elements Automatically"),
+                self.app.model.order_elements_automatically),
+            ('actionRevertAutomaticOrder', '', '', tr("Revert Automatic Order"),
+                self.app.model.revert_automatic_order),
         ]
         createActions(ACTIONS, self)
+        self.actionWatchPDF.setCheckable(True)
     
     def _setupMenu(self):
         self.menubar = QMenuBar(self)
         self.menubar.setGeometry(QRect(0, 0, 42, 22))
         self.menuFile = QMenu(self.menubar)
         self.menuFile.setTitle(tr("File"))
+        self.menuEdit = QMenu(self.menubar)
+        self.menuEdit.setTitle(tr("Edit"))
         self.menuHelp = QMenu(self.menubar)
         self.menuHelp.setTitle(tr("Help"))
         self.setMenuBar(self.menubar)
         
         self.menuFile.addAction(self.actionLoadPDF)
+        self.menuFile.addAction(self.actionRefreshPDF)
+        self.menuFile.addAction(self.actionWatchPDF)
         self.menuFile.addAction(self.app.actionLoadProject)
         self.menuFile.addAction(self.app.actionSaveProject)
         self.menuFile.addAction(self.app.actionQuit)
+        self.menuEdit.addAction(self.actionUndo)
+        self.menuEdit.addAction(self.actionRedo)
+        self.menuEdit.addSeparator()
+        self.menuEdit.addAction(self.actionIgnoreHeadersAndFooters)
+        self.menuEdit.addAction(self.actionApplyRuleFile)
+        self.menuEdit.addAction(self.actionOrderElements)
+        self.menuEdit.addAction(self.actionRevertAutomaticOrder)
         self.menuHelp.addAction(self.app.actionShowHelp)
         self.menuHelp.addAction(self.app.actionCheckForUpdate)
         self.menuHelp.addAction(self.app.actionOpenDebugLog)
         self.menuHelp.addAction(self.app.actionAbout)
         
         self.menubar.addAction(self.menuFile.menuAction())
+        self.menubar.addAction(self.menuEdit.menuAction())
         self.menubar.addAction(self.menuHelp.menuAction())
     
     def _setupUi(self):
@@ -94,3 +119,7 @@ class MainWindow(QMainWindow):
         self._setupMenu()
         moveToScreenCenter(self)
     
+    #--- Event Handlers
+    def watchPDFTriggered(self):
+        self.app.model.watch_pdf = self.actionWatchPDF.isChecked()
+    